@@ -1,19 +1,35 @@
 import os
+import sys
 import json
 import asyncio
+import threading
+import time
 import logging
 from typing import Dict, List, Optional, Any
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta
 import httpx
-import networkx as nx
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, FastAPI, HTTPException, Request, WebSocket, WebSocketDisconnect
 from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from dotenv import load_dotenv
-import requests
-from langchain_mistralai import ChatMistralAI
-from langchain.schema import HumanMessage
+
+# Shared SentrySol modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from modules.address_resolver import resolve_graph_nodes
+from modules.cache import get_cache, single_flight_async
+from modules.chat_sessions import SessionStore
+from modules.columnar_export import get_exporter
+from modules.deadline import Deadline, DeadlineExceeded, stream_until_disconnected
+from modules.metasleuth_api import SCORE_DEADLINE, score_target_and_counterparties
+from modules.resilience import UpstreamError, breaker_states, call_async
+from modules.temporal_index import (
+    auto_resolution, load_temporal_index, parse_time_bound, update_temporal_index,
+)
+from modules.transactions import Transaction, normalize_transactions
+from modules.tx_graph import GraphBuilder, graph_delta_event, parse_graph_frames
+from modules.wallet_screening import analyze_transaction_patterns, threat_level
 
 # Load environment variables
 load_dotenv()
@@ -22,24 +38,41 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize FastAPI app
-app = FastAPI(title="SentrySol Backend", version="1.0.0")
+MISTRAL_MODEL = os.getenv("MISTRAL_MODEL", "ft:mistral-medium-latest:b319469f:20250807:b80c0dce")
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", "15"))
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", "300"))
+ANALYSIS_LOCK_TIMEOUT = float(os.getenv("ANALYSIS_LOCK_TIMEOUT", "120"))
+# Helius enhanced-transactions paging: a small first page gets the graph on
+# screen quickly, later pages use the API maximum
+HELIUS_FIRST_PAGE_SIZE = int(os.getenv("HELIUS_FIRST_PAGE_SIZE", "20"))
+HELIUS_PAGE_SIZE = 100
+GRAPH_BATCH_ITEMS = int(os.getenv("GRAPH_BATCH_ITEMS", "200"))
+# Last good Helius REST response per request, served when the endpoint fails
+# or its circuit breaker is open
+HELIUS_STALE_TTL = int(os.getenv("HELIUS_STALE_TTL", "3600"))
 
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+# Mistral AI client, created on first use so langchain stays out of cold start
+_mistral_llm = None
+
+
+def get_llm():
+    global _mistral_llm
+    if _mistral_llm is None:
+        from langchain_mistralai import ChatMistralAI
+
+        _mistral_llm = ChatMistralAI(
+            model=MISTRAL_MODEL,
+            mistral_api_key=os.getenv("MISTRAL_API_KEY"),
+            temperature=0.3
+        )
+    return _mistral_llm
 
-# Initialize Mistral AI
-mistral_llm = ChatMistralAI(
-    model="ft:mistral-medium-latest:b319469f:20250807:b80c0dce",
-    mistral_api_key=os.getenv("MISTRAL_API_KEY"),
-    temperature=0.3
-)
+
+async def invoke_llm(prompt: str) -> str:
+    from langchain.schema import HumanMessage
+
+    response = await get_llm().ainvoke([HumanMessage(content=prompt)])
+    return response.content
 
 # Pydantic models
 class WalletAnalysisRequest(BaseModel):
@@ -49,6 +82,7 @@ class WalletAnalysisRequest(BaseModel):
 class ChatMessage(BaseModel):
     message: str
     address: Optional[str] = None
+    session_id: Optional[str] = None
 
 class TransactionFlow(BaseModel):
     from_address: str
@@ -63,232 +97,389 @@ HELIUS_API_KEY = os.getenv("HELIUS_API_KEY")
 CHAINABUSE_API_KEY = os.getenv("CHAINABUSE_API_KEY")
 BLOCKSEC_API_KEY = os.getenv("BLOCKSEC_API_KEY")
 
+def request_timeout(deadline: Optional[Deadline]) -> float:
+    """Timeout for one upstream call: HTTP_TIMEOUT, capped by what is left of the deadline"""
+    return deadline.timeout(HTTP_TIMEOUT) if deadline else HTTP_TIMEOUT
+
+
 class SolanaAnalyzer:
-    def __init__(self):
+    def __init__(self, session: httpx.AsyncClient):
         self.helius_url = f"https://api.helius.xyz/v0"
-        self.session = httpx.AsyncClient()
+        self.session = session
+        self.stale = get_cache("helius_rest_stale", maxsize=2000)
+
+    async def _get_json(self, endpoint: str, url: str, params: Dict,
+                        deadline: Optional[Deadline] = None, status: Optional[Dict] = None):
+        """GET a Helius REST endpoint, hedged and behind per-endpoint and
+        host-wide circuit breakers; falls back to the last good response for
+        the same request when the call fails or is refused, recording
+        {"stale": True, "stale_age"} under status[endpoint] when it does"""
+        stale_key = f"{url}?" + json.dumps({k: v for k, v in params.items() if k != "api-key"}, sort_keys=True)
+        capped = []
+
+        async def fetch():
+            timeout = request_timeout(deadline)
+            if timeout < HTTP_TIMEOUT:
+                capped.append(timeout)
+            response = await self.session.get(url, params=params, timeout=timeout)
+            if response.status_code >= 500 or response.status_code == 429:
+                raise UpstreamError(f"Helius API error: {response.status_code}")
+            return response
+
+        def is_failure(e: Exception) -> bool:
+            # The caller running out of time says nothing about Helius' health:
+            # don't let one slow or departing client open the shared breakers
+            if isinstance(e, (DeadlineExceeded, asyncio.CancelledError)):
+                return False
+            return not (capped and isinstance(e, httpx.TimeoutException))
 
-    async def get_wallet_transactions(self, address: str, limit: int = 100) -> List[Dict]:
-        """Get wallet transactions from Helius API"""
         try:
-            url = f"{self.helius_url}/addresses/{address}/transactions"
-            params = {
-                "api-key": HELIUS_API_KEY,
-                "limit": limit,
-                "before": None
-            }
-            
-            response = await self.session.get(url, params=params)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                logger.error(f"Helius API error: {response.status_code}")
-                return []
+            response = await call_async(f"helius-api:{endpoint}", fetch,
+                                        breakers=(f"helius-api:{endpoint}", "helius-api"),
+                                        is_failure=is_failure)
         except Exception as e:
-            logger.error(f"Error fetching transactions: {str(e)}")
-            return []
-
-    async def get_wallet_balance(self, address: str) -> Dict:
-        """Get wallet balance and token holdings"""
+            stale = self.stale.get(stale_key)
+            if not isinstance(stale, dict) or "fetched_at" not in stale:
+                raise
+            logger.warning(f"Helius {endpoint} failed ({str(e)}); serving last good response")
+            if status is not None:
+                status[endpoint] = {"stale": True, "stale_age": round(time.time() - stale["fetched_at"], 1)}
+            return stale["data"]
+        if response.status_code != 200:
+            raise UpstreamError(f"Helius API error: {response.status_code}")
+        data = response.json()
+        self.stale.set(stale_key, {"data": data, "fetched_at": time.time()}, HELIUS_STALE_TTL)
+        return data
+
+    async def iter_wallet_transaction_pages(self, address: str, limit: int = 100,
+                                            deadline: Optional[Deadline] = None,
+                                            status: Optional[Dict] = None,
+                                            before: Optional[str] = None):
+        """Yield pages of normalized transactions (newest first, older than the
+        `before` signature if given) until `limit` is reached or the deadline
+        passes; stale pages are recorded in `status` (see _get_json)"""
+        url = f"{self.helius_url}/addresses/{address}/transactions"
+        fetched = 0
+        page_size = min(limit, HELIUS_FIRST_PAGE_SIZE)
+        while fetched < limit:
+            params = {"api-key": HELIUS_API_KEY, "limit": min(page_size, limit - fetched)}
+            if before:
+                params["before"] = before
+            try:
+                data = await self._get_json("transactions", url, params, deadline, status)
+            except Exception as e:
+                logger.error(f"Error fetching transactions: {str(e)}")
+                return
+            page = normalize_transactions(data)
+            if not page:
+                return
+            fetched += len(page)
+            before = page[-1].signature
+            yield page
+            if len(page) < params["limit"]:
+                return
+            page_size = HELIUS_PAGE_SIZE
+
+    async def get_wallet_transactions(self, address: str, limit: int = 100) -> List[Transaction]:
+        """Get wallet transactions from Helius API, normalized once on arrival"""
+        transactions = []
+        async for page in self.iter_wallet_transaction_pages(address, limit):
+            transactions.extend(page)
+        return transactions
+
+    async def get_wallet_balance(self, address: str, deadline: Optional[Deadline] = None,
+                                 status: Optional[Dict] = None) -> Dict:
+        """Get wallet balance and token holdings (flagged "stale" when served
+        from the fallback)"""
+        status = {} if status is None else status
         try:
             url = f"{self.helius_url}/addresses/{address}/balances"
             params = {"api-key": HELIUS_API_KEY}
-            
-            response = await self.session.get(url, params=params)
-            if response.status_code == 200:
-                return response.json()
-            else:
-                return {"native_balance": 0, "tokens": []}
+
+            balance = await self._get_json("balances", url, params, deadline, status)
+            return {**balance, **status["balances"]} if "balances" in status else balance
         except Exception as e:
             logger.error(f"Error fetching balance: {str(e)}")
-            return {"native_balance": 0, "tokens": []}
+            return {"native_balance": 0, "tokens": [], "degraded": True}
 
-    async def analyze_transaction_patterns(self, transactions: List[Dict]) -> Dict:
-        """Analyze transaction patterns for suspicious activity"""
-        if not transactions:
-            return {"risk_score": 0, "patterns": [], "suspicious_activities": []}
-
-        # Analyze patterns
-        patterns = {
-            "total_transactions": len(transactions),
-            "unique_counterparts": set(),
-            "large_transactions": [],
-            "rapid_transactions": [],
-            "suspicious_timing": []
-        }
+    async def get_wallet_holdings(self, address: str, deadline: Optional[Deadline] = None) -> Dict:
+        """Every asset and token account the wallet holds (all DAS pages, run in a
+        thread); "complete" is False when the deadline or an error cut it short"""
+        from modules.helius_api import fetch_wallet_holdings
 
-        prev_time = None
-        for tx in transactions:
-            # Track unique counterparts
-            if "accounts" in tx:
-                for account in tx["accounts"]:
-                    patterns["unique_counterparts"].add(account)
-
-            # Check for large transactions (>1 SOL)
-            if "native_transfers" in tx:
-                for transfer in tx["native_transfers"]:
-                    if transfer.get("amount", 0) > 1000000000:  # 1 SOL in lamports
-                        patterns["large_transactions"].append(transfer)
-
-            # Check for rapid transactions
-            current_time = datetime.fromisoformat(tx["timestamp"].replace("Z", "+00:00"))
-            if prev_time and (prev_time - current_time).total_seconds() < 60:
-                patterns["rapid_transactions"].append(tx["signature"])
-            prev_time = current_time
-
-        patterns["unique_counterparts"] = len(patterns["unique_counterparts"])
-        
-        # Calculate risk score
-        risk_score = min(100, (
-            len(patterns["large_transactions"]) * 10 +
-            len(patterns["rapid_transactions"]) * 5 +
-            (50 if patterns["unique_counterparts"] > 100 else 0)
-        ))
+        # The worker thread outlives a cancelled await; this tells it to stop
+        cancelled = threading.Event()
+        try:
+            return await asyncio.to_thread(fetch_wallet_holdings, address, deadline, cancelled)
+        except Exception as e:
+            logger.error(f"Error enumerating holdings: {str(e)}")
+            return {"assets": [], "token_accounts": [], "complete": False}
+        finally:
+            cancelled.set()
 
-        return {
-            "risk_score": risk_score,
-            "patterns": patterns,
-            "suspicious_activities": []
-        }
+    async def analyze_transaction_patterns(self, transactions: List[Transaction]) -> Dict:
+        """Analyze transaction patterns for suspicious activity"""
+        return analyze_transaction_patterns(transactions)
 
-    async def build_transaction_graph(self, address: str, transactions: List[Dict]) -> Dict:
+    async def build_transaction_graph(self, address: str, transactions: List[Transaction]) -> Dict:
         """Build a network graph of transaction flows"""
-        G = nx.DiGraph()
-        
-        # Add center node
-        G.add_node(address, type="main", label=f"{address[:8]}...")
-        
-        transaction_flows = []
-        
-        for tx in transactions:
-            timestamp = datetime.fromisoformat(tx["timestamp"].replace("Z", "+00:00"))
-            
-            # Process native transfers
-            if "native_transfers" in tx:
-                for transfer in tx["native_transfers"]:
-                    from_addr = transfer.get("fromUserAccount", "")
-                    to_addr = transfer.get("toUserAccount", "")
-                    amount = transfer.get("amount", 0) / 1e9  # Convert lamports to SOL
-                    
-                    if from_addr and to_addr:
-                        # Add nodes if they don't exist
-                        if not G.has_node(from_addr):
-                            G.add_node(from_addr, type="external", label=f"{from_addr[:8]}...")
-                        if not G.has_node(to_addr):
-                            G.add_node(to_addr, type="external", label=f"{to_addr[:8]}...")
-                        
-                        # Add edge
-                        edge_key = f"{from_addr}-{to_addr}"
-                        if G.has_edge(from_addr, to_addr):
-                            G[from_addr][to_addr]['weight'] += amount
-                            G[from_addr][to_addr]['count'] += 1
-                        else:
-                            G.add_edge(from_addr, to_addr, weight=amount, count=1, type="transfer")
-                        
-                        # Track for flow analysis
-                        transaction_flows.append({
-                            "from_address": from_addr,
-                            "to_address": to_addr,
-                            "amount": amount,
-                            "token": "SOL",
-                            "signature": tx["signature"],
-                            "timestamp": timestamp.isoformat(),
-                            "type": "outflow" if from_addr == address else "inflow"
-                        })
-
-        # Convert graph to JSON format for frontend
-        nodes = []
-        edges = []
-        
-        for node_id, node_data in G.nodes(data=True):
-            nodes.append({
-                "id": node_id,
-                "label": node_data.get("label", node_id),
-                "type": node_data.get("type", "external"),
-                "isMain": node_id == address
-            })
-        
-        for from_node, to_node, edge_data in G.edges(data=True):
-            edges.append({
-                "from": from_node,
-                "to": to_node,
-                "weight": edge_data.get("weight", 0),
-                "count": edge_data.get("count", 1),
-                "type": edge_data.get("type", "transfer")
-            })
+        builder = GraphBuilder(address)
+        builder.add_transactions(transactions)
+        return builder.to_graph()
 
-        return {
-            "nodes": nodes,
-            "edges": edges,
-            "transaction_flows": transaction_flows,
-            "summary": {
-                "total_nodes": len(nodes),
-                "total_edges": len(edges),
-                "total_volume": sum(edge["weight"] for edge in edges)
-            }
-        }
+    async def detect_laundering(self, address: str, transaction_graph: Dict) -> Dict:
+        """Run the sparse-matrix laundering detectors off the event loop"""
+        from modules.laundering_detectors import detect_laundering_patterns
+
+        return await asyncio.to_thread(detect_laundering_patterns, transaction_graph, address)
+
+    async def match_iocs(self, address: str, transaction_graph: Dict) -> Dict:
+        """Check every graph node against the local IOC index, labelling hits in place"""
+        from modules.ioc_index import match_graph
 
-analyzer = SolanaAnalyzer()
+        try:
+            return await asyncio.to_thread(match_graph, transaction_graph, address)
+        except Exception as e:
+            logger.error(f"IOC matching error: {str(e)}")
+            return {"target_address": address, "target": None, "hits": [], "risk_score": 0}
+
+    async def index_similarity(self, address: str, transactions: List[Transaction],
+                               transaction_graph: Dict) -> bool:
+        """Add (or refresh) the wallet's counterparty/mint signatures in the similarity index"""
+        from modules.similarity_index import get_similarity_index, wallet_feature_sets
+
+        def index():
+            counterparties, mints = wallet_feature_sets(address, transactions, transaction_graph)
+            return get_similarity_index().add(address, counterparties, mints)
+
+        try:
+            return await asyncio.to_thread(index)
+        except Exception as e:
+            logger.error(f"Similarity indexing error: {str(e)}")
+            return False
 
-@app.get("/health")
+    async def index_activity(self, address: str, transactions: List[Transaction]) -> Optional[Dict]:
+        """Fold transactions into the wallet's temporal index; returns its burst/dormancy summary"""
+        def index():
+            return update_temporal_index(address, transactions).summary()
+
+        try:
+            return await asyncio.to_thread(index)
+        except Exception as e:
+            logger.error(f"Temporal index error: {str(e)}")
+            return None
+
+    async def layout_graph(self, transaction_graph: Dict, layout: Optional[bool] = None) -> Optional[Dict]:
+        """Attach precomputed node positions (graph["layout"]) for large or requested graphs"""
+        from modules.graph_layout import attach_layout
+
+        try:
+            return await asyncio.to_thread(attach_layout, transaction_graph, layout)
+        except Exception as e:
+            logger.error(f"Graph layout error: {str(e)}")
+            return None
+
+    async def assess_local_risk(self, pattern_analysis: Dict, transaction_graph: Dict,
+                                laundering: Dict, counterparty_risk: Dict) -> Dict:
+        """Score the wallet with the local CPU risk model"""
+        from modules.risk_model import extract_features, get_model
+
+        features = extract_features(pattern_analysis, transaction_graph, laundering, counterparty_risk)
+        return get_model().assess(features)
+
+
+router = APIRouter()
+
+
+def get_analyzer(request: Request) -> SolanaAnalyzer:
+    return request.app.state.analyzer
+
+
+@router.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.now().isoformat()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat(),
+        "circuit_breakers": breaker_states(),
+    }
+
+@router.get("/analyze/{address}")
+async def analyze_wallet_stream(address: str, request: Request, graph_frames: str = "json",
+                                layout: Optional[bool] = None):
+    """Stream wallet analysis results.
+
+    Graph nodes/edges are streamed as `graph_delta` events while transaction
+    pages arrive; graph_frames selects per-page JSON frames ("json"),
+    coalesced frames ("batch") and/or gzip+base64 payloads ("gzip").
+    The final graph carries server-computed node positions
+    (`transaction_graph.layout`) when layout=true, or by default once it has
+    LAYOUT_AUTO_NODES nodes; layout=false leaves layout to the client.
+    The pipeline runs under a per-request deadline and is cancelled, with its
+    in-flight upstream and LLM calls, when the client disconnects.
+    """
+    try:
+        frame_modes = parse_graph_frames(graph_frames)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    analyzer = get_analyzer(request)
+    http_client = request.app.state.http_client
+    cache = get_cache("analysis", maxsize=1000)
+    cache_key = f"analysis:{address}"
+    deadline = Deadline()
 
-@app.get("/analyze/{address}")
-async def analyze_wallet_stream(address: str):
-    """Stream wallet analysis results"""
     async def generate():
+        cached = cache.get(cache_key)
+        if cached is None:
+            # Only one worker analyses a given address; the others wait and
+            # replay its cached result
+            async with single_flight_async(cache_key, timeout=ANALYSIS_LOCK_TIMEOUT):
+                cached = cache.get(cache_key)
+                if cached is None:
+                    async for frame in run_analysis():
+                        yield frame
+                    return
+        graph = cached.get('transaction_graph')
+        if graph and layout is False and 'layout' in graph:
+            cached = {**cached, 'transaction_graph': {k: v for k, v in graph.items() if k != 'layout'}}
+        elif graph and 'layout' not in graph:
+            graph = dict(graph)
+            if await analyzer.layout_graph(graph, layout):
+                cached = {**cached, 'transaction_graph': graph}
+        yield f"data: {json.dumps(cached)}\n\n"
+        yield f"data: [DONE]\n\n"
+
+    async def run_analysis():
         try:
             # Step 1: Initialize
             yield f"data: {json.dumps({'step': 1, 'status': 'Initializing analysis...', 'progress': 10})}\n\n"
-            await asyncio.sleep(0.5)
 
-            # Step 2: Fetch transactions
+            # Step 2: Fetch transactions, streaming the graph as pages arrive
             yield f"data: {json.dumps({'step': 2, 'status': 'Fetching transaction history...', 'progress': 25})}\n\n"
-            transactions = await analyzer.get_wallet_transactions(address, limit=100)
-            await asyncio.sleep(0.5)
+            builder = GraphBuilder(address)
+            transactions = []
+            delta_seq = 0
+            # Helius responses served from the stale fallback, by endpoint
+            stale_sources = {}
+            async for page in analyzer.iter_wallet_transaction_pages(address, limit=100, deadline=deadline,
+                                                                     status=stale_sources):
+                transactions.extend(page)
+                builder.add_transactions(page)
+                if "batch" not in frame_modes or builder.pending >= GRAPH_BATCH_ITEMS:
+                    delta_seq += 1
+                    yield graph_delta_event(builder.flush_delta(), frame_modes, delta_seq)
+            if builder.pending:
+                delta_seq += 1
+                yield graph_delta_event(builder.flush_delta(), frame_modes, delta_seq)
+
+            # Temporal index: bursts at any window size and dormancy, beyond the 60s rapid check
+            temporal = await analyzer.index_activity(address, transactions)
 
             # Step 3: Fetch balance
             yield f"data: {json.dumps({'step': 3, 'status': 'Analyzing wallet balance...', 'progress': 40})}\n\n"
-            balance_data = await analyzer.get_wallet_balance(address)
-            await asyncio.sleep(0.5)
+            balance_data, holdings = await asyncio.gather(
+                analyzer.get_wallet_balance(address, deadline=deadline, status=stale_sources),
+                analyzer.get_wallet_holdings(address, deadline=deadline),
+            )
+            holdings_summary = {
+                'assets': len(holdings['assets']),
+                'token_accounts': len(holdings['token_accounts']),
+                'complete': holdings['complete'],
+            }
 
             # Step 4: Pattern analysis
             yield f"data: {json.dumps({'step': 4, 'status': 'Analyzing transaction patterns...', 'progress': 60})}\n\n"
             pattern_analysis = await analyzer.analyze_transaction_patterns(transactions)
-            await asyncio.sleep(0.5)
 
-            # Step 5: Build transaction graph
+            # Step 5: Finalize transaction graph and label its nodes
             yield f"data: {json.dumps({'step': 5, 'status': 'Building transaction flow graph...', 'progress': 80})}\n\n"
-            transaction_graph = await analyzer.build_transaction_graph(address, transactions)
-            await asyncio.sleep(0.5)
-
-            # Step 6: AI Analysis
-            yield f"data: {json.dumps({'step': 6, 'status': 'Running AI security analysis...', 'progress': 95})}\n\n"
-            
-            # Prepare data for AI analysis
-            analysis_prompt = f"""
-            Analyze this Solana wallet for security risks:
-            
-            Address: {address}
-            Transaction Count: {len(transactions)}
-            Risk Score: {pattern_analysis['risk_score']}
-            Balance: {balance_data.get('native_balance', 0)} lamports
+            transaction_graph = builder.to_graph()
+            try:
+                await deadline.run(asyncio.to_thread(resolve_graph_nodes, transaction_graph, deadline=deadline))
+            except DeadlineExceeded:
+                logger.warning(f"Node resolution for {address} cut off at the request deadline")
+            except Exception as e:
+                logger.error(f"Node resolution error: {str(e)}")
+            # Every node against the local known-bad (IOC) index
+            ioc_matches = await analyzer.match_iocs(address, transaction_graph)
+            labelled = [n for n in transaction_graph["nodes"] if "account_type" in n or "ioc" in n]
+            if labelled:
+                delta_seq += 1
+                yield graph_delta_event({
+                    "nodes": labelled,
+                    "edges": [],
+                    "summary": transaction_graph["summary"],
+                }, frame_modes, delta_seq)
+            pattern_analysis['risk_score'] = min(100, pattern_analysis['risk_score'] + ioc_matches['risk_score'])
+
+            # Laundering shapes (peel chains, smurfing, round trips, layering)
+            deadline.check("laundering detection")
+            laundering = await analyzer.detect_laundering(address, transaction_graph)
+            pattern_analysis['risk_score'] = min(100, pattern_analysis['risk_score'] + laundering['risk_score'])
+            pattern_analysis['laundering_findings'] = laundering['findings']
+
+            # Counterparty risk (bounded by a hard deadline, partial on timeout)
+            counterparty_risk = await score_target_and_counterparties(
+                address, transaction_graph, client=http_client,
+                deadline=min(SCORE_DEADLINE, deadline.remaining()),
+            )
+            yield f"data: {json.dumps({'step': 5, 'status': 'Counterparty risk scored', 'progress': 88, 'metrics': {'scored': len(counterparty_risk['scores']), 'timed_out': len(counterparty_risk['timed_out'])}})}\n\n"
+
+            # Node positions for large graphs, so the dashboard can skip its force simulation
+            await analyzer.layout_graph(transaction_graph, layout)
+
+            # Local fast-path model: the LLM only runs when it is unsure or the wallet looks risky
+            local_risk = await analyzer.assess_local_risk(pattern_analysis, transaction_graph, laundering, counterparty_risk)
+            if ioc_matches['target'] or ioc_matches['hits']:
+                # Listed counterparties are never a clear-cut low-risk case
+                local_risk['use_llm'] = True
+
+            if local_risk['use_llm']:
+                # Step 6: AI Analysis
+                yield f"data: {json.dumps({'step': 6, 'status': 'Running AI security analysis...', 'progress': 95})}\n\n"
+
+                # Prepare data for AI analysis
+                analysis_prompt = f"""
+                Analyze this Solana wallet for security risks:
             
-            Transaction Patterns:
-            - Large transactions: {len(pattern_analysis['patterns']['large_transactions'])}
-            - Rapid transactions: {len(pattern_analysis['patterns']['rapid_transactions'])}
-            - Unique counterparts: {pattern_analysis['patterns']['unique_counterparts']}
+                Address: {address}
+                Transaction Count: {len(transactions)}
+                Risk Score: {pattern_analysis['risk_score']}
+                Balance: {balance_data.get('native_balance', 0)} lamports
+                Holdings: {holdings_summary['token_accounts']} token accounts, {holdings_summary['assets']} NFTs/other assets{'' if holdings_summary['complete'] else ' (partial)'}
             
-            Provide a security assessment with threat level (LOW/MEDIUM/HIGH) and recommendations.
-            """
+                Transaction Patterns:
+                - Large transactions: {len(pattern_analysis['patterns']['large_transactions'])}
+                - Rapid transactions: {len(pattern_analysis['patterns']['rapid_transactions'])}
+                - Unique counterparts: {pattern_analysis['patterns']['unique_counterparts']}
+
+                Laundering pattern findings: {json.dumps([{k: f[k] for k in ('pattern', 'severity', 'detail', 'metrics')} for f in laundering['findings']])}
+
+                Blocksec risk (target): {json.dumps(counterparty_risk['target'])}
+                Blocksec risk (top counterparties): {json.dumps(counterparty_risk['counterparties'])}
+
+                Known-bad list matches (local IOC index): target={ioc_matches['target'] or 'not listed'}, counterparties={json.dumps(ioc_matches['hits'])}
+
+                Activity bursts (>= 10 tx in 5 min): {json.dumps((temporal or {}).get('bursts', [])[:5])}
+                Dormancy then activity (>= 30 days silent): {json.dumps((temporal or {}).get('dormancy', [])[:5])}
             
-            try:
-                ai_response = mistral_llm.invoke([HumanMessage(content=analysis_prompt)])
-                ai_analysis = ai_response.content
-            except Exception as e:
-                logger.error(f"AI analysis error: {str(e)}")
-                ai_analysis = "AI analysis unavailable. Manual review recommended."
+                Provide a security assessment with threat level (LOW/MEDIUM/HIGH) and recommendations.
+                """
+
+                try:
+                    ai_analysis = await deadline.run(invoke_llm(analysis_prompt))
+                except DeadlineExceeded:
+                    logger.warning(f"AI analysis for {address} cancelled at the request deadline")
+                    ai_analysis = "AI analysis timed out. Manual review recommended."
+                except Exception as e:
+                    logger.error(f"AI analysis error: {str(e)}")
+                    ai_analysis = "AI analysis unavailable. Manual review recommended."
+            else:
+                yield f"data: {json.dumps({'step': 6, 'status': 'Low risk confirmed by local model, skipping AI analysis', 'progress': 95})}\n\n"
+                ai_analysis = (
+                    f"Local risk model v{local_risk['model_version']} rates this wallet LOW risk "
+                    f"(score {local_risk['risk_score']}, confidence {local_risk['confidence']:.0%}). "
+                    "Pattern, graph and counterparty signals are below the review threshold; AI analysis was not required."
+                )
 
             # Final results
             final_result = {
@@ -298,26 +489,45 @@ async def analyze_wallet_stream(address: str):
                 'analysis_result': {
                     'wallet_address': address,
                     'risk_score': pattern_analysis['risk_score'],
-                    'threat_level': 'LOW' if pattern_analysis['risk_score'] < 30 else 'MEDIUM' if pattern_analysis['risk_score'] < 70 else 'HIGH',
+                    'threat_level': threat_level(pattern_analysis['risk_score']),
                     'ai_analysis': ai_analysis,
                     'transaction_count': len(transactions),
                     'balance': balance_data,
-                    'patterns': pattern_analysis['patterns']
+                    'holdings': holdings_summary,
+                    'patterns': pattern_analysis['patterns'],
+                    'laundering_findings': laundering['findings'],
+                    'ioc_matches': ioc_matches,
+                    'ioc': {'addresses': ([address] if ioc_matches['target'] else []) + [hit['address'] for hit in ioc_matches['hits']]},
+                    'temporal': temporal,
+                    'stale': bool(stale_sources),
+                    'stale_sources': stale_sources,
+                    'local_risk': local_risk
                 },
                 'transaction_graph': transaction_graph,
+                'counterparty_risk': counterparty_risk,
                 'detailed_data': {
                     'wallet_info': {
                         'address': address,
                         'balance': balance_data.get('native_balance', 0),
-                        'token_count': len(balance_data.get('tokens', []))
+                        'token_count': max(len(balance_data.get('tokens', [])), holdings_summary['token_accounts'])
                     },
                     'transaction_summary': {
                         'total_transactions': len(transactions),
-                        'recent_transactions': transactions[:10] if transactions else []
+                        'recent_transactions': [tx.to_dict() for tx in transactions[:10]]
                     }
                 }
             }
-            
+            if not stale_sources:
+                # Results built on fallback data aren't replayed to later callers
+                cache.set(cache_key, final_result, ANALYSIS_CACHE_TTL)
+            await analyzer.index_similarity(address, transactions, transaction_graph)
+            exporter = get_exporter()
+            if exporter is not None:
+                try:
+                    exporter.add_analysis(final_result)
+                except Exception as e:
+                    logger.error(f"Columnar export error: {str(e)}")
+
             yield f"data: {json.dumps(final_result)}\n\n"
             yield f"data: [DONE]\n\n"
 
@@ -331,14 +541,45 @@ async def analyze_wallet_stream(address: str):
             }
             yield f"data: {json.dumps(error_result)}\n\n"
 
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    timeout_frame = f"data: {json.dumps({'step': -1, 'status': 'Error: analysis deadline exceeded', 'progress': 0, 'error': True})}\n\n"
+    return StreamingResponse(
+        stream_until_disconnected(request, generate(), deadline, timeout_frame),
+        media_type="text/event-stream",
+    )
 
-@app.post("/chat/analyze")
-async def chat_analyze_address(chat_request: ChatMessage):
+@router.post("/chat/analyze")
+async def chat_analyze_address(chat_request: ChatMessage, request: Request):
     """Chat-based address analysis"""
+    analyzer = get_analyzer(request)
+    sessions = request.app.state.chat_sessions
     try:
         message = chat_request.message
         address = chat_request.address
+
+        # Follow-ups are answered from a pinned analysis: the client's own
+        # session (only while it is still about the same address), or a new
+        # session over a completed /analyze result in the shared analysis cache.
+        # Sessions are only created here, when a conversation actually starts.
+        session = sessions.get(chat_request.session_id, address)
+        if session is None and address:
+            cached = get_cache("analysis", maxsize=1000).get(f"analysis:{address}")
+            if cached:
+                session = sessions.pin(address, cached)
+
+        if session is not None:
+            ai_response = await invoke_llm(session.build_prompt(message))
+            session.add_turn(message, ai_response)
+            sessions.save(session)
+            return {
+                "response": ai_response,
+                "quick_analysis": {
+                    "recent_transactions": session.pinned.get("transaction_count"),
+                    "risk_score": session.pinned.get("risk_score"),
+                    "address": session.address
+                },
+                "session_id": session.session_id,
+                "timestamp": datetime.now().isoformat()
+            }
         
         # Use AI to understand the user's intent
         chat_prompt = f"""
@@ -353,10 +594,11 @@ async def chat_analyze_address(chat_request: ChatMessage):
         Keep the response conversational and helpful.
         """
         
-        ai_response = mistral_llm.invoke([HumanMessage(content=chat_prompt)])
+        ai_response = await invoke_llm(chat_prompt)
         
-        # If an address was provided, get quick analysis
+        # If an address was provided, get quick analysis and pin it for follow-ups
         quick_analysis = None
+        session_id = None
         if address:
             transactions = await analyzer.get_wallet_transactions(address, limit=20)
             pattern_analysis = await analyzer.analyze_transaction_patterns(transactions)
@@ -365,10 +607,22 @@ async def chat_analyze_address(chat_request: ChatMessage):
                 "risk_score": pattern_analysis["risk_score"],
                 "address": address
             }
+            session = sessions.pin(address, {
+                "analysis_result": {
+                    "wallet_address": address,
+                    "risk_score": pattern_analysis["risk_score"],
+                    "transaction_count": len(transactions),
+                    "patterns": pattern_analysis["patterns"]
+                }
+            })
+            session.add_turn(message, ai_response)
+            sessions.save(session)
+            session_id = session.session_id
         
         return {
-            "response": ai_response.content,
+            "response": ai_response,
             "quick_analysis": quick_analysis,
+            "session_id": session_id,
             "timestamp": datetime.now().isoformat()
         }
         
@@ -376,12 +630,57 @@ async def chat_analyze_address(chat_request: ChatMessage):
         logger.error(f"Chat analysis error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/transaction-flow/{address}")
-async def get_transaction_flow(address: str, limit: int = 50):
-    """Get detailed transaction flow for visualization"""
+@router.get("/transaction-flow/{address}")
+async def get_transaction_flow(address: str, request: Request, limit: int = 50,
+                               layout: Optional[bool] = None, start: Optional[str] = None,
+                               end: Optional[str] = None):
+    """Get detailed transaction flow for visualization (graph_data.layout holds
+    precomputed node positions for large graphs or when layout=true).
+
+    start/end (unix seconds or ISO-8601) restrict the flows to a time range;
+    `temporal` reports count, volume and a histogram for that range from the
+    wallet's temporal index, which covers everything ever fetched for it.
+    Fetching starts just after `end` when the index holds a transaction past
+    it (otherwise from the newest), so up to `limit` transactions are read
+    back from there.
+    """
+    try:
+        start_ts, end_ts = parse_time_bound(start), parse_time_bound(end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    analyzer = get_analyzer(request)
     try:
-        transactions = await analyzer.get_wallet_transactions(address, limit=limit)
+        before = None
+        if end_ts is not None:
+            index = await asyncio.to_thread(load_temporal_index, address)
+            before = index and await asyncio.to_thread(index.signature_after, end_ts)
+        transactions = []
+        async for page in analyzer.iter_wallet_transaction_pages(address, limit=limit, before=before):
+            transactions.extend(page)
+            # Pages are newest first: nothing older than `start` is needed
+            if start_ts is not None and page[-1].timestamp and page[-1].timestamp < start_ts:
+                break
+
+        def index_range():
+            index = update_temporal_index(address, transactions)
+            first, last = index.bounds()
+            lo = start_ts if start_ts is not None else (first or 0)
+            hi = end_ts if end_ts is not None else (last or 0)
+            return index.signatures_between(start_ts, end_ts), {
+                **index.stats(start_ts, end_ts),
+                "histogram": index.histogram(auto_resolution(lo, hi), start_ts, end_ts),
+            }
+
+        in_range, temporal = await asyncio.to_thread(index_range)
+        if start_ts is not None or end_ts is not None:
+            transactions = [tx for tx in transactions if tx.signature in in_range]
         transaction_graph = await analyzer.build_transaction_graph(address, transactions)
+        try:
+            await asyncio.to_thread(resolve_graph_nodes, transaction_graph)
+        except Exception as e:
+            logger.error(f"Node resolution error: {str(e)}")
+        ioc_matches = await analyzer.match_iocs(address, transaction_graph)
+        await analyzer.layout_graph(transaction_graph, layout)
         
         # Separate inflow and outflow
         inflow_transactions = [
@@ -396,6 +695,8 @@ async def get_transaction_flow(address: str, limit: int = 50):
         return {
             "address": address,
             "graph_data": transaction_graph,
+            "ioc_matches": ioc_matches,
+            "temporal": temporal,
             "inflow_transactions": inflow_transactions,
             "outflow_transactions": outflow_transactions,
             "summary": {
@@ -410,6 +711,104 @@ async def get_transaction_flow(address: str, limit: int = 50):
         logger.error(f"Transaction flow error: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/temporal/{address}")
+async def get_temporal_activity(address: str, start: Optional[str] = None, end: Optional[str] = None,
+                                resolution: str = "hour", burst_window: float = 300,
+                                burst_min: int = 10, dormancy_days: float = 30,
+                                dormancy_window: float = 86400):
+    """Range stats and histogram from the wallet's temporal index, plus bursts and
+    dormancy over its whole indexed history"""
+    def query():
+        index = load_temporal_index(address)
+        if index is None:
+            return None
+        start_ts, end_ts = parse_time_bound(start), parse_time_bound(end)
+        return {
+            "address": address,
+            **index.stats(start_ts, end_ts),
+            "histogram": index.histogram(resolution, start_ts, end_ts),
+            "bursts": index.bursts(max(1.0, burst_window), max(2, burst_min)),
+            "dormancy": index.dormancy(max(60.0, dormancy_days * 86400), max(1.0, dormancy_window)),
+        }
+
+    try:
+        result = await asyncio.to_thread(query)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Temporal query error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Address not indexed; analyze it first")
+    return result
+
+@router.get("/similar/{address}")
+async def get_similar_wallets(address: str, limit: int = 20, by: str = "counterparties",
+                              min_similarity: float = 0.0):
+    """Indexed wallets whose counterparties and/or mints overlap most with this one"""
+    from modules.similarity_index import get_similarity_index
+
+    try:
+        result = await asyncio.to_thread(
+            get_similarity_index().similar, address, max(1, min(limit, 200)), by, min_similarity
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Similarity query error: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if result is None:
+        raise HTTPException(status_code=404, detail="Address not indexed; analyze it first")
+    return result
+
+async def flush_exports(exporter, interval: float = 5.0):
+    while True:
+        await asyncio.sleep(interval)
+        if exporter.due():
+            try:
+                await asyncio.to_thread(exporter.flush)
+            except Exception as e:
+                logger.error(f"Columnar export flush error: {str(e)}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared HTTP clients on startup and close them on shutdown"""
+    app.state.http_client = httpx.AsyncClient(timeout=HTTP_TIMEOUT)
+    app.state.analyzer = SolanaAnalyzer(app.state.http_client)
+    # Expire through their cache TTL; shared across workers with the disk backend
+    app.state.chat_sessions = SessionStore()
+    # Optional Parquet export of analysis results (SENTRYSOL_EXPORT_DIR)
+    exporter = get_exporter()
+    flusher = asyncio.create_task(flush_exports(exporter)) if exporter else None
+    try:
+        yield
+    finally:
+        if flusher:
+            flusher.cancel()
+            await asyncio.to_thread(exporter.flush)
+        await app.state.http_client.aclose()
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(title="SentrySol Backend", version="1.0.0", lifespan=lifespan)
+
+    # Configure CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.include_router(router)
+    return app
+
+
+app = create_app()
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
+    # With WEB_CONCURRENCY > 1 set SENTRYSOL_CACHE_BACKEND=disk so workers share caches
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers, reload=workers == 1)
@@ -21,6 +21,11 @@ interface NetworkGraphProps {
       total_edges: number;
       total_volume: number;
     };
+    // Server-computed positions, aligned with `nodes`
+    layout?: {
+      x: number[];
+      y: number[];
+    };
   };
   height?: string;
 }
@@ -32,11 +37,19 @@ export const NetworkGraph: React.FC<NetworkGraphProps> = ({ graphData, height =
   useEffect(() => {
     if (!networkRef.current || !graphData) return;
 
+    // Use the server layout only when it matches the current node list
+    // (graph_delta events can add nodes after it was computed)
+    const layout =
+      graphData.layout && graphData.layout.x.length === graphData.nodes.length
+        ? graphData.layout
+        : null;
+
     // Prepare nodes
     const nodes = new DataSet(
-      graphData.nodes.map(node => ({
+      graphData.nodes.map((node, index) => ({
         id: node.id,
         label: node.label,
+        ...(layout ? { x: layout.x[index], y: layout.y[index] } : {}),
         color: {
           background: node.isMain ? '#CFE0E3' : node.type === 'external' ? '#395B64' : '#92BAC1',
           border: node.isMain ? '#92BAC1' : '#CFE0E3',
@@ -90,7 +103,7 @@ export const NetworkGraph: React.FC<NetworkGraphProps> = ({ graphData, height =
         }
       },
       physics: {
-        enabled: true,
+        enabled: !layout,
         stabilization: { iterations: 100 },
         barnesHut: {
           gravitationalConstant: -2000,
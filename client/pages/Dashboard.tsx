@@ -19,6 +19,18 @@ import {
   Clock,
 } from "lucide-react";
 
+// graph_delta frames sent with graph_frames=gzip carry
+// {"encoding": "gzip+base64", "payload"} instead of the delta itself
+const decodeGraphDelta = async (data: string) => {
+  const message = JSON.parse(data);
+  if (message.encoding !== "gzip+base64") return message;
+  const bytes = Uint8Array.from(atob(message.payload), (c) => c.charCodeAt(0));
+  const stream = new Blob([bytes])
+    .stream()
+    .pipeThrough(new DecompressionStream("gzip"));
+  return JSON.parse(await new Response(stream).text());
+};
+
 export default function Dashboard() {
   const { publicKey, connected } = useWallet();
   const [analysisData, setAnalysisData] = useState<any>(null);
@@ -211,6 +223,42 @@ export default function Dashboard() {
           lastActivityTime = Date.now();
         };
 
+        // Progressive graph: merge node/edge deltas as transaction pages arrive.
+        // Decoding may be async (gzip), so deltas are chained to apply in order.
+        const applyGraphDelta = async (data: string) => {
+          try {
+            const delta = await decodeGraphDelta(data);
+            setAnalysisData((prev: any) => {
+              const graph = prev?.transaction_graph || { nodes: [], edges: [] };
+              const nodes = new Map(graph.nodes.map((n: any) => [n.id, n]));
+              (delta.nodes || []).forEach((n: any) =>
+                nodes.set(n.id, { ...(nodes.get(n.id) || {}), ...n }),
+              );
+              const edges = new Map(
+                graph.edges.map((e: any) => [`${e.from}|${e.to}`, e]),
+              );
+              (delta.edges || []).forEach((e: any) =>
+                edges.set(`${e.from}|${e.to}`, e),
+              );
+              return {
+                ...(prev || {}),
+                transaction_graph: {
+                  ...graph,
+                  nodes: Array.from(nodes.values()),
+                  edges: Array.from(edges.values()),
+                },
+              };
+            });
+          } catch (err) {
+            console.error("Error applying graph delta:", err);
+          }
+        };
+        let graphDeltas = Promise.resolve();
+        eventSource.addEventListener("graph_delta", (event: MessageEvent) => {
+          lastActivityTime = Date.now();
+          graphDeltas = graphDeltas.then(() => applyGraphDelta(event.data));
+        });
+
         eventSource.onmessage = function (event) {
           lastActivityTime = Date.now(); // Reset activity timer
 
@@ -0,0 +1,137 @@
+# Bulk account classification for graph nodes (getMultipleAccounts)
+import os
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from modules.cache import get_cache
+from modules.helius_api import REQUEST_TIMEOUT, fetch_multiple_accounts, is_stale
+from modules.pubkey import is_on_curve, is_valid_pubkey
+
+MULTIPLE_ACCOUNTS_CHUNK = 100
+RESOLVER_MAX_CONCURRENCY = int(os.getenv("RESOLVER_MAX_CONCURRENCY", "4"))
+RESOLVER_CACHE_TTL = int(os.getenv("RESOLVER_CACHE_TTL", str(24 * 3600)))
+
+SYSTEM_PROGRAM = "11111111111111111111111111111111"
+TOKEN_PROGRAM = "TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA"
+TOKEN_2022_PROGRAM = "TokenzQdBNbLqP5VEhdkAS6EPFLC1PHnBqCXEpPxuEb"
+
+KNOWN_PROGRAMS = {
+    SYSTEM_PROGRAM: "System Program",
+    TOKEN_PROGRAM: "Token Program",
+    TOKEN_2022_PROGRAM: "Token-2022 Program",
+    "ATokenGPvbdGVxr1b2hvZbsiqW5xWH25efTNsLJA8knL": "Associated Token Program",
+    "ComputeBudget111111111111111111111111111111": "Compute Budget Program",
+    "MemoSq4gqABAXKb96qnH8TysNcWxMyWCqXgDLGmfcHr": "Memo Program",
+    "metaqbxxUerdq28cj1RbAWkYQm3ybzjb6a8bt518x1s": "Metaplex Token Metadata",
+    "JUP6LkbZbjS1jKKwapdHNy74zcZ3tLUZoi5QNyVTaV4": "Jupiter Aggregator v6",
+    "675kPX9MHTjS2zt1qfr1NYHuzeLXfQM9H24wFSUt1Mp8": "Raydium AMM v4",
+    "whirLbMiicVdio4qvUfM5KAg6Ct8VwpYzGff3uctyCc": "Orca Whirlpools",
+}
+
+_cache = get_cache("address_resolver", maxsize=200000)
+
+
+def classify_account(address: str, account: dict = None) -> dict:
+    """Classify one address from its getMultipleAccounts value.
+
+    Returns {"address", "account_type", "name", "owner"} where account_type is
+    one of program, token_account, mint, pda or wallet.
+    """
+    owner = account.get("owner") if account else None
+    on_curve = is_on_curve(address)
+
+    if address in KNOWN_PROGRAMS or (account and account.get("executable")):
+        return {
+            "address": address,
+            "account_type": "program",
+            "name": KNOWN_PROGRAMS.get(address, "Program"),
+            "owner": owner,
+        }
+
+    data = account.get("data") if account else None
+    parsed = data.get("parsed") if isinstance(data, dict) else None
+    if owner in (TOKEN_PROGRAM, TOKEN_2022_PROGRAM) and isinstance(parsed, dict):
+        info = parsed.get("info") or {}
+        if parsed.get("type") == "account":
+            return {
+                "address": address,
+                "account_type": "token_account",
+                "name": f"Token account ({info.get('mint', '')[:4]}…)",
+                "owner": owner,
+                "token_owner": info.get("owner"),
+                "mint": info.get("mint"),
+            }
+        if parsed.get("type") == "mint":
+            return {"address": address, "account_type": "mint", "name": "Token mint", "owner": owner}
+
+    if not on_curve:
+        return {"address": address, "account_type": "pda", "name": "PDA", "owner": owner}
+    return {"address": address, "account_type": "wallet", "name": "Wallet", "owner": owner}
+
+
+def _resolve_chunk(chunk: list, deadline=None) -> tuple:
+    """(classified accounts, whether they came from the stale fallback).
+
+    Raises on a JSON-RPC error or a malformed result: a missing account is
+    a null entry in `value`, never a missing `value`."""
+    response = fetch_multiple_accounts(chunk, timeout=deadline.timeout(REQUEST_TIMEOUT) if deadline else None)
+    if response.get("error"):
+        raise RuntimeError(f"getMultipleAccounts error: {response['error']}")
+    values = (response.get("result") or {}).get("value")
+    if not isinstance(values, list) or len(values) != len(chunk):
+        raise RuntimeError("getMultipleAccounts returned a malformed result")
+    resolved = {address: classify_account(address, account) for address, account in zip(chunk, values)}
+    return resolved, is_stale(response)
+
+
+def resolve_accounts(addresses, max_concurrency: int = RESOLVER_MAX_CONCURRENCY, deadline=None) -> dict:
+    """Resolve many addresses with chunked, concurrent getMultipleAccounts calls.
+
+    Cached addresses cost nothing; the rest are split into 100-key chunks.
+    A failed chunk is skipped rather than failing the whole lookup, and with
+    a `deadline` (modules.deadline.Deadline) chunks still unanswered when it
+    passes are left out, so those addresses come back unresolved.
+    """
+    wanted = list(dict.fromkeys(a for a in addresses if a and is_valid_pubkey(a)))
+    resolved = _cache.get_many(wanted)
+    missing = [a for a in wanted if a not in resolved]
+    chunks = [missing[i:i + MULTIPLE_ACCOUNTS_CHUNK] for i in range(0, len(missing), MULTIPLE_ACCOUNTS_CHUNK)]
+    if not chunks:
+        return resolved
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(max_concurrency, len(chunks))))
+    try:
+        futures = [pool.submit(_resolve_chunk, chunk, deadline) for chunk in chunks]
+        done, pending = wait(futures, timeout=deadline.remaining() if deadline else None)
+        if pending:
+            print(f"Account resolution deadline reached; {len(pending)} chunk(s) left unresolved")
+        for future in futures:
+            if future not in done:
+                continue
+            try:
+                fresh, stale = future.result()
+            except Exception as e:
+                print(f"Error resolving account chunk: {e}")
+                continue
+            if not stale:
+                _cache.set_many(fresh, RESOLVER_CACHE_TTL)
+            resolved.update(fresh)
+    finally:
+        # Don't wait for calls that overran the deadline
+        pool.shutdown(wait=False, cancel_futures=True)
+    return resolved
+
+
+def resolve_graph_nodes(graph: dict, max_concurrency: int = RESOLVER_MAX_CONCURRENCY, deadline=None) -> dict:
+    """Label every node of a build_transaction_graph result in place (nodes
+    not resolved before `deadline` keep their labels)."""
+    nodes = graph.get("nodes") or []
+    resolved = resolve_accounts([node["id"] for node in nodes], max_concurrency, deadline)
+    for node in nodes:
+        info = resolved.get(node["id"])
+        if not info:
+            continue
+        node["account_type"] = info["account_type"]
+        node["name"] = info["name"]
+        if info["account_type"] == "program":
+            node["label"] = info["name"]
+    return resolved
@@ -1,18 +1,27 @@
 import os
-from datetime import datetime
-from langchain_mistralai.chat_models import ChatMistralAI
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
+import json
+import asyncio
+from collections import Counter
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 
+from modules.deadline import DeadlineExceeded
+from modules.preprocess import aggregate_context, build_shard_context, summarize_tx_for_llm
+from modules.transactions import normalize_transactions
+
 load_dotenv()
 
 LLM_MODEL = os.getenv("LLM_MODEL", "mistral-medium")
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
 
-prompt_template = PromptTemplate(
-    input_variables=["context"],
-    template="""You are a blockchain threat intelligence analyst specializing in detecting malicious wallet activities.
+# Map-reduce limits: contexts above MAX_CONTEXT_CHARS are split into shards of
+# at most SHARD_CONTEXT_CHARS, analysed LLM_MAX_CONCURRENCY at a time
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+MAX_CONTEXT_CHARS = int(os.getenv("MAX_CONTEXT_CHARS", "60000"))
+SHARD_CONTEXT_CHARS = int(os.getenv("SHARD_CONTEXT_CHARS", "40000"))
+MAX_SHARDS = int(os.getenv("MAX_SHARDS", "12"))
+
+PROMPT_TEMPLATE = """You are a blockchain threat intelligence analyst specializing in detecting malicious wallet activities.
 
 Analyze the following combined JSON data from Helius & Metasleuth APIs:
 
@@ -53,16 +62,298 @@ FORMAT:
   }}
 }}
 """
-)
 
+# langchain is imported on first analysis, not at server start
+_chain = None
+
+
+def get_chain():
+    global _chain
+    if _chain is None:
+        from langchain_mistralai.chat_models import ChatMistralAI
+        from langchain.chains import LLMChain
+        from langchain.prompts import PromptTemplate
 
-def run_analysis(context: str):
-    try:
         llm = ChatMistralAI(
             model=LLM_MODEL, mistral_api_key=MISTRAL_API_KEY, temperature=0
         )
-        chain = LLMChain(llm=llm, prompt=prompt_template)
+        prompt_template = PromptTemplate(
+            input_variables=["context", "timestamp"], template=PROMPT_TEMPLATE
+        )
+        _chain = LLMChain(llm=llm, prompt=prompt_template)
+    return _chain
+
+
+def run_analysis(context: str):
+    try:
+        chain = get_chain()
         local_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         return chain.run(context=context, timestamp=local_timestamp)
     except Exception as e:
         return f"Error with Mistral AI: {str(e)}"
+
+
+async def run_analysis_async(context: str):
+    """Async run_analysis, bounded by the process-wide LLM concurrency cap."""
+    async with _llm_semaphore():
+        try:
+            chain = get_chain()
+            local_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            return await chain.arun(context=context, timestamp=local_timestamp)
+        except Exception as e:
+            return f"Error with Mistral AI: {str(e)}"
+
+
+_semaphores = {}
+
+
+def _llm_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    if loop not in _semaphores:
+        _semaphores[loop] = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+    return _semaphores[loop]
+
+
+def parse_analysis_json(result):
+    """Parse an LLM reply into a dict, stripping markdown fences; None if not JSON."""
+    if isinstance(result, dict):
+        return result
+    if not isinstance(result, str):
+        return None
+    text = result.strip()
+    if "```json\n" in text:
+        text = text.split("```json\n")[1].split("\n```")[0]
+    elif "```\n" in text:
+        text = text.split("```\n")[1].split("\n```")[0]
+    try:
+        parsed = json.loads(text)
+    except (json.JSONDecodeError, IndexError):
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+# Sharding
+
+def _fit_summary(summary: dict, budget: int) -> dict:
+    """Trim list fields of one oversized transaction summary to fit the budget."""
+    if len(json.dumps(summary, default=str)) <= budget:
+        return summary
+    trimmed = dict(summary)
+    for key in ("accounts", "programs", "tokenTransfers", "nativeTransfers"):
+        items = trimmed.get(key) or []
+        if len(items) > 5:
+            trimmed[key] = items[:5]
+            trimmed[f"{key}_truncated"] = len(items) - 5
+    trimmed.pop("description", None)
+    return trimmed
+
+
+def _main_counterparty(tx, target_address: str):
+    counts = Counter(
+        party
+        for transfer in tx.transfers
+        for party in (transfer.from_address, transfer.to_address)
+        if party and party != target_address
+    )
+    return counts.most_common(1)[0][0] if counts else None
+
+
+def shard_transactions(transactions, target_address: str, strategy: str = "time", budget: int = None):
+    """Split normalized transactions into shards whose summaries fit `budget` chars.
+
+    strategy="time" keeps shards chronological; strategy="counterparty" keeps
+    each counterparty's transactions together so flows with one party are seen
+    in one prompt. Returns [(label, [summary, ...]), ...].
+    """
+    budget = budget or SHARD_CONTEXT_CHARS
+    txs = sorted(transactions, key=lambda tx: tx.timestamp)
+    if strategy == "counterparty":
+        groups = {}
+        for tx in txs:
+            groups.setdefault(_main_counterparty(tx, target_address), []).append(tx)
+        ordered = sorted(groups.items(), key=lambda item: -len(item[1]))
+    else:
+        ordered = [(None, txs)]
+
+    shards, current, size, parties = [], [], 0, []
+
+    def close():
+        if current:
+            shards.append((list(current), list(parties)))
+
+    for party, group in ordered:
+        for tx in group:
+            summary = _fit_summary(summarize_tx_for_llm(tx), budget)
+            cost = len(json.dumps(summary, default=str)) + 1
+            if current and size + cost > budget:
+                close()
+                current, size, parties = [], 0, []
+            current.append(summary)
+            size += cost
+            if party and party not in parties:
+                parties.append(party)
+    close()
+
+    labelled = []
+    for i, (summaries, shard_parties) in enumerate(shards, 1):
+        times = [t["blockTime"] for t in summaries if t.get("blockTime")]
+        label = {"index": i, "of": len(shards), "strategy": strategy, "tx_count": len(summaries)}
+        if times:
+            label["from"] = datetime.fromtimestamp(min(times), timezone.utc).isoformat()
+            label["to"] = datetime.fromtimestamp(max(times), timezone.utc).isoformat()
+        if shard_parties:
+            label["counterparties"] = shard_parties[:20]
+        labelled.append((label, summaries))
+    return labelled
+
+
+# Reduce
+
+RISK_LEVELS = ["minimal", "low", "medium", "high", "critical"]
+CONFIDENCE_LEVELS = ["low", "medium", "high"]
+IOC_KEYS = ["addresses", "transaction_signatures", "suspicious_mints", "related_programs"]
+
+
+def _rank(value, levels):
+    value = str(value or "").strip().lower()
+    return levels.index(value) if value in levels else -1
+
+
+def _union(*lists):
+    seen = []
+    for items in lists:
+        for item in items or []:
+            if item not in seen:
+                seen.append(item)
+    return seen
+
+
+def reduce_threat_analyses(partials, target_address: str, shard_labels=None, skipped_txs: int = 0) -> dict:
+    """Merge per-shard threat_analysis results into one result of the same schema."""
+    threats = {}
+    risk_score, risk_level = 0, None
+    risk_factors, notes = [], []
+    ioc = {key: [] for key in IOC_KEYS}
+
+    for i, partial in enumerate(partials):
+        analysis = (partial or {}).get("threat_analysis") or partial or {}
+        for threat in analysis.get("potential_threats") or []:
+            if not isinstance(threat, dict):
+                continue
+            key = str(threat.get("threat_type", "unknown")).strip().lower()
+            merged = threats.get(key)
+            if merged is None:
+                threats[key] = dict(threat)
+                continue
+            if _rank(threat.get("confidence"), CONFIDENCE_LEVELS) > _rank(merged.get("confidence"), CONFIDENCE_LEVELS):
+                merged["confidence"] = threat.get("confidence")
+            for field in ("supporting_evidence", "recommended_actions"):
+                a, b = merged.get(field), threat.get(field)
+                if isinstance(a, list) or isinstance(b, list):
+                    merged[field] = _union(a if isinstance(a, list) else [a] if a else [],
+                                           b if isinstance(b, list) else [b] if b else [])
+            if threat.get("reason") and threat["reason"] not in str(merged.get("reason", "")):
+                merged["reason"] = f"{merged.get('reason', '')} {threat['reason']}".strip()
+
+        try:
+            risk_score = max(risk_score, float(analysis.get("risk_score") or 0))
+        except (TypeError, ValueError):
+            pass
+        if _rank(analysis.get("overall_risk_level"), RISK_LEVELS) > _rank(risk_level, RISK_LEVELS):
+            risk_level = analysis.get("overall_risk_level")
+        risk_factors = _union(risk_factors, analysis.get("risk_factors"))
+        for key in IOC_KEYS:
+            ioc[key] = _union(ioc[key], (analysis.get("ioc") or {}).get(key))
+        if analysis.get("additional_notes"):
+            label = (shard_labels or [])[i] if shard_labels and i < len(shard_labels) else {}
+            prefix = f"[shard {label.get('index', i + 1)}/{label.get('of', len(partials))}] "
+            notes.append(prefix + str(analysis["additional_notes"]))
+
+    if skipped_txs:
+        notes.append(f"{skipped_txs} older transaction(s) exceeded the shard budget and were not individually reviewed.")
+
+    return {
+        "threat_analysis": {
+            "metadata": {
+                "target_address": target_address,
+                "chain": "Solana",
+                "analysis_timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "data_sources": ["SentrySol Security AI", "SentrySol Blockchain Analyzer", "SentrySol ML Model"],
+                "shards_analyzed": len(partials),
+            },
+            "potential_threats": list(threats.values()),
+            "overall_risk_level": risk_level or "minimal",
+            "risk_score": int(round(risk_score)),
+            "risk_factors": risk_factors,
+            "ioc": ioc,
+            "additional_notes": " ".join(notes),
+        }
+    }
+
+
+def merge_ioc_matches(result, matches: dict):
+    """Fold local IOC index hits (modules.ioc_index.match_addresses) into a
+    parsed threat_analysis: listed addresses join ioc.addresses, each label
+    becomes a risk factor, and risk score/level are raised to at least the
+    IOC-derived risk."""
+    threat = result.get("threat_analysis") if isinstance(result, dict) else None
+    hits = ([{"address": matches["target_address"], "label": matches["target"]}] if matches.get("target") else []) + matches.get("hits", [])
+    if not isinstance(threat, dict) or not hits:
+        return result
+    ioc = threat.get("ioc") if isinstance(threat.get("ioc"), dict) else {}
+    ioc["addresses"] = _union(ioc.get("addresses"), [hit["address"] for hit in hits])
+    threat["ioc"] = ioc
+    threat["risk_factors"] = _union(threat.get("risk_factors"), [
+        f"{hit['address']} is listed as {hit['label']} in the local IOC index" for hit in hits
+    ])
+    try:
+        threat["risk_score"] = max(int(float(threat.get("risk_score") or 0)), matches["risk_score"])
+    except (TypeError, ValueError):
+        threat["risk_score"] = matches["risk_score"]
+    floor = "critical" if matches.get("target") else "high" if matches["risk_score"] >= 50 else "medium"
+    if _rank(threat.get("overall_risk_level"), RISK_LEVELS) < _rank(floor, RISK_LEVELS):
+        threat["overall_risk_level"] = floor
+    return result
+
+
+async def _within(deadline, coro):
+    return await (deadline.run(coro) if deadline else coro)
+
+
+async def run_chunked_analysis(helius_txs, metasleuth_score, target_address: str,
+                               extra_notes=None, strategy: str = "time", deadline=None):
+    """Analyse a history of any length.
+
+    Histories whose context fits MAX_CONTEXT_CHARS take the single-prompt
+    path. Longer ones are sharded, the shards analysed concurrently under the
+    LLM cap, and the partial findings reduced into one threat_analysis. At
+    most MAX_SHARDS shards (the most recent) are sent, keeping latency bounded.
+    With a `deadline` (modules.deadline.Deadline) LLM calls are cancelled when
+    it passes; shards that miss it are dropped from the reduce.
+    """
+    transactions = normalize_transactions(helius_txs)
+    context = aggregate_context(transactions, metasleuth_score, target_address, extra_notes)
+    if len(context) <= MAX_CONTEXT_CHARS:
+        return await _within(deadline, run_analysis_async(context))
+
+    shards = shard_transactions(transactions, target_address, strategy)
+    skipped = 0
+    if len(shards) > MAX_SHARDS:
+        if strategy == "time":
+            dropped, shards = shards[:-MAX_SHARDS], shards[-MAX_SHARDS:]
+        else:
+            shards, dropped = shards[:MAX_SHARDS], shards[MAX_SHARDS:]
+        skipped = sum(label["tx_count"] for label, _ in dropped)
+
+    async def analyse(label, summaries):
+        shard_context = build_shard_context(summaries, metasleuth_score, target_address, label, extra_notes)
+        try:
+            return parse_analysis_json(await _within(deadline, run_analysis_async(shard_context)))
+        except DeadlineExceeded:
+            return None
+
+    partials = await asyncio.gather(*(analyse(label, summaries) for label, summaries in shards))
+    usable = [(p, label) for p, (label, _) in zip(partials, shards) if p]
+    if not usable:
+        return "Error with Mistral AI: no shard produced a parseable analysis"
+    return reduce_threat_analyses([p for p, _ in usable], target_address, [l for _, l in usable], skipped)
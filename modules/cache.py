@@ -0,0 +1,275 @@
+# Pluggable TTL caches and cross-worker single-flight
+#
+# SENTRYSOL_CACHE_BACKEND selects the backend returned by get_cache():
+#   memory - per-process LRU (default)
+#   disk   - SQLite files under SENTRYSOL_CACHE_DIR, shared by every worker
+#            on the host; use this with `uvicorn --workers N`
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager, contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-flight falls back to in-process locks
+    fcntl = None
+
+CACHE_BACKEND = os.getenv("SENTRYSOL_CACHE_BACKEND", "memory")
+CACHE_DIR = os.getenv("SENTRYSOL_CACHE_DIR", os.path.join(tempfile.gettempdir(), "sentrysol-cache"))
+LOCK_STRIPES = 4096
+
+_MISSING = object()
+
+
+class MemoryCache:
+    """Thread-safe LRU cache with a per-entry TTL."""
+
+    def __init__(self, maxsize: int = 10000):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: float):
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def get_many(self, keys):
+        found = {}
+        for key in keys:
+            value = self.get(key, _MISSING)
+            if value is not _MISSING:
+                found[key] = value
+        return found
+
+    def set_many(self, mapping: dict, ttl: float):
+        for key, value in mapping.items():
+            self.set(key, value, ttl)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class DiskCache:
+    """TTL cache in a SQLite file, safe to share between processes.
+
+    Values must be JSON-serialisable. Expired rows are ignored on read and
+    swept, together with the oldest rows beyond `maxsize`, every few hundred
+    writes.
+    """
+
+    SWEEP_EVERY = 500
+
+    def __init__(self, path: str, maxsize: int = 100000):
+        self.path = path
+        self.maxsize = maxsize
+        self._local = threading.local()
+        self._writes = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key, default=None):
+        row = self._conn().execute(
+            "SELECT value FROM cache WHERE key = ? AND expires_at >= ?", (key, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key, value, ttl: float):
+        self.set_many({key: value}, ttl)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        found = {}
+        now = time.time()
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            rows = self._conn().execute(
+                f"SELECT key, value FROM cache WHERE expires_at >= ? AND key IN ({','.join('?' * len(chunk))})",
+                [now, *chunk],
+            ).fetchall()
+            found.update((k, json.loads(v)) for k, v in rows)
+        return found
+
+    def set_many(self, mapping: dict, ttl: float):
+        if not mapping:
+            return
+        expires_at = time.time() + ttl
+        rows = [(k, json.dumps(v, default=str), expires_at) for k, v in mapping.items()]
+        conn = self._conn()
+        conn.executemany("INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)", rows)
+        self._writes += len(rows)
+        if self._writes >= self.SWEEP_EVERY:
+            self._writes = 0
+            self._sweep(conn)
+
+    def _sweep(self, conn):
+        conn.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+        conn.execute(
+            "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+            (self.maxsize,),
+        )
+
+    def delete(self, key):
+        self._conn().execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    def clear(self):
+        self._conn().execute("DELETE FROM cache")
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(namespace: str, maxsize: int = 10000):
+    """Return the process-wide cache for `namespace` on the configured backend."""
+    with _caches_lock:
+        cache = _caches.get(namespace)
+        if cache is None:
+            if CACHE_BACKEND == "disk":
+                cache = DiskCache(os.path.join(CACHE_DIR, f"{namespace}.sqlite3"), maxsize=maxsize)
+            elif CACHE_BACKEND == "memory":
+                cache = MemoryCache(maxsize=maxsize)
+            else:
+                raise ValueError(f"Unknown SENTRYSOL_CACHE_BACKEND: {CACHE_BACKEND}")
+            _caches[namespace] = cache
+        return cache
+
+
+# Single-flight
+#
+# One lock file per stripe under CACHE_DIR/locks. flock() locks belong to the
+# open file description, so two acquisitions conflict whether they come from
+# different workers or from the same one; no separate in-process lock needed.
+
+_local_locks = {}
+_local_locks_guard = threading.Lock()
+
+
+def _lock_path(key: str) -> str:
+    stripe = int(hashlib.sha1(key.encode()).hexdigest()[:8], 16) % LOCK_STRIPES
+    lock_dir = os.path.join(CACHE_DIR, "locks")
+    os.makedirs(lock_dir, exist_ok=True)
+    return os.path.join(lock_dir, f"{stripe:04d}.lock")
+
+
+def _try_lock(key: str):
+    """Non-blocking acquire; returns a release handle or None."""
+    if fcntl is None:
+        with _local_locks_guard:
+            lock = _local_locks.setdefault(key, threading.Lock())
+        return lock if lock.acquire(blocking=False) else None
+
+    fd = os.open(_lock_path(key), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        return None
+    return fd
+
+
+def _unlock(handle):
+    if isinstance(handle, int):
+        fcntl.flock(handle, fcntl.LOCK_UN)
+        os.close(handle)
+    else:
+        handle.release()
+
+
+@contextmanager
+def single_flight(key: str, timeout: float = 60.0, poll: float = 0.05):
+    """Hold the host-wide computation lock for `key`.
+
+    Yields True once the lock is held, or False if `timeout` passed first
+    (the caller may then compute anyway rather than fail).
+    """
+    deadline = time.monotonic() + timeout
+    handle = _try_lock(key)
+    while handle is None and time.monotonic() < deadline:
+        time.sleep(poll)
+        handle = _try_lock(key)
+    try:
+        yield handle is not None
+    finally:
+        if handle is not None:
+            _unlock(handle)
+
+
+@asynccontextmanager
+async def single_flight_async(key: str, timeout: float = 60.0, poll: float = 0.05):
+    """Async variant of single_flight; waits without blocking the event loop."""
+    deadline = time.monotonic() + timeout
+    handle = _try_lock(key)
+    while handle is None and time.monotonic() < deadline:
+        await asyncio.sleep(poll)
+        handle = _try_lock(key)
+    try:
+        yield handle is not None
+    finally:
+        if handle is not None:
+            _unlock(handle)
+
+
+def cached_call(cache, key: str, compute, ttl: float, lock_timeout: float = 60.0):
+    """Return cache[key], computing it at most once across workers on a miss."""
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+    with single_flight(key, timeout=lock_timeout):
+        value = cache.get(key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            cache.set(key, value, ttl)
+    return value
+
+
+async def cached_call_async(cache, key: str, compute, ttl: float, lock_timeout: float = 60.0):
+    """Async variant of cached_call; `compute` is a coroutine function."""
+    value = cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+    async with single_flight_async(key, timeout=lock_timeout):
+        value = cache.get(key, _MISSING)
+        if value is _MISSING:
+            value = await compute()
+            cache.set(key, value, ttl)
+    return value
@@ -0,0 +1,147 @@
+# Chat sessions pinned to a completed wallet analysis
+#
+# /chat/analyze pins a completed /analyze result (from the shared analysis
+# cache) when a conversation starts, then answers follow-ups from the pinned
+# context plus a compact conversation summary instead of re-fetching
+# transactions. Sessions live in the "chat_sessions" cache, so with the disk
+# backend every worker sees them; each message resets their
+# CHAT_SESSION_IDLE_TIMEOUT TTL.
+import json
+import os
+import time
+import uuid
+
+from modules.cache import get_cache
+
+CHAT_SESSION_IDLE_TIMEOUT = int(os.getenv("CHAT_SESSION_IDLE_TIMEOUT", "1800"))
+CHAT_SESSION_MAX = int(os.getenv("CHAT_SESSION_MAX", "1000"))
+CHAT_RECENT_TURNS = 6          # turns kept verbatim
+CHAT_SUMMARY_CHARS = 1500      # cap for the folded summary of older turns
+CONTEXT_AI_CHARS = 2000        # cap for the pinned AI analysis text
+
+
+def build_session_context(address: str, analysis: dict) -> str:
+    """Compact text view of an /analyze result for follow-up prompts."""
+    result = analysis.get("analysis_result") or {}
+    graph = analysis.get("transaction_graph") or {}
+    patterns = result.get("patterns") or {}
+    if not isinstance(patterns, dict):
+        patterns = {}
+
+    edges = sorted(graph.get("edges") or [], key=lambda e: -(e.get("weight") or 0))[:10]
+    names = {n["id"]: n.get("name") for n in graph.get("nodes") or [] if n.get("name")}
+    flows = [
+        f"{e['from'][:8]}… -> {e['to'][:8]}… {e.get('weight', 0):.4f} SOL x{e.get('count', 1)}"
+        + (f" ({names.get(e['to']) or names.get(e['from'])})" if names.get(e['to']) or names.get(e['from']) else "")
+        for e in edges
+    ]
+    findings = [f"{f['pattern']} ({f['severity']}): {f['detail']}" for f in result.get("laundering_findings") or []]
+    counterparty_risk = analysis.get("counterparty_risk") or {}
+    ai_analysis = result.get("ai_analysis")
+    if not isinstance(ai_analysis, str):
+        ai_analysis = json.dumps(ai_analysis, default=str)
+
+    lines = [
+        f"Address: {address}",
+        f"Risk score: {result.get('risk_score')} ({result.get('threat_level')})",
+        f"Transactions analysed: {result.get('transaction_count')}",
+        f"Large transactions: {len(patterns.get('large_transactions') or [])}, "
+        f"rapid transactions: {len(patterns.get('rapid_transactions') or [])}, "
+        f"unique counterparts: {patterns.get('unique_counterparts')}",
+        f"Local model: {json.dumps(result.get('local_risk'), default=str)}",
+        f"Blocksec target score: {json.dumps(counterparty_risk.get('target'), default=str)}",
+        f"Flagged counterparties: {json.dumps(counterparty_risk.get('counterparties') or {}, default=str)[:800]}",
+        "Laundering findings: " + ("; ".join(findings) if findings else "none"),
+        "Top flows: " + ("; ".join(flows) if flows else "none"),
+        f"Previous AI analysis: {(ai_analysis or '')[:CONTEXT_AI_CHARS]}",
+    ]
+    return "\n".join(lines)
+
+
+def pinned_fields(analysis: dict) -> dict:
+    """The few result fields chat replies echo back (the rest is in the context)."""
+    result = analysis.get("analysis_result") or {}
+    return {"risk_score": result.get("risk_score"), "transaction_count": result.get("transaction_count")}
+
+
+class ChatSession:
+    __slots__ = ("session_id", "address", "pinned", "context", "summary", "turns", "created_at", "last_used")
+
+    def __init__(self, address: str, pinned: dict, context: str):
+        self.session_id = uuid.uuid4().hex
+        self.address = address
+        self.pinned = pinned
+        self.context = context
+        self.summary = ""
+        self.turns = []
+        self.created_at = time.time()
+        self.last_used = self.created_at
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "ChatSession":
+        session = cls.__new__(cls)
+        for name in cls.__slots__:
+            setattr(session, name, data[name])
+        session.turns = [tuple(turn) for turn in session.turns]
+        return session
+
+    def add_turn(self, user_message: str, reply: str):
+        self.turns.append((user_message, reply))
+        # Fold turns that fall out of the verbatim window into the summary
+        while len(self.turns) > CHAT_RECENT_TURNS:
+            old_user, old_reply = self.turns.pop(0)
+            folded = f"Q: {old_user[:150]} A: {old_reply[:200]}"
+            self.summary = (self.summary + "\n" + folded).strip()[-CHAT_SUMMARY_CHARS:]
+
+    def build_prompt(self, message: str) -> str:
+        recent = "\n".join(f"User: {u}\nAssistant: {a}" for u, a in self.turns)
+        return f"""
+        You are SentrySol's Solana security assistant. Answer the user's follow-up
+        question using only the analysis below; say so if it does not contain the answer.
+
+        Wallet analysis:
+        {self.context}
+
+        Earlier conversation (summary):
+        {self.summary or 'none'}
+
+        Recent conversation:
+        {recent or 'none'}
+
+        User message: "{message}"
+
+        Keep the response conversational and specific to this wallet.
+        """
+
+
+class SessionStore:
+    """Sessions keyed by session_id only: a conversation is never shared
+    between clients, even when they ask about the same address. Callers save()
+    a session after changing it."""
+
+    def __init__(self, idle_timeout: int = CHAT_SESSION_IDLE_TIMEOUT, max_sessions: int = CHAT_SESSION_MAX):
+        self.idle_timeout = idle_timeout
+        self._cache = get_cache("chat_sessions", maxsize=max_sessions)
+
+    def pin(self, address: str, analysis: dict) -> ChatSession:
+        """Start a new session pinned to a completed analysis, with no history."""
+        session = ChatSession(address, pinned_fields(analysis), build_session_context(address, analysis))
+        self.save(session)
+        return session
+
+    def get(self, session_id: str, address: str = None):
+        """Live session by id; None when unknown, idle-expired, or pinned to a
+        different address than the one asked about."""
+        if not session_id:
+            return None
+        data = self._cache.get(f"session:{session_id}")
+        if data is None or (address and data["address"] != address):
+            return None
+        return ChatSession.from_dict(data)
+
+    def save(self, session: ChatSession):
+        session.last_used = time.time()
+        self._cache.set(f"session:{session.session_id}", session.to_dict(), self.idle_timeout)
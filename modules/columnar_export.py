@@ -0,0 +1,283 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from modules.transactions import parse_timestamp
+
+# Columnar export of analysis results for offline analytics.
+#
+# With SENTRYSOL_EXPORT_DIR set, every completed analysis is appended to
+# hive-partitioned Parquet datasets under that directory:
+#   wallets/date=YYYY-MM-DD/  one row per analysis: summary, risk scores, pattern metrics
+#   edges/date=YYYY-MM-DD/    aggregated edges of the transaction graph
+#   flows/date=YYYY-MM-DD/    individual transfers (transaction_flows)
+# Rows are buffered in memory and written in batches from a worker thread, so
+# the request path only pays for a list append. query() reads the datasets
+# back through memory-mapped files with partition pruning and row-group
+# predicate pushdown. pyarrow is imported only when writing or querying.
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = os.getenv("SENTRYSOL_EXPORT_DIR")
+EXPORT_FLUSH_ROWS = int(os.getenv("EXPORT_FLUSH_ROWS", "5000"))
+EXPORT_FLUSH_SECONDS = float(os.getenv("EXPORT_FLUSH_SECONDS", "60"))
+
+TABLES = ("wallets", "edges", "flows")
+
+
+def _schemas() -> dict:
+    import pyarrow as pa
+
+    level = pa.dictionary(pa.int8(), pa.string())
+    ts = pa.timestamp("s", tz="UTC")
+    return {
+        "wallets": pa.schema([
+            ("address", pa.string()),
+            ("analyzed_at", ts),
+            ("source", level),
+            ("tx_count", pa.int32()),
+            ("balance_lamports", pa.int64()),
+            ("token_count", pa.int32()),
+            ("risk_score", pa.int16()),
+            ("threat_level", level),
+            ("large_transactions", pa.int32()),
+            ("rapid_transactions", pa.int32()),
+            ("unique_counterparts", pa.int32()),
+            ("laundering_findings", pa.int16()),
+            ("finding_patterns", pa.list_(pa.string())),
+            ("local_risk_probability", pa.float32()),
+            ("local_risk_score", pa.int16()),
+            ("local_risk_level", level),
+            ("local_confidence", pa.float32()),
+            ("use_llm", pa.bool_()),
+            ("model_version", level),
+            ("blocksec_risk", pa.float32()),
+            ("counterparties_scored", pa.int16()),
+            ("graph_nodes", pa.int32()),
+            ("graph_edges", pa.int32()),
+            ("total_volume", pa.float64()),
+            ("date", pa.string()),
+        ]),
+        "edges": pa.schema([
+            ("address", pa.string()),
+            ("analyzed_at", ts),
+            ("from_address", pa.string()),
+            ("to_address", pa.string()),
+            ("weight", pa.float64()),
+            ("count", pa.int32()),
+            ("type", level),
+            ("date", pa.string()),
+        ]),
+        "flows": pa.schema([
+            ("address", pa.string()),
+            ("analyzed_at", ts),
+            ("signature", pa.string()),
+            ("from_address", pa.string()),
+            ("to_address", pa.string()),
+            ("amount", pa.float64()),
+            ("token", level),
+            ("direction", level),
+            ("timestamp", ts),
+            ("date", pa.string()),
+        ]),
+    }
+
+
+def _utc(epoch: float):
+    return datetime.fromtimestamp(epoch, timezone.utc) if epoch else None
+
+
+def analysis_rows(result: dict, source: str = "backend", analyzed_at: float = None) -> dict:
+    """Flatten a backend /analyze final result into rows for each table."""
+    from modules.risk_model import blocksec_risk
+
+    analyzed_at = analyzed_at or time.time()
+    when = datetime.fromtimestamp(analyzed_at, timezone.utc)
+    date = when.strftime("%Y-%m-%d")
+    ar = result.get("analysis_result") or {}
+    address = ar.get("wallet_address")
+    patterns = ar.get("patterns") or {}
+    local = ar.get("local_risk") or {}
+    balance = ar.get("balance") or {}
+    findings = ar.get("laundering_findings") or []
+    graph = result.get("transaction_graph") or {}
+    summary = graph.get("summary") or {}
+    counterparty = result.get("counterparty_risk") or {}
+    target_risk = blocksec_risk(counterparty.get("target"))
+
+    wallet = {
+        "address": address,
+        "analyzed_at": when,
+        "source": source,
+        "tx_count": ar.get("transaction_count"),
+        # Helius /balances returns nativeBalance; native_balance is the degraded fallback
+        "balance_lamports": balance.get("nativeBalance", balance.get("native_balance")),
+        "token_count": len(balance.get("tokens") or []),
+        "risk_score": ar.get("risk_score"),
+        "threat_level": ar.get("threat_level"),
+        "large_transactions": len(patterns.get("large_transactions") or []),
+        "rapid_transactions": len(patterns.get("rapid_transactions") or []),
+        "unique_counterparts": patterns.get("unique_counterparts"),
+        "laundering_findings": len(findings),
+        "finding_patterns": sorted({f.get("pattern") for f in findings if f.get("pattern")}),
+        "local_risk_probability": local.get("risk_probability"),
+        "local_risk_score": local.get("risk_score"),
+        "local_risk_level": local.get("risk_level"),
+        "local_confidence": local.get("confidence"),
+        "use_llm": local.get("use_llm"),
+        "model_version": local.get("model_version"),
+        "blocksec_risk": None if target_risk != target_risk else target_risk,
+        "counterparties_scored": len(counterparty.get("scores") or {}),
+        "graph_nodes": summary.get("total_nodes"),
+        "graph_edges": summary.get("total_edges"),
+        "total_volume": summary.get("total_volume"),
+        "date": date,
+    }
+    edges = [{
+        "address": address,
+        "analyzed_at": when,
+        "from_address": edge["from"],
+        "to_address": edge["to"],
+        "weight": edge.get("weight"),
+        "count": edge.get("count"),
+        "type": edge.get("type"),
+        "date": date,
+    } for edge in graph.get("edges") or []]
+    flows = [{
+        "address": address,
+        "analyzed_at": when,
+        "signature": flow.get("signature"),
+        "from_address": flow.get("from_address"),
+        "to_address": flow.get("to_address"),
+        "amount": flow.get("amount"),
+        "token": flow.get("token"),
+        "direction": flow.get("type"),
+        "timestamp": _utc(parse_timestamp(flow.get("timestamp"))),
+        "date": date,
+    } for flow in graph.get("transaction_flows") or []]
+    return {"wallets": [wallet], "edges": edges, "flows": flows}
+
+
+class ColumnarExporter:
+    """Buffers analysis rows and writes them as date-partitioned Parquet files."""
+
+    def __init__(self, root: str, flush_rows: int = EXPORT_FLUSH_ROWS,
+                 flush_seconds: float = EXPORT_FLUSH_SECONDS):
+        self.root = root
+        self.flush_rows = flush_rows
+        self.flush_seconds = flush_seconds
+        self._buffers = {name: [] for name in TABLES}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._seq = 0
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return sum(len(rows) for rows in self._buffers.values())
+
+    def due(self) -> bool:
+        pending = self.pending
+        return pending >= self.flush_rows or (pending and time.monotonic() - self._last_flush >= self.flush_seconds)
+
+    def add_analysis(self, result: dict, source: str = "backend"):
+        rows = analysis_rows(result, source)
+        with self._lock:
+            for name, table_rows in rows.items():
+                self._buffers[name].extend(table_rows)
+
+    def flush(self) -> int:
+        """Write everything buffered so far; returns the number of rows written.
+
+        Each (table, date) group is written on its own; a group that fails is
+        logged and put back in the buffer for the next flush.
+        """
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        with self._lock:
+            buffers, self._buffers = self._buffers, {name: [] for name in TABLES}
+            self._last_flush = time.monotonic()
+        written = 0
+        failed = {name: [] for name in TABLES}
+        schemas = _schemas()
+        with self._write_lock:
+            for name, rows in buffers.items():
+                by_date = {}
+                for row in rows:
+                    by_date.setdefault(row["date"], []).append(row)
+                for date, date_rows in by_date.items():
+                    directory = os.path.join(self.root, name, f"date={date}")
+                    self._seq += 1
+                    filename = f"part-{int(time.time() * 1000)}-{os.getpid()}-{self._seq:05d}.parquet"
+                    tmp = os.path.join(directory, "." + filename + ".tmp")
+                    try:
+                        # Sorted by wallet so row-group statistics can skip by address
+                        date_rows.sort(key=lambda r: r["address"] or "")
+                        table = pa.Table.from_pylist(date_rows, schema=schemas[name]).drop_columns(["date"])
+                        os.makedirs(directory, exist_ok=True)
+                        pq.write_table(table, tmp, compression="zstd")
+                        os.replace(tmp, os.path.join(directory, filename))
+                    except Exception as e:
+                        logger.error(f"Columnar export of {len(date_rows)} {name} rows for {date} failed: {e}")
+                        failed[name].extend(date_rows)
+                        if os.path.exists(tmp):
+                            os.remove(tmp)
+                        continue
+                    written += len(date_rows)
+        if any(failed.values()):
+            with self._lock:
+                for name, rows in failed.items():
+                    self._buffers[name][:0] = rows
+        return written
+
+
+_exporter = None
+_exporter_lock = threading.Lock()
+
+
+def get_exporter():
+    """Process-wide exporter, or None when SENTRYSOL_EXPORT_DIR is not set."""
+    global _exporter
+    if not EXPORT_DIR:
+        return None
+    with _exporter_lock:
+        if _exporter is None:
+            _exporter = ColumnarExporter(EXPORT_DIR)
+        return _exporter
+
+
+def open_dataset(table: str, root: str = None):
+    """Dataset for an exported table name, or for any Parquet file/directory path
+    (e.g. a bulk_screen.py output)."""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    from pyarrow.fs import LocalFileSystem
+
+    filesystem = LocalFileSystem(use_mmap=True)
+    if table in TABLES:
+        root = root or EXPORT_DIR
+        if not root:
+            raise RuntimeError("SENTRYSOL_EXPORT_DIR is not set")
+        partitioning = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+        return ds.dataset(os.path.join(root, table), format="parquet",
+                          partitioning=partitioning, filesystem=filesystem)
+    return ds.dataset(os.path.abspath(table), format="parquet", filesystem=filesystem)
+
+
+def query(table: str, columns=None, filters=None, root: str = None):
+    """Read an exported table (or Parquet path) into a pyarrow Table.
+
+    `filters` use pyarrow's tuple form, e.g.
+    [("date", ">=", "2024-06-01"), ("risk_score", ">=", 70)]; the date
+    partition prunes directories and the rest is pushed down to row groups,
+    so only matching data is decoded.
+    """
+    import pyarrow.parquet as pq
+
+    dataset = open_dataset(table, root)
+    expression = pq.filters_to_expression(filters) if filters else None
+    return dataset.to_table(columns=columns, filter=expression)
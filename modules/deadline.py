@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import os
+import time
+
+# Per-request deadlines and client-disconnect cancellation for the SSE
+# endpoints. A Deadline is created when an analysis request arrives and is
+# handed to every stage, which sizes its upstream timeouts from what is left.
+# stream_until_disconnected runs the pipeline as a task and cancels it as soon
+# as the client goes away or the deadline passes, so Helius, Blocksec and LLM
+# calls are not finished for nobody.
+
+logger = logging.getLogger(__name__)
+
+ANALYSIS_DEADLINE = float(os.getenv("ANALYSIS_DEADLINE", "90"))
+DISCONNECT_POLL_INTERVAL = float(os.getenv("DISCONNECT_POLL_INTERVAL", "0.5"))
+# Stages see the deadline first and degrade gracefully; the stream is only
+# cut this many seconds later if a stage overran anyway
+DEADLINE_GRACE = float(os.getenv("DEADLINE_GRACE", "2"))
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    __slots__ = ("expires_at",)
+
+    def __init__(self, seconds: float = ANALYSIS_DEADLINE):
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, stage: str = ""):
+        if self.expired:
+            raise DeadlineExceeded(f"deadline exceeded before {stage}" if stage else "deadline exceeded")
+
+    def timeout(self, cap: float = None) -> float:
+        """Seconds the next upstream call may take: what is left, capped at `cap`."""
+        self.check()
+        remaining = self.remaining()
+        return remaining if cap is None else min(cap, remaining)
+
+    async def run(self, awaitable, cap: float = None):
+        """Await `awaitable`, cancelling it once the deadline (or `cap`) passes."""
+        if self.expired:
+            if asyncio.iscoroutine(awaitable):
+                awaitable.close()
+            raise DeadlineExceeded("deadline exceeded")
+        try:
+            return await asyncio.wait_for(awaitable, self.timeout(cap))
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded("deadline exceeded") from None
+
+
+async def stream_until_disconnected(request, frames, deadline: Deadline,
+                                    timeout_frame: str = None,
+                                    poll_interval: float = DISCONNECT_POLL_INTERVAL):
+    """Relay SSE `frames` from a producer task until it ends, the client
+    disconnects or `deadline` passes; in the latter two cases the producer is
+    cancelled mid-await, which aborts its in-flight httpx and LLM calls.
+    """
+    queue = asyncio.Queue(maxsize=1)
+    hard_stop = deadline.expires_at + DEADLINE_GRACE
+
+    async def pump():
+        async for frame in frames:
+            await queue.put(frame)
+
+    producer = asyncio.ensure_future(pump())
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait(
+                {getter, producer},
+                timeout=max(0.0, min(poll_interval, hard_stop - time.monotonic())),
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if getter in done:
+                yield getter.result()
+                continue
+            getter.cancel()
+            if producer in done:
+                producer.result()
+                while not queue.empty():
+                    yield queue.get_nowait()
+                return
+            if await request.is_disconnected():
+                logger.info(f"Client disconnected from {request.url.path}, cancelling analysis")
+                return
+            if time.monotonic() >= hard_stop:
+                logger.warning(f"Deadline exceeded for {request.url.path}, cancelling analysis")
+                if timeout_frame:
+                    yield timeout_frame
+                return
+    finally:
+        producer.cancel()
+        await asyncio.gather(producer, return_exceptions=True)
+        await frames.aclose()
@@ -0,0 +1,194 @@
+# Server-side layout for transaction-flow graphs
+#
+# Computes node coordinates for the {"nodes", "edges"} graph returned by
+# build_transaction_graph so large graphs render without a browser-side
+# force simulation. Two levels:
+#   1. leaves (counterparties seen through a single edge, the bulk of most
+#      wallet graphs) are collapsed into their only neighbour;
+#   2. the remaining core is laid out with a vectorized Fruchterman-Reingold
+#      pass (exact repulsion up to LAYOUT_EXACT_NODES, sampled above it),
+# then the leaves are placed on sunflower spirals around their neighbour.
+# Positions are returned as arrays aligned with graph["nodes"] and cached by
+# graph structure, so replays and repeated /transaction-flow calls are free.
+import hashlib
+import os
+import time
+
+import numpy as np
+
+from modules.cache import get_cache
+
+LAYOUT_AUTO_NODES = int(os.getenv("LAYOUT_AUTO_NODES", "500"))  # auto layout from this many nodes
+LAYOUT_ITERATIONS = int(os.getenv("LAYOUT_ITERATIONS", "120"))
+LAYOUT_EXACT_NODES = 400        # exact O(n^2) repulsion up to this many core nodes
+LAYOUT_REPULSION_SAMPLES = 32   # repelling nodes sampled per node above it
+LAYOUT_SPACING = 120.0          # ideal edge length in canvas pixels
+LAYOUT_CACHE_TTL = 24 * 3600
+
+_GOLDEN_ANGLE = np.pi * (3 - np.sqrt(5))
+
+
+def layout_key(graph: dict) -> str:
+    """Digest of the graph's structure (node order and edge endpoints)."""
+    h = hashlib.blake2b(digest_size=16)
+    for node in graph.get("nodes") or []:
+        h.update(node["id"].encode())
+        h.update(b"\0")
+    h.update(b"\1")
+    for edge in graph.get("edges") or []:
+        h.update(f"{edge['from']}\0{edge['to']}\0".encode())
+    return f"layout:{h.hexdigest()}"
+
+
+def _edge_index(graph: dict, index: dict):
+    pairs = {
+        (min(u, v), max(u, v))
+        for u, v in ((index.get(e["from"]), index.get(e["to"])) for e in graph.get("edges") or [])
+        if u is not None and v is not None and u != v
+    }
+    if not pairs:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    edges = np.array(sorted(pairs), dtype=np.int64)
+    return edges[:, 0], edges[:, 1]
+
+
+def _force_layout(n: int, src: np.ndarray, dst: np.ndarray, pinned: int,
+                  iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """Fruchterman-Reingold over n nodes; node `pinned` stays at the origin."""
+    k = LAYOUT_SPACING
+    radius = k * np.sqrt(n)
+    angle = rng.uniform(0, 2 * np.pi, n)
+    r = radius * np.sqrt(rng.uniform(0, 1, n))
+    pos = np.column_stack((r * np.cos(angle), r * np.sin(angle)))
+    pos[pinned] = 0.0
+    if n < 2:
+        return pos
+
+    x, y = pos[:, 0].copy(), pos[:, 1].copy()
+    exact = n <= LAYOUT_EXACT_NODES
+    samples = min(LAYOUT_REPULSION_SAMPLES, n - 1)
+    temperature = radius / 4
+    for step in range(iterations):
+        if exact:
+            dx = x[:, None] - x[None, :]
+            dy = y[:, None] - y[None, :]
+            force = (k * k) / np.maximum(dx * dx + dy * dy, 1e-2)
+            fx = (dx * force).sum(axis=1)
+            fy = (dy * force).sum(axis=1)
+        else:
+            # Repel from a fresh random subset each step, scaled to the full population
+            others = (np.arange(n)[:, None] + rng.integers(1, n, samples)[None, :]) % n
+            dx = x[:, None] - x[others]
+            dy = y[:, None] - y[others]
+            force = (k * k * (n - 1) / samples) / np.maximum(dx * dx + dy * dy, 1e-2)
+            fx = (dx * force).sum(axis=1)
+            fy = (dy * force).sum(axis=1)
+
+        if src.size:
+            ex = x[src] - x[dst]
+            ey = y[src] - y[dst]
+            pull = np.sqrt(ex * ex + ey * ey) / k
+            fx -= np.bincount(src, ex * pull, minlength=n) - np.bincount(dst, ex * pull, minlength=n)
+            fy -= np.bincount(src, ey * pull, minlength=n) - np.bincount(dst, ey * pull, minlength=n)
+
+        # Weak gravity keeps disconnected components from drifting apart
+        gravity = 0.01 * np.sqrt(n)
+        fx -= x * gravity
+        fy -= y * gravity
+
+        length = np.maximum(np.sqrt(fx * fx + fy * fy), 1e-9)
+        scale = np.minimum(length, temperature) / length
+        x += fx * scale
+        y += fy * scale
+        x -= x[pinned]
+        y -= y[pinned]
+        temperature = max(k / 10, temperature * 0.95)
+    return np.column_stack((x, y))
+
+
+def compute_layout(graph: dict, iterations: int = LAYOUT_ITERATIONS, seed: int = 0) -> dict:
+    """Coordinates for every node of a transaction graph.
+
+    Returns {"algorithm", "x", "y", "bounds", "core_nodes", "iterations",
+    "elapsed_ms"}; x[i], y[i] belong to graph["nodes"][i] and bounds is
+    [min_x, min_y, max_x, max_y]. The main wallet sits at the origin.
+    """
+    started = time.perf_counter()
+    nodes = graph.get("nodes") or []
+    n = len(nodes)
+    index = {node["id"]: i for i, node in enumerate(nodes)}
+    main = next((i for i, node in enumerate(nodes) if node.get("isMain")), 0)
+    pos = np.zeros((n, 2))
+
+    core_count = 0
+    if n > 1:
+        src, dst = _edge_index(graph, index)
+        degree = np.bincount(src, minlength=n) + np.bincount(dst, minlength=n)
+        is_leaf = degree <= 1
+        is_leaf[main] = False
+        # Each leaf hangs off its only neighbour (isolated nodes off the main wallet)
+        parent = np.full(n, main, dtype=np.int64)
+        leaf_edges = is_leaf[src] | is_leaf[dst]
+        parent[src[leaf_edges & is_leaf[src]]] = dst[leaf_edges & is_leaf[src]]
+        parent[dst[leaf_edges & is_leaf[dst]]] = src[leaf_edges & is_leaf[dst]]
+        # Two leaves joined only to each other: anchor the pair on the main wallet
+        orphan = is_leaf & is_leaf[parent]
+        parent[orphan] = main
+
+        core = np.flatnonzero(~is_leaf)
+        core_count = len(core)
+        core_index = np.full(n, -1, dtype=np.int64)
+        core_index[core] = np.arange(core_count)
+        core_edges = ~leaf_edges
+        pos[core] = _force_layout(
+            core_count, core_index[src[core_edges]], core_index[dst[core_edges]],
+            core_index[main], iterations if core_count > 1 else 0, np.random.default_rng(seed),
+        )
+
+        leaves = np.flatnonzero(is_leaf)
+        if leaves.size:
+            order = leaves[np.argsort(parent[leaves], kind="stable")]
+            parents = parent[order]
+            # Rank of each leaf among its siblings, for the sunflower spiral
+            first = np.r_[0, np.flatnonzero(np.diff(parents)) + 1]
+            rank = np.arange(order.size) - np.repeat(first, np.diff(np.r_[first, order.size]))
+            r = LAYOUT_SPACING * (0.6 + 0.35 * np.sqrt(rank))
+            theta = rank * _GOLDEN_ANGLE
+            pos[order, 0] = pos[parents, 0] + r * np.cos(theta)
+            pos[order, 1] = pos[parents, 1] + r * np.sin(theta)
+
+    pos = np.round(pos, 1)
+    bounds = [float(pos[:, 0].min()), float(pos[:, 1].min()), float(pos[:, 0].max()), float(pos[:, 1].max())] if n else [0.0] * 4
+    return {
+        "algorithm": "leaf-collapse+fruchterman-reingold",
+        "x": pos[:, 0].tolist(),
+        "y": pos[:, 1].tolist(),
+        "bounds": bounds,
+        "core_nodes": core_count,
+        "iterations": iterations if core_count > 1 else 0,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+    }
+
+
+def wants_layout(graph: dict, layout=None) -> bool:
+    """`layout` is True/False from the request, or None for automatic
+    (graphs with at least LAYOUT_AUTO_NODES nodes)."""
+    if layout is None:
+        return len(graph.get("nodes") or []) >= LAYOUT_AUTO_NODES
+    return bool(layout)
+
+
+def attach_layout(graph: dict, layout=None):
+    """Set graph["layout"] (cached by graph structure) when wanted; returns it or None."""
+    if not wants_layout(graph, layout):
+        return None
+    if graph.get("layout") and len(graph["layout"]["x"]) == len(graph.get("nodes") or []):
+        return graph["layout"]
+    cache = get_cache("graph_layout", maxsize=500)
+    key = layout_key(graph)
+    result = cache.get(key)
+    if result is None:
+        result = compute_layout(graph)
+        cache.set(key, result, LAYOUT_CACHE_TTL)
+    graph["layout"] = result
+    return result
@@ -1,20 +1,100 @@
-import os, json
+import os, json, time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import requests
 from dotenv import load_dotenv
 
+from modules.cache import get_cache
+from modules.resilience import call
+
 load_dotenv()
 
 HELIUS_API_KEY = os.getenv("HELIUS_API_KEY")
 REQUEST_TIMEOUT = 15
 
-if not HELIUS_API_KEY:
-    raise RuntimeError("HELIUS_API_KEY not found in .env")
-
 RPC_URL = f"https://mainnet.helius-rpc.com/?api-key={HELIUS_API_KEY}"
 
 
+def _rpc_url():
+    # Checked per call rather than at import so apps can boot (and report
+    # health) without the key; only Helius-backed requests fail.
+    if not HELIUS_API_KEY:
+        raise RuntimeError("HELIUS_API_KEY not found in .env")
+    return RPC_URL
+
+
+# Last good response per payload, served when a call fails or its circuit is open
+STALE_TTL = int(os.getenv("HELIUS_STALE_TTL", "3600"))
+
+
+def _is_upstream_failure(e: Exception) -> bool:
+    # 4xx (other than 429) means a bad request, not an unhealthy endpoint
+    if isinstance(e, requests.HTTPError) and e.response is not None:
+        return e.response.status_code >= 500 or e.response.status_code == 429
+    return True
+
+
+def _rpc_post(payload: dict, timeout: float = None):
+    """POST a JSON-RPC payload, hedged and behind per-method and endpoint
+    circuit breakers; falls back to the last good response for the same
+    payload when the call fails or is refused, marked with "stale": True
+    and its "stale_age" in seconds.
+
+    `timeout` (default REQUEST_TIMEOUT) is usually what is left of a caller's
+    deadline; timing out under such a cap says nothing about Helius, so it
+    does not count against the breakers."""
+    url = _rpc_url()
+    method = payload["method"]
+    capped = timeout is not None and timeout < REQUEST_TIMEOUT
+    timeout = REQUEST_TIMEOUT if timeout is None else timeout
+
+    def post():
+        r = requests.post(url, json=payload, timeout=timeout)
+        r.raise_for_status()
+        return r.json()
+
+    def is_failure(e: Exception) -> bool:
+        if capped and isinstance(e, requests.Timeout):
+            return False
+        return _is_upstream_failure(e)
+
+    stale_cache = get_cache("helius_stale", maxsize=5000)
+    stale_key = json.dumps(payload, sort_keys=True)
+    try:
+        data = call(f"helius-rpc:{method}", post,
+                    breakers=(f"helius-rpc:{method}", "helius-rpc"), is_failure=is_failure)
+    except Exception as e:
+        stale = stale_cache.get(stale_key)
+        if not isinstance(stale, dict) or "fetched_at" not in stale:
+            raise
+        print(f"[helius] {method} failed ({e}); serving last good response")
+        # Flagged so callers never mistake it for live data
+        return {**stale["data"], "stale": True, "stale_age": round(time.time() - stale["fetched_at"], 1)}
+    stale_cache.set(stale_key, {"data": data, "fetched_at": time.time()}, STALE_TTL)
+    return data
+
+
+def is_stale(response) -> bool:
+    """True for a response served from the stale fallback instead of Helius."""
+    return isinstance(response, dict) and bool(response.get("stale"))
+
+# DAS (getAssetsByOwner / getTokenAccounts) pagination
+DAS_PAGE_LIMIT = 1000
+DAS_MAX_CONCURRENCY = int(os.getenv("DAS_MAX_CONCURRENCY", "4"))
+
+ASSET_DISPLAY_OPTIONS = {
+    "showUnverifiedCollections": False,
+    "showCollectionMetadata": False,
+    "showGrandTotal": False,
+    "showFungible": False,
+    "showNativeBalance": False,
+    "showInscription": False,
+    "showZeroBalance": False,
+}
+
+
 # 1. Transaction detail
-def fetch_transaction(signature: str):
+def fetch_transaction(signature: str, timeout: float = None):
     payload = {
         "jsonrpc": "2.0",
         "id": 1,
@@ -24,26 +104,22 @@ def fetch_transaction(signature: str):
             { "commitment": "finalized" },
         ],
     }
-    r = requests.post(RPC_URL, json=payload, timeout=REQUEST_TIMEOUT)
-    r.raise_for_status()
-    return r.json()
+    return _rpc_post(payload, timeout)
 
 
 # 2. Address history (getSignaturesForAddress)
-def fetch_address_history(address: str, limit: int = 50, enriched: bool = True):
+def fetch_address_history(address: str, limit: int = 50, enriched: bool = True, timeout: float = None):
     payload = {
         "jsonrpc": "2.0",
         "id": 1,
         "method": "getSignaturesForAddress",
         "params": [address, {"limit": limit}],
     }
-    r = requests.post(RPC_URL, json=payload, timeout=REQUEST_TIMEOUT)
-    r.raise_for_status()
-    return r.json()
+    return _rpc_post(payload, timeout)
 
 
 # 3. Token accounts by owner
-def fetch_token_metadata(owner_address: str):
+def fetch_token_metadata(owner_address: str, timeout: float = None):
     payload = {
         "jsonrpc": "2.0",
         "id": 1,
@@ -54,45 +130,139 @@ def fetch_token_metadata(owner_address: str):
             {"encoding": "jsonParsed"},
         ],
     }
-    r = requests.post(RPC_URL, json=payload, timeout=REQUEST_TIMEOUT)
-    r.raise_for_status()
-    return r.json()
+    return _rpc_post(payload, timeout)
 
 
-def fetch_nft_metadata(owner_address: str):
+def fetch_nft_metadata(owner_address: str, page: int = 1, limit: int = 50, timeout: float = None):
     payload = {
     "jsonrpc": "2.0",
     "id": "1",
     "method": "getAssetsByOwner",
     "params": {
         "ownerAddress": owner_address,
-        "page": 1,
-        "limit": 50,
+        "page": page,
+        "limit": limit,
         "sortBy": {
             "sortBy": "created",
             "sortDirection": "asc"
         },
-        "options": {
-            "showUnverifiedCollections": False,
-            "showCollectionMetadata": False,
-            "showGrandTotal": False,
-            "showFungible": False,
-            "showNativeBalance": False,
-            "showInscription": False,
-            "showZeroBalance": False
-        }
+        "options": ASSET_DISPLAY_OPTIONS,
     }
 }
-    r = requests.post(RPC_URL, json=payload, timeout=REQUEST_TIMEOUT)
-    r.raise_for_status()
-    return r.json()
+    return _rpc_post(payload, timeout)
+
 
+def _fetch_das_page(method: str, params: dict, page: int, limit: int, deadline=None):
+    payload = {
+        "jsonrpc": "2.0",
+        "id": f"{method}-{page}",
+        "method": method,
+        "params": {**params, "page": page, "limit": limit},
+    }
+    # Sized when the page actually starts, from what is left of the deadline
+    # (raises DeadlineExceeded once it has passed)
+    data = _rpc_post(payload, deadline.timeout(REQUEST_TIMEOUT) if deadline else None)
+    if data.get("error"):
+        raise RuntimeError(f"{method} page {page} failed: {data['error']}")
+    return data.get("result") or {}
 
-def fetch_balance_changes(address: str):
+
+def _iter_das_pages(method: str, params: dict, items_key: str, limit: int = DAS_PAGE_LIMIT,
+                    max_concurrency: int = DAS_MAX_CONCURRENCY, max_pages: int = None,
+                    deadline=None):
+    """Yield every item of a page-numbered DAS method.
+
+    Page 1 is fetched alone; if it reports a grand total the remaining page
+    count is known up front, otherwise pages are fetched speculatively. Either
+    way up to `max_concurrency` pages are in flight at once and items are
+    yielded in page order. The first short page ends the enumeration and
+    cancels anything still queued behind it. With a `deadline` (a
+    modules.deadline.Deadline) every page's timeout is capped by what is left
+    of it, and DeadlineExceeded is raised once it passes.
+    """
+    limit = max(1, min(limit, DAS_PAGE_LIMIT))
+    first = _fetch_das_page(method, params, 1, limit, deadline)
+    items = first.get(items_key) or []
+    yield from items
+    if len(items) < limit or max_pages == 1:
+        return
+
+    last_page = None
+    grand_total = first.get("grand_total")
+    if isinstance(grand_total, int):
+        last_page = -(-grand_total // limit)
+    if max_pages:
+        last_page = min(last_page or max_pages, max_pages)
+
+    pool = ThreadPoolExecutor(max_workers=max(1, max_concurrency))
+    pending = deque()
+    next_page = 2
+    try:
+        while True:
+            while len(pending) < max_concurrency and (last_page is None or next_page <= last_page):
+                pending.append(pool.submit(_fetch_das_page, method, params, next_page, limit, deadline))
+                next_page += 1
+            if not pending:
+                return
+            page_items = pending.popleft().result().get(items_key) or []
+            yield from page_items
+            if len(page_items) < limit:
+                return
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def iter_assets_by_owner(owner_address: str, limit: int = DAS_PAGE_LIMIT,
+                         max_concurrency: int = DAS_MAX_CONCURRENCY, max_pages: int = None,
+                         show_fungible: bool = False, deadline=None):
+    """Stream every asset held by `owner_address` (getAssetsByOwner)."""
+    params = {
+        "ownerAddress": owner_address,
+        "sortBy": {"sortBy": "created", "sortDirection": "asc"},
+        "options": {**ASSET_DISPLAY_OPTIONS, "showGrandTotal": True, "showFungible": show_fungible},
+    }
+    return _iter_das_pages("getAssetsByOwner", params, "items", limit, max_concurrency, max_pages, deadline)
+
+
+def iter_token_accounts(owner_address: str, limit: int = DAS_PAGE_LIMIT,
+                        max_concurrency: int = DAS_MAX_CONCURRENCY, max_pages: int = None,
+                        deadline=None):
+    """Stream every token account owned by `owner_address` (getTokenAccounts)."""
+    params = {"owner": owner_address}
+    return _iter_das_pages("getTokenAccounts", params, "token_accounts", limit, max_concurrency, max_pages, deadline)
+
+
+def fetch_wallet_holdings(owner_address: str, deadline=None, cancelled=None) -> dict:
+    """Every asset (NFTs and other non-fungibles) and token account held by
+    `owner_address`, via the paged DAS iterators.
+
+    Stops early, with "complete": False, when `deadline` passes, a page fails
+    or `cancelled` (a threading.Event) is set; whatever was read so far is kept.
+    """
+    holdings = {"assets": [], "token_accounts": [], "complete": True}
+    for key, items in (
+        ("assets", lambda: iter_assets_by_owner(owner_address, deadline=deadline)),
+        ("token_accounts", lambda: iter_token_accounts(owner_address, deadline=deadline)),
+    ):
+        iterator = items()
+        try:
+            for item in iterator:
+                if cancelled is not None and cancelled.is_set():
+                    holdings["complete"] = False
+                    return holdings
+                holdings[key].append(item)
+        except Exception as e:
+            print(f"[helius] {key} enumeration for {owner_address} stopped early: {e}")
+            holdings["complete"] = False
+            return holdings
+        finally:
+            iterator.close()
+    return holdings
+
+
+def fetch_balance_changes(address: str, timeout: float = None):
     payload = {"jsonrpc": "2.0", "id": 1, "method": "getBalance", "params": [address]}
-    r = requests.post(RPC_URL, json=payload, timeout=REQUEST_TIMEOUT)
-    r.raise_for_status()
-    return r.json()
+    return _rpc_post(payload, timeout)
 
 
 def resolve_address_name(address: str):
@@ -102,23 +272,29 @@ def resolve_address_name(address: str):
         "method": "getAccountInfo",
         "params": [address, {"encoding": "jsonParsed"}],
     }
-    r = requests.post(RPC_URL, json=payload, timeout=REQUEST_TIMEOUT)
-    r.raise_for_status()
-    return r.json()
+    return _rpc_post(payload)
 
 
-def fetch_webhook_events(addresses: list, limit: int = 50):
+def fetch_webhook_events(addresses: list, limit: int = 50, timeout: float = None):
     payload = {
         "jsonrpc": "2.0",
         "id": 1,
         "method": "getMultipleAccounts",
         "params": [addresses[:limit], {"encoding": "jsonParsed"}],
     }
-    r = requests.post(RPC_URL, json=payload, timeout=REQUEST_TIMEOUT)
-    r.raise_for_status()
-    return r.json()
+    return _rpc_post(payload, timeout)
 
-def get_signatures_for_address(address: str, limit: int = 10):
+def fetch_multiple_accounts(addresses: list, timeout: float = None):
+    """getMultipleAccounts for up to 100 keys; result values align with `addresses`."""
+    payload = {
+        "jsonrpc": "2.0",
+        "id": 1,
+        "method": "getMultipleAccounts",
+        "params": [addresses, {"encoding": "jsonParsed"}],
+    }
+    return _rpc_post(payload, timeout)
+
+def get_signatures_for_address(address: str, limit: int = 10, timeout: float = None):
     
     payload = {
         "jsonrpc": "2.0",
@@ -126,20 +302,16 @@ def get_signatures_for_address(address: str, limit: int = 10):
         "method": "getSignaturesForAddress",
         "params": [address, {"limit": limit}],
     }
-    r = requests.post(RPC_URL, json=payload, timeout=REQUEST_TIMEOUT)
-    r.raise_for_status()
-    return r.json()
+    return _rpc_post(payload, timeout)
 
-def get_token_account(address: str):
+def get_token_account(address: str, page: int = 1, limit: int = 1):
     payload = {
         "jsonrpc": "2.0",
         "id": 1,
         "method": "getTokenAccounts",
-        "params": {"owner": address, "limit": 1}
+        "params": {"owner": address, "page": page, "limit": limit}
     }
-    r = requests.post(RPC_URL, json=payload, timeout=REQUEST_TIMEOUT)
-    r.raise_for_status()
-    return r.json()
+    return _rpc_post(payload)
 
 def save_json(data, filename):
     with open(filename, "w", encoding="utf-8") as f:
@@ -180,3 +352,7 @@ if __name__ == "__main__":
 
     # 9. Token Account
     save_json(get_token_account(test_address), "token_account.json")
+
+    # 10. Full portfolio (all pages)
+    save_json(list(iter_assets_by_owner(test_address)), "assets_all.json")
+    save_json(list(iter_token_accounts(test_address)), "token_accounts_all.json")
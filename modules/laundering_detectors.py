@@ -0,0 +1,404 @@
+# Laundering pattern detectors over an aggregated transaction graph
+#
+# Works on the {"nodes", "edges"} dict returned by build_transaction_graph (or
+# any multi-hop graph in the same shape). The graph is loaded once into sparse
+# CSR adjacency/weight matrices and every detector is a handful of vectorized
+# sparse operations, so 100k+ edge graphs are analysed in well under a second.
+import time
+
+import numpy as np
+from scipy import sparse
+
+# Thresholds
+FAN_DEGREE = 10             # distinct counterparties for fan-out / fan-in
+FAN_UNIFORMITY_CV = 0.5     # coefficient of variation below which amounts look structured
+GATHER_PATHS = 3            # distinct target->x->k paths that make k a gather point
+PEEL_FORWARD_RATIO = 0.7    # share of inflow a peel hop forwards to the next hop
+PEEL_MIN_LENGTH = 3
+PASS_THROUGH_RATIO = 0.9    # out/in volume ratio of a pass-through (layering) wallet
+LAYERING_MIN_LENGTH = 2
+ROUND_TRIP_MAX_HOPS = 4
+ROUND_TRIP_SEARCH_BUDGET = 200_000  # edge visits before falling back to walk counts
+MAX_REPORTED_NODES = 25
+
+# Risk contribution per finding, capped at 100 overall
+PATTERN_WEIGHTS = {
+    "peel_chain": 25,
+    "fan_out": 15,
+    "fan_in": 15,
+    "scatter_gather": 20,
+    "round_trip": 20,
+    "reciprocal_flows": 5,
+    "layering": 20,
+}
+
+
+class FlowMatrix:
+    """Sparse view of a transaction graph: node index plus weight/adjacency CSR."""
+
+    def __init__(self, graph: dict):
+        ids = [node["id"] for node in graph.get("nodes") or []]
+        index = {node_id: i for i, node_id in enumerate(ids)}
+        edges = graph.get("edges") or []
+        sources = [e["from"] for e in edges]
+        targets = [e["to"] for e in edges]
+        for end in sources + targets:  # tolerate edges whose endpoints weren't listed as nodes
+            if end not in index:
+                index[end] = len(ids)
+                ids.append(end)
+
+        n = len(ids)
+        rows = np.fromiter(map(index.__getitem__, sources), dtype=np.int64, count=len(edges))
+        cols = np.fromiter(map(index.__getitem__, targets), dtype=np.int64, count=len(edges))
+        weights = np.fromiter((e.get("weight") or 0 for e in edges), dtype=np.float64, count=len(edges))
+
+        self.ids = ids
+        self.index = index
+        # Duplicate (from, to) pairs are summed by the COO -> CSR conversion
+        self.weights = sparse.csr_matrix((weights, (rows, cols)), shape=(n, n))
+        self.adjacency = sparse.csr_matrix(
+            (np.ones(len(edges), dtype=np.float64), (rows, cols)), shape=(n, n)
+        )
+        self.adjacency.data[:] = 1.0
+        self.adjacency_t = self.adjacency.T.tocsr()
+
+        self.out_degree = np.diff(self.adjacency.indptr)
+        self.in_degree = np.diff(self.adjacency_t.indptr)
+        self.out_volume = np.asarray(self.weights.sum(axis=1)).ravel()
+        self.in_volume = np.asarray(self.weights.sum(axis=0)).ravel()
+        self._dominant_out = None
+
+    def dominant_out(self):
+        """Largest outgoing edge per node as (target index, weight); -1 where none."""
+        if self._dominant_out is None:
+            w = self.weights
+            nxt = np.full(self.size, -1, dtype=np.int64)
+            top = np.zeros(self.size)
+            rows = np.flatnonzero(np.diff(w.indptr))
+            if rows.size:
+                row_of = np.repeat(np.arange(self.size), np.diff(w.indptr))
+                order = np.lexsort((-w.data, row_of))  # by row, heaviest edge first
+                first = order[w.indptr[rows]]
+                nxt[rows] = w.indices[first]
+                top[rows] = w.data[first]
+            self._dominant_out = (nxt, top)
+        return self._dominant_out
+
+    @property
+    def size(self) -> int:
+        return len(self.ids)
+
+    def names(self, indices) -> list:
+        return [self.ids[i] for i in list(indices)[:MAX_REPORTED_NODES]]
+
+
+def _row_cv(matrix: sparse.csr_matrix, degree: np.ndarray, volume: np.ndarray) -> np.ndarray:
+    """Coefficient of variation of the non-zero entries of each row."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = volume / degree
+        sq_mean = np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel() / degree
+        std = np.sqrt(np.maximum(sq_mean - mean ** 2, 0.0))
+        return np.where(mean > 0, std / mean, np.inf)
+
+
+def _finding(pattern: str, severity: str, nodes: list, detail: str, **metrics) -> dict:
+    return {
+        "pattern": pattern,
+        "severity": severity,
+        "score": PATTERN_WEIGHTS[pattern],
+        "nodes": nodes,
+        "detail": detail,
+        "metrics": metrics,
+    }
+
+
+def detect_fan_patterns(fm: FlowMatrix, target_idx: int = None) -> list:
+    """Fan-out / fan-in smurfing: many counterparties with near-uniform amounts."""
+    findings = []
+    out_cv = _row_cv(fm.weights, fm.out_degree, fm.out_volume)
+    in_cv = _row_cv(fm.weights.T.tocsr(), fm.in_degree, fm.in_volume)
+
+    for pattern, degree, cv, direction in (
+        ("fan_out", fm.out_degree, out_cv, "sends to"),
+        ("fan_in", fm.in_degree, in_cv, "receives from"),
+    ):
+        hits = np.flatnonzero((degree >= FAN_DEGREE) & (cv <= FAN_UNIFORMITY_CV))
+        if hits.size == 0:
+            continue
+        hits = hits[np.argsort(-degree[hits])]
+        severity = "high" if target_idx is not None and target_idx in hits else "medium"
+        findings.append(_finding(
+            pattern, severity, fm.names(hits),
+            f"{hits.size} wallet(s) {direction} {FAN_DEGREE}+ counterparties in near-uniform amounts",
+            wallets=int(hits.size),
+            max_degree=int(degree[hits].max()),
+            min_cv=round(float(cv[hits].min()), 3),
+        ))
+    return findings
+
+
+def detect_scatter_gather(fm: FlowMatrix, target_idx: int) -> list:
+    """Funds fanned out by the target and re-collected two hops later."""
+    if target_idx is None:
+        return []
+    first_hop = fm.adjacency[target_idx]
+    paths = (first_hop @ fm.adjacency).toarray().ravel()
+    paths[target_idx] = 0
+    gather = np.flatnonzero(paths >= GATHER_PATHS)
+    if gather.size == 0:
+        return []
+    gather = gather[np.argsort(-paths[gather])]
+    return [_finding(
+        "scatter_gather", "high", fm.names(gather),
+        f"{gather.size} wallet(s) re-collect funds the target dispersed (up to {int(paths.max())} paths)",
+        gather_points=int(gather.size),
+        max_paths=int(paths.max()),
+    )]
+
+
+def detect_round_trips(fm: FlowMatrix, target_idx: int) -> list:
+    """Cycles: reciprocal pairs anywhere, and target -> ... -> target round trips."""
+    findings = []
+
+    reciprocal = fm.adjacency.multiply(fm.adjacency_t).tocoo()
+    mask = reciprocal.row < reciprocal.col
+    pairs = list(zip(reciprocal.row[mask], reciprocal.col[mask]))
+    if pairs:
+        nodes = sorted({i for pair in pairs for i in pair})
+        findings.append(_finding(
+            "reciprocal_flows", "low", fm.names(nodes),
+            f"{len(pairs)} wallet pair(s) send funds in both directions",
+            pairs=len(pairs),
+        ))
+
+    if target_idx is None:
+        return findings
+
+    # Self-loops are dropped and the target's column is zeroed, so paths can
+    # only come back to the target at their closing step
+    keep = np.ones(fm.size)
+    keep[target_idx] = 0.0
+    keep = sparse.diags(keep)
+    step = fm.adjacency.copy()
+    step.setdiag(0)
+    step.eliminate_zeros()
+    step_t = (step.T.tocsr() @ keep).tocsr()
+    step = (step @ keep).tocsr()
+    step.eliminate_zeros()
+    step_t.eliminate_zeros()
+    pays_target = np.zeros(fm.size, dtype=bool)
+    pays_target[fm.adjacency_t[target_idx].indices] = True
+    pays_target[target_idx] = False
+
+    exact = _simple_cycles(step, pays_target, target_idx)
+    if exact is not None:
+        cycles_by_length, on_cycle = exact
+    else:
+        cycles_by_length, on_cycle = _cycle_walks(fm, step, step_t, target_idx)
+    # Two-hop cycles (target -> x -> target) are the reciprocal pairs above
+    if cycles_by_length:
+        findings.append(_finding(
+            "round_trip", "high", fm.names(on_cycle),
+            f"Funds leave and return to the target through {on_cycle.size} intermediary wallet(s)",
+            cycles={str(k): v for k, v in sorted(cycles_by_length.items())},
+            intermediaries=int(on_cycle.size),
+        ))
+    return findings
+
+
+def _simple_cycles(step: sparse.csr_matrix, pays_target: np.ndarray, target_idx: int):
+    """Simple cycles target -> ... -> target of 3 to ROUND_TRIP_MAX_HOPS hops by
+    bounded depth-first search: ({length: count}, member indices), or None when
+    the search would visit more than ROUND_TRIP_SEARCH_BUDGET edges."""
+    indptr, indices = step.indptr, step.indices
+    counts = {}
+    members = set()
+    budget = ROUND_TRIP_SEARCH_BUDGET
+    path = [target_idx]
+    on_path = {target_idx}
+    stack = [iter(indices[indptr[target_idx]:indptr[target_idx + 1]])]
+    while stack:
+        node = next(stack[-1], None)
+        if node is None:
+            stack.pop()
+            on_path.discard(path.pop())
+            continue
+        budget -= 1
+        if budget < 0:
+            return None
+        if node in on_path:
+            continue
+        hops = len(path)  # edges up to and including this node
+        if hops >= 2 and pays_target[node]:
+            counts[hops + 1] = counts.get(hops + 1, 0) + 1
+            members.update(path[1:])
+            members.add(int(node))
+        if hops + 2 <= ROUND_TRIP_MAX_HOPS:
+            path.append(int(node))
+            on_path.add(int(node))
+            stack.append(iter(indices[indptr[node]:indptr[node + 1]]))
+    return counts, np.array(sorted(members), dtype=np.int64)
+
+
+def _cycle_walks(fm: FlowMatrix, step: sparse.csr_matrix, step_t: sparse.csr_matrix, target_idx: int):
+    """Fallback for graphs too dense to enumerate: cycle counts from sparse walk
+    products and members from exact-hop reachability, so a node is only listed
+    when it lies on a closed walk of 3 to ROUND_TRIP_MAX_HOPS hops."""
+    returns_to_target = fm.adjacency_t[target_idx]  # row: who pays the target
+    # Length-4 walks T->a->b->a->T revisit a; subtract them so 4-cycles are simple
+    two_way = np.asarray(fm.adjacency[target_idx].multiply(returns_to_target).todense()).ravel()
+    two_way[target_idx] = 0
+    reciprocal_degree = np.asarray(step.multiply(step_t).sum(axis=1)).ravel()
+    backtracks = {4: float(two_way @ reciprocal_degree)}
+
+    def levels(first, matrix):
+        # levels[k] = nodes reachable from the target in exactly k + 1 hops
+        out, frontier = [], first
+        for _ in range(ROUND_TRIP_MAX_HOPS - 1):
+            out.append(frontier.indices)
+            frontier = frontier @ matrix
+            frontier.data[:] = 1.0  # reachability only
+            frontier.eliminate_zeros()
+            if frontier.nnz == 0:
+                break
+        return out
+
+    cycles_by_length = {}
+    frontier = step[target_idx]
+    for hops in range(2, ROUND_TRIP_MAX_HOPS + 1):
+        closing = frontier.multiply(returns_to_target).sum() - backtracks.get(hops, 0)
+        if hops > 2 and closing > 0:
+            cycles_by_length[hops] = int(closing)
+        frontier = frontier @ step
+        frontier.data[:] = np.minimum(frontier.data, 1e6)  # path counts can explode
+        frontier.eliminate_zeros()
+        if frontier.nnz == 0:
+            break
+    if not cycles_by_length:
+        return {}, np.zeros(0, dtype=np.int64)
+
+    forward = levels(step[target_idx], step)
+    backward = levels(step_t[target_idx], step_t)
+    member = np.zeros(fm.size, dtype=bool)
+    for i, ahead in enumerate(forward, start=1):
+        for j, behind in enumerate(backward, start=1):
+            if 3 <= i + j <= ROUND_TRIP_MAX_HOPS:
+                member[np.intersect1d(ahead, behind)] = True
+    member[target_idx] = False
+    return cycles_by_length, np.flatnonzero(member)
+
+
+def _chains(fm: FlowMatrix, candidate: np.ndarray, next_hop: np.ndarray, min_length: int) -> list:
+    """Maximal chains following next_hop through candidate nodes (vectorized)."""
+    n = fm.size
+    nxt = np.where(candidate, next_hop, -1)
+    linked = nxt >= 0
+    nxt[linked] = np.where(candidate[nxt[linked]], nxt[linked], -1)
+
+    # Hops to the end of each chain by pointer jumping: O(log L) vectorized passes
+    dist = (nxt >= 0).astype(np.int64)
+    jump = nxt.copy()
+    for _ in range(max(1, int(np.ceil(np.log2(n + 1)))) + 1):
+        live = np.flatnonzero(jump >= 0)
+        if live.size == 0:
+            break
+        dist[live] += dist[jump[live]]
+        jump[live] = jump[jump[live]]
+    length = np.where(candidate, dist + 1, 0)
+
+    has_pred = np.zeros(n, dtype=bool)
+    has_pred[nxt[nxt >= 0]] = True
+    starts = np.flatnonzero(candidate & ~has_pred & (length >= min_length))
+
+    chains = []
+    for start in starts[np.argsort(-length[starts])][:10]:
+        chain, node, seen = [], start, set()
+        while node >= 0 and node not in seen and len(chain) < MAX_REPORTED_NODES:
+            seen.add(node)
+            chain.append(int(node))
+            node = nxt[node]
+        chains.append(chain)
+    return chains
+
+
+def detect_peel_chains(fm: FlowMatrix) -> list:
+    """Peel chains: single-input hops forwarding most funds on, peeling small change off."""
+    nxt, top = fm.dominant_out()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        forward_ratio = np.where(fm.in_volume > 0, top / fm.in_volume, 0.0)
+    candidate = (
+        (fm.in_degree == 1)
+        & (fm.out_degree >= 1) & (fm.out_degree <= 2)
+        & (forward_ratio >= PEEL_FORWARD_RATIO)
+    )
+    chains = _chains(fm, candidate, nxt, PEEL_MIN_LENGTH)
+    if not chains:
+        return []
+    longest = max(len(c) for c in chains)
+    return [_finding(
+        "peel_chain", "high" if longest >= 5 else "medium", fm.names(chains[0]),
+        f"{len(chains)} peel chain(s), longest {longest} hops",
+        chains=len(chains),
+        longest=longest,
+    )]
+
+
+def detect_layering(fm: FlowMatrix, target_idx: int = None) -> list:
+    """Layering through fresh pass-through wallets (one in, one out, ~all
+    forwarded) chained at least LAYERING_MIN_LENGTH deep."""
+    nxt, _ = fm.dominant_out()
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ratio = np.where(fm.in_volume > 0, fm.out_volume / fm.in_volume, 0.0)
+    # The single payer of each one-in wallet
+    source = np.full(fm.size, -1, dtype=np.int64)
+    one_in = np.flatnonzero(fm.in_degree == 1)
+    source[one_in] = fm.adjacency_t.indices[fm.adjacency_t.indptr[one_in]]
+    candidate = (
+        (fm.in_degree == 1) & (fm.out_degree == 1)
+        & (ratio >= PASS_THROUGH_RATIO) & (ratio <= 1.0 + 1e-9)
+        # Sending back to whoever paid you (e.g. trading with the target) is
+        # a reciprocal flow, not a layer
+        & (nxt != source)
+    )
+    if target_idx is not None:
+        # The analysed wallet closing a cycle is not one of its own layers
+        candidate[target_idx] = False
+    count = int(candidate.sum())
+    if count == 0:
+        return []
+    chains = _chains(fm, candidate, nxt, LAYERING_MIN_LENGTH)
+    if not chains:
+        return []
+    longest = max(len(c) for c in chains)
+    return [_finding(
+        "layering", "high" if longest >= 3 else "medium",
+        fm.names(chains[0]),
+        f"{count} pass-through wallet(s), deepest layer chain {longest} hops",
+        pass_through_wallets=count,
+        longest=longest,
+    )]
+
+
+def detect_laundering_patterns(graph: dict, target_address: str = None) -> dict:
+    """Run every detector and return structured findings plus a 0-100 risk contribution."""
+    started = time.perf_counter()
+    fm = FlowMatrix(graph)
+    target_idx = fm.index.get(target_address) if target_address else None
+
+    findings = []
+    if fm.size and fm.adjacency.nnz:
+        findings += detect_peel_chains(fm)
+        findings += detect_fan_patterns(fm, target_idx)
+        findings += detect_scatter_gather(fm, target_idx)
+        findings += detect_round_trips(fm, target_idx)
+        findings += detect_layering(fm, target_idx)
+
+    return {
+        "findings": findings,
+        "risk_score": min(100, sum(f["score"] for f in findings)),
+        "stats": {
+            "nodes": fm.size,
+            "edges": int(fm.adjacency.nnz),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        },
+    }
@@ -1,36 +1,158 @@
 import os, json
+import asyncio
+import math
+import time
 import requests
+import httpx
 
 from dotenv import load_dotenv
+from modules.cache import get_cache
+from modules.risk_model import blocksec_risk
 load_dotenv()
 
-METASLEUTH_API_KEY = os.getenv("METASLEUTH_API_KEY")
+METASLEUTH_API_KEY = os.getenv("METASLEUTH_API_KEY") or os.getenv("BLOCKSEC_API_KEY")
 REQUEST_TIMEOUT = 15
 HEADERS_METASLEUTH = {
     "Content-Type": "application/json",
     "x-api-key": METASLEUTH_API_KEY,
 }
+BLOCKSEC_RISK_URL = "https://aml.blocksec.com/address-compliance/api/v3/risk-score"
 
+# Counterparty scoring
+SCORE_MAX_CONCURRENCY = int(os.getenv("SCORE_MAX_CONCURRENCY", "5"))
+SCORE_DEADLINE = float(os.getenv("SCORE_DEADLINE", "8"))
+SCORE_CACHE_TTL = int(os.getenv("SCORE_CACHE_TTL", str(6 * 3600)))
+SCORE_NEGATIVE_TTL = int(os.getenv("SCORE_NEGATIVE_TTL", "300"))
+SCORE_TOP_COUNTERPARTIES = int(os.getenv("SCORE_TOP_COUNTERPARTIES", "10"))
 
-def fetch_wallet_score(wallet_addr: str):
+_score_cache = get_cache("blocksec_scores", maxsize=50000)
+
+
+def detect_chain_id(wallet_addr: str) -> int:
     # Deteksi chain berdasarkan format address
     if wallet_addr.startswith("0x") and len(wallet_addr) == 42:
-        chain_id = 1
-    elif len(wallet_addr) == 44:
-        chain_id = -3
-    else:
-        raise ValueError("Unsupported wallet address format")
-    
-    print(chain_id)
+        return 1
+    if 32 <= len(wallet_addr) <= 44:
+        return -3
+    raise ValueError("Unsupported wallet address format")
+
+
+def _score_request(wallet_addr: str) -> dict:
+    return {
+        "chain_id": detect_chain_id(wallet_addr),
+        "address": wallet_addr,
+        "interaction_risk": True,
+    }
+
+
+def fetch_wallet_score(wallet_addr: str):
     response = requests.post(
-        "https://aml.blocksec.com/address-compliance/api/v3/risk-score",
+        BLOCKSEC_RISK_URL,
         headers={"API-KEY":METASLEUTH_API_KEY,"Content-Type":"application/json"},
-        data=json.dumps({
-        "chain_id": chain_id,
-        "address": wallet_addr,
-        "interaction_risk": True
-        })
+        data=json.dumps(_score_request(wallet_addr)),
+        timeout=REQUEST_TIMEOUT,
     )
 
     data = response.json()
     return data
+
+
+async def _fetch_score_cached(client: httpx.AsyncClient, wallet_addr: str, semaphore: asyncio.Semaphore):
+    cached = _score_cache.get(wallet_addr)
+    if cached is not None:
+        return cached
+
+    async with semaphore:
+        try:
+            response = await client.post(
+                BLOCKSEC_RISK_URL,
+                headers={"API-KEY": METASLEUTH_API_KEY, "Content-Type": "application/json"},
+                json=_score_request(wallet_addr),
+            )
+            response.raise_for_status()
+            data = response.json()
+            if math.isnan(blocksec_risk(data)):
+                # A 200 without a score (quota, error envelope) is a failure too
+                raise ValueError(f"no risk score in response: {str(data)[:200]}")
+            entry = {"ok": True, "data": data}
+            ttl = SCORE_CACHE_TTL
+        except (httpx.HTTPError, ValueError) as e:
+            # Remember failures briefly so a broken address isn't retried per request
+            entry = {"ok": False, "error": str(e) or type(e).__name__}
+            ttl = SCORE_NEGATIVE_TTL
+
+    _score_cache.set(wallet_addr, entry, ttl)
+    return entry
+
+
+async def score_addresses(addresses, deadline: float = SCORE_DEADLINE,
+                          max_concurrency: int = SCORE_MAX_CONCURRENCY,
+                          client: httpx.AsyncClient = None) -> dict:
+    """Score many addresses against Blocksec under a hard deadline.
+
+    Results come from a positive/negative TTL cache when possible; the rest
+    are fetched with at most `max_concurrency` requests in flight. Anything
+    still running when `deadline` seconds have passed is cancelled and listed
+    in "timed_out", so callers always get partial scores on time.
+    """
+    wanted = list(dict.fromkeys(a for a in addresses if a))
+    result = {"scores": {}, "errors": {}, "timed_out": []}
+    if not wanted:
+        return result
+
+    own_client = client is None
+    if own_client:
+        client = httpx.AsyncClient(timeout=REQUEST_TIMEOUT)
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+    started = time.monotonic()
+    tasks = {asyncio.ensure_future(_fetch_score_cached(client, a, semaphore)): a for a in wanted}
+    try:
+        done, pending = await asyncio.wait(tasks, timeout=max(0.0, deadline))
+        for task in pending:
+            task.cancel()
+            result["timed_out"].append(tasks[task])
+        for task in done:
+            address = tasks[task]
+            try:
+                entry = task.result()
+            except Exception as e:
+                result["errors"][address] = str(e)
+                continue
+            if entry["ok"]:
+                result["scores"][address] = entry["data"]
+            else:
+                result["errors"][address] = entry["error"]
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+    finally:
+        if own_client:
+            await client.aclose()
+    result["elapsed"] = round(time.monotonic() - started, 3)
+    return result
+
+
+def top_counterparties(graph: dict, address: str, limit: int = SCORE_TOP_COUNTERPARTIES) -> list:
+    """Counterparties of `address` in a build_transaction_graph result, by volume."""
+    volume = {}
+    for edge in graph.get("edges") or []:
+        if edge["from"] == address:
+            other = edge["to"]
+        elif edge["to"] == address:
+            other = edge["from"]
+        else:
+            continue
+        volume[other] = volume.get(other, 0) + edge.get("weight", 0)
+    program_ids = {n["id"] for n in graph.get("nodes") or [] if n.get("account_type") == "program"}
+    ranked = sorted((a for a in volume if a not in program_ids), key=volume.get, reverse=True)
+    return ranked[:limit]
+
+
+async def score_target_and_counterparties(address: str, graph: dict = None,
+                                          limit: int = SCORE_TOP_COUNTERPARTIES,
+                                          deadline: float = SCORE_DEADLINE,
+                                          client: httpx.AsyncClient = None) -> dict:
+    counterparties = top_counterparties(graph, address, limit) if graph else []
+    result = await score_addresses([address] + counterparties, deadline=deadline, client=client)
+    result["target"] = result["scores"].get(address)
+    result["counterparties"] = {a: result["scores"][a] for a in counterparties if a in result["scores"]}
+    return result
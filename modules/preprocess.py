@@ -1,18 +1,25 @@
 import json
 import time
 
-def summarize_tx_for_llm(tx_json):
+from modules.transactions import normalize_transactions
+
+def summarize_tx_for_llm(tx):
+    """Compact LLM view of a normalized Transaction (raw JSON is not carried)."""
     s = {}
-    s["signature"] = tx_json.get("signature") or tx_json.get("txHash") or tx_json.get("id")
-    s["blockTime"] = tx_json.get("blockTime")
-    s["instructions"] = tx_json.get("instructions") or tx_json.get("parsed", {}).get("instructions") or []
-    s["tokenTransfers"] = tx_json.get("tokenTransfers") or []
-    s["accounts"] = tx_json.get("accounts") or tx_json.get("accountKeys") or []
-    s["raw"] = tx_json
+    s["signature"] = tx.signature
+    s["blockTime"] = int(tx.timestamp) if tx.timestamp else None
+    s["type"] = tx.type
+    s["failed"] = tx.failed
+    s["programs"] = list(tx.program_ids)
+    s["nativeTransfers"] = [t.to_dict() for t in tx.native_transfers]
+    s["tokenTransfers"] = [t.to_dict() for t in tx.token_transfers]
+    s["accounts"] = list(tx.accounts)
+    if tx.description:
+        s["description"] = tx.description
     return s
 
 def aggregate_context(helius_txs, metasleuth_score, target_address, extra_notes=None):
-    summarized = [summarize_tx_for_llm(tx) for tx in helius_txs]
+    summarized = [summarize_tx_for_llm(tx) for tx in normalize_transactions(helius_txs)]
     context = {
         "target_address": target_address,
         "helix_tx_count": len(summarized),
@@ -22,3 +29,17 @@ def aggregate_context(helius_txs, metasleuth_score, target_address, extra_notes=
         "fetched_at": int(time.time())
     }
     return json.dumps(context, indent=2, default=str)
+
+
+def build_shard_context(shard_txs, metasleuth_score, target_address, shard_label, extra_notes=None):
+    """Compact context for one map-reduce shard (summaries already built)."""
+    context = {
+        "target_address": target_address,
+        "shard": shard_label,
+        "helix_tx_count": len(shard_txs),
+        "txs": shard_txs,
+        "metasleuth": metasleuth_score,
+        "notes": extra_notes,
+        "fetched_at": int(time.time())
+    }
+    return json.dumps(context, separators=(",", ":"), default=str)
@@ -0,0 +1,65 @@
+# Solana public key helpers (base58 + ed25519 curve check)
+
+B58_ALPHABET = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+_B58_INDEX = {c: i for i, c in enumerate(B58_ALPHABET)}
+
+# ed25519 field prime and curve constant d = -121665 / 121666
+_P = 2**255 - 19
+_D = (-121665 * pow(121666, _P - 2, _P)) % _P
+
+
+def b58decode(value: str) -> bytes:
+    num = 0
+    for char in value:
+        try:
+            num = num * 58 + _B58_INDEX[char]
+        except KeyError:
+            raise ValueError(f"Invalid base58 character: {char!r}")
+    body = num.to_bytes((num.bit_length() + 7) // 8, "big") if num else b""
+    pad = len(value) - len(value.lstrip("1"))
+    return b"\x00" * pad + body
+
+
+def b58encode(data: bytes) -> str:
+    num = int.from_bytes(data, "big")
+    out = []
+    while num:
+        num, rem = divmod(num, 58)
+        out.append(B58_ALPHABET[rem])
+    pad = len(data) - len(data.lstrip(b"\x00"))
+    return "1" * pad + "".join(reversed(out))
+
+
+def decode_pubkey(address: str) -> bytes:
+    """Decode a base58 address into its 32-byte public key."""
+    raw = b58decode(address)
+    if len(raw) != 32:
+        raise ValueError(f"Invalid Solana address length: {address}")
+    return raw
+
+
+def is_valid_pubkey(address: str) -> bool:
+    try:
+        decode_pubkey(address)
+        return True
+    except ValueError:
+        return False
+
+
+def is_on_curve(address: str) -> bool:
+    """True if the key is a valid ed25519 point, i.e. could have a private key.
+
+    Program derived addresses are deliberately off the curve, so this is the
+    same test `PublicKey.isOnCurve` uses to tell PDAs from wallets.
+    """
+    raw = decode_pubkey(address)
+    y = int.from_bytes(raw, "little") & ((1 << 255) - 1)
+    if y >= _P:
+        return False
+    y2 = y * y % _P
+    u = (y2 - 1) % _P
+    v = (_D * y2 + 1) % _P
+    x2 = u * pow(v, _P - 2, _P) % _P
+    if x2 == 0:
+        return not raw[31] >> 7
+    return pow(x2, (_P - 1) // 2, _P) == 1
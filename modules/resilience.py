@@ -0,0 +1,270 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Hedged requests and circuit breakers for upstream APIs (Helius RPC and REST).
+#
+# Hedging: a call that is still running after the HEDGE_PERCENTILE latency of
+# recent calls with the same name gets a duplicate, and whichever answers
+# first wins. Hedges are capped at HEDGE_BUDGET of all calls so a slow
+# upstream is never hit with double traffic.
+#
+# Circuit breakers: after BREAKER_FAILURES consecutive failures a breaker
+# opens and calls fail fast with CircuitOpenError for BREAKER_RESET_TIMEOUT
+# seconds; then a single probe is let through (half-open) and its result
+# closes or re-opens the breaker. Callers pass one breaker per RPC method or
+# endpoint plus one for the whole host and fall back to cached or degraded
+# data when a call is refused.
+
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_BUDGET = float(os.getenv("HEDGE_BUDGET", "0.1"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.05"))
+# Used until a call name has HEDGE_MIN_SAMPLES latencies recorded
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "1.0"))
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MAX_WORKERS = int(os.getenv("HEDGE_MAX_WORKERS", "32"))
+LATENCY_WINDOW = 256
+
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_RESET_TIMEOUT = float(os.getenv("BREAKER_RESET_TIMEOUT", "30"))
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class UpstreamError(Exception):
+    """A retriable upstream failure (5xx / 429) that should count against breakers."""
+
+
+class LatencyTracker:
+    """Sliding window of recent latencies for one call name."""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, p: float):
+        with self._lock:
+            if len(self._samples) < HEDGE_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+    def hedge_delay(self) -> float:
+        threshold = self.percentile(HEDGE_PERCENTILE)
+        return HEDGE_DEFAULT_DELAY if threshold is None else max(HEDGE_MIN_DELAY, threshold)
+
+
+class HedgeBudget:
+    """Allows at most `ratio` hedges per call (plus a small burst)."""
+
+    def __init__(self, ratio: float = HEDGE_BUDGET, burst: int = 3):
+        self.ratio = ratio
+        self.burst = burst
+        self.calls = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def record_call(self):
+        with self._lock:
+            self.calls += 1
+            if self.calls >= 10000:
+                # Decay so the budget tracks recent traffic
+                self.calls //= 2
+                self.hedges //= 2
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self.hedges >= self.ratio * self.calls + self.burst:
+                return False
+            self.hedges += 1
+            return True
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failures
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                return True
+            return False
+
+    def abort_probe(self):
+        """Give back a half-open probe slot that was not used."""
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"state": self.state, "failures": self.failures}
+
+
+_registry_lock = threading.Lock()
+_breakers = {}
+_latencies = {}
+_budget = HedgeBudget()
+_executor = None
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    with _registry_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(name)
+        return _breakers[name]
+
+
+def get_latency(name: str) -> LatencyTracker:
+    with _registry_lock:
+        if name not in _latencies:
+            _latencies[name] = LatencyTracker()
+        return _latencies[name]
+
+
+def breaker_states() -> dict:
+    with _registry_lock:
+        breakers = list(_breakers.values())
+    return {b.name: b.snapshot() for b in breakers}
+
+
+def _hedge_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _registry_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=HEDGE_MAX_WORKERS, thread_name_prefix="hedge")
+        return _executor
+
+
+def _acquire(breaker_names) -> list:
+    acquired = []
+    for name in breaker_names:
+        breaker = get_breaker(name)
+        if not breaker.allow():
+            for b in acquired:
+                b.abort_probe()
+            raise CircuitOpenError(f"circuit open: {name}")
+        acquired.append(breaker)
+    return acquired
+
+
+def _settle(breakers, error, is_failure):
+    failed = error is not None and (is_failure is None or is_failure(error))
+    for breaker in breakers:
+        if failed:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+
+
+def call(name: str, fn, breakers=(), is_failure=None):
+    """Run `fn()` hedged under `name`, gated by the named circuit breakers.
+
+    `is_failure(exc)` decides whether an exception counts against the
+    breakers (default: every exception does).
+    """
+    gates = _acquire(breakers)
+    _budget.record_call()
+    tracker = get_latency(name)
+    started = time.monotonic()
+    try:
+        result = _hedged(fn, tracker.hedge_delay())
+    except Exception as e:
+        _settle(gates, e, is_failure)
+        raise
+    _settle(gates, None, is_failure)
+    tracker.record(time.monotonic() - started)
+    return result
+
+
+def _hedged(fn, delay: float):
+    executor = _hedge_executor()
+    futures = [executor.submit(fn)]
+    done, _ = wait(futures, timeout=delay)
+    if not done and _budget.try_spend():
+        futures.append(executor.submit(fn))
+    error = None
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            try:
+                result = future.result()
+            except Exception as e:
+                error = e
+                continue
+            for other in pending:
+                other.cancel()
+            return result
+    raise error
+
+
+async def call_async(name: str, factory, breakers=(), is_failure=None):
+    """Async `call`: `factory()` returns a fresh awaitable per attempt."""
+    gates = _acquire(breakers)
+    _budget.record_call()
+    tracker = get_latency(name)
+    started = time.monotonic()
+    try:
+        result = await _hedged_async(factory, tracker.hedge_delay())
+    except asyncio.CancelledError:
+        for breaker in gates:
+            breaker.abort_probe()
+        raise
+    except Exception as e:
+        _settle(gates, e, is_failure)
+        raise
+    _settle(gates, None, is_failure)
+    tracker.record(time.monotonic() - started)
+    return result
+
+
+async def _hedged_async(factory, delay: float):
+    tasks = [asyncio.ensure_future(factory())]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if not done and _budget.try_spend():
+            tasks.append(asyncio.ensure_future(factory()))
+        error = None
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                return await next_done
+            except Exception as e:
+                error = e
+        raise error
+    finally:
+        # The losing attempt is cancelled, closing its connection
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,204 @@
+# Local fast-path risk model
+#
+# A small logistic model scored on CPU from features the pipeline already has
+# (pattern analysis, laundering detectors, graph summary, Blocksec scores).
+# Clear-cut low-risk wallets skip the LLM; uncertain or high-risk ones still
+# get the full AI analysis. Model weights live in versioned JSON files under
+# modules/models/ (override with RISK_MODEL_PATH). Until a model file is
+# marked "fitted" (train_risk_model output), its weights are hand-set priors
+# and wallets missing any Blocksec score always go to the LLM. The shipped
+# model is not fitted, so without a Blocksec key the fast path never skips
+# the LLM; train a model on labelled verdicts to enable it.
+import json
+import math
+import os
+
+import numpy as np
+
+DEFAULT_MODEL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "models", "risk_model_v1.json")
+RISK_MODEL_PATH = os.getenv("RISK_MODEL_PATH", DEFAULT_MODEL_PATH)
+
+FEATURE_NAMES = [
+    "log_tx_count",
+    "log_unique_counterparts",
+    "large_tx_ratio",
+    "rapid_tx_ratio",
+    "laundering_score",
+    "high_severity_findings",
+    "log_graph_nodes",
+    "log_total_volume",
+    "blocksec_target_risk",
+    "blocksec_missing",
+    "blocksec_max_counterparty_risk",
+]
+
+
+def blocksec_risk(score) -> float:
+    """0-1 risk from a Blocksec response, or NaN when it carries no score."""
+    if not isinstance(score, dict):
+        return math.nan
+    for source in (score, score.get("data") if isinstance(score.get("data"), dict) else {}):
+        for key in ("risk_score", "score", "riskScore"):
+            value = source.get(key)
+            if isinstance(value, (int, float)):
+                return max(0.0, min(1.0, value / 100.0 if value > 1 else float(value)))
+    return math.nan
+
+
+def extract_features(pattern_analysis: dict, transaction_graph: dict = None,
+                     laundering: dict = None, counterparty_risk: dict = None) -> dict:
+    """Model features, plus "blocksec_unscored" (not a model input): how many
+    addresses sent to Blocksec came back without a score."""
+    patterns = pattern_analysis.get("patterns") or {}
+    if not isinstance(patterns, dict):
+        patterns = {}
+    total = patterns.get("total_transactions", 0) or 0
+    summary = (transaction_graph or {}).get("summary") or {}
+    findings = (laundering or {}).get("findings") or []
+
+    target_risk = blocksec_risk((counterparty_risk or {}).get("target"))
+    cp_risks = [blocksec_risk(s) for s in ((counterparty_risk or {}).get("counterparties") or {}).values()]
+    cp_risks = [r for r in cp_risks if not math.isnan(r)]
+
+    return {
+        "log_tx_count": math.log1p(total),
+        "log_unique_counterparts": math.log1p(patterns.get("unique_counterparts", 0) or 0),
+        "large_tx_ratio": len(patterns.get("large_transactions") or []) / total if total else 0.0,
+        "rapid_tx_ratio": len(patterns.get("rapid_transactions") or []) / total if total else 0.0,
+        "laundering_score": ((laundering or {}).get("risk_score", 0) or 0) / 100.0,
+        "high_severity_findings": float(sum(1 for f in findings if f.get("severity") == "high")),
+        "log_graph_nodes": math.log1p(summary.get("total_nodes", 0) or 0),
+        "log_total_volume": math.log1p(max(0.0, summary.get("total_volume", 0) or 0)),
+        "blocksec_target_risk": 0.0 if math.isnan(target_risk) else target_risk,
+        "blocksec_missing": 1.0 if math.isnan(target_risk) else 0.0,
+        "blocksec_max_counterparty_risk": max(cp_risks, default=0.0),
+        "blocksec_unscored": float(
+            len((counterparty_risk or {}).get("timed_out") or []) + len((counterparty_risk or {}).get("errors") or {})
+        ),
+    }
+
+
+class RiskModel:
+    def __init__(self, spec: dict):
+        missing = [f for f in FEATURE_NAMES if f not in spec["features"]]
+        if missing:
+            raise ValueError(f"Risk model {spec.get('version')} lacks features: {missing}")
+        self.spec = spec
+        self.version = spec["version"]
+        self.features = list(spec["features"])
+        self.mean = np.asarray(spec["mean"], dtype=np.float64)
+        self.scale = np.asarray(spec["scale"], dtype=np.float64)
+        self.coef = np.asarray(spec["coef"], dtype=np.float64)
+        self.intercept = float(spec["intercept"])
+        self.calibration = spec.get("calibration") or {"a": 1.0, "b": 0.0}
+        self.thresholds = spec["thresholds"]
+        self.fitted = bool(spec.get("fitted", False))
+
+    @classmethod
+    def load(cls, path: str = RISK_MODEL_PATH) -> "RiskModel":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def matrix(self, rows) -> np.ndarray:
+        return np.array([[row.get(name, 0.0) for name in self.features] for row in rows], dtype=np.float64)
+
+    def predict_batch(self, rows) -> np.ndarray:
+        """Calibrated risk probabilities for a list of feature dicts (or a matrix)."""
+        X = rows if isinstance(rows, np.ndarray) else self.matrix(rows)
+        if X.size == 0:
+            return np.zeros(0)
+        z = ((X - self.mean) / self.scale) @ self.coef + self.intercept
+        z = self.calibration["a"] * z + self.calibration["b"]
+        return 1.0 / (1.0 + np.exp(-z))
+
+    def assess_batch(self, rows) -> list:
+        low, high = self.thresholds["low"], self.thresholds["high"]
+        min_confidence = self.thresholds["min_confidence"]
+        matrix = rows if isinstance(rows, np.ndarray) else self.matrix(rows)
+        if self.fitted or isinstance(rows, np.ndarray):
+            unscored = [False] * len(matrix)
+        else:
+            # Hand-set weights cannot tell how much a missing score matters
+            unscored = [bool(row.get("blocksec_missing")) or row.get("blocksec_unscored", 0) > 0 for row in rows]
+        results = []
+        for p, missing_score in zip(self.predict_batch(matrix), unscored):
+            p = float(p)
+            # Distance from the nearest decision threshold, scaled to 0-1
+            if p <= low:
+                confidence = 1.0 - p / low if low else 1.0
+            elif p >= high:
+                confidence = (p - high) / (1.0 - high) if high < 1 else 1.0
+            else:
+                confidence = 0.0
+            confidence = 0.5 + 0.5 * confidence
+            clear_low = p <= low and confidence >= min_confidence
+            results.append({
+                "risk_probability": round(p, 4),
+                "risk_score": int(round(p * 100)),
+                "risk_level": "low" if p <= low else "high" if p >= high else "medium",
+                "confidence": round(confidence, 4),
+                "use_llm": not clear_low or missing_score,
+                "model_version": self.version,
+                "model_fitted": self.fitted,
+            })
+        return results
+
+    def assess(self, features: dict) -> dict:
+        return self.assess_batch([features])[0]
+
+
+_models = {}
+
+
+def get_model(path: str = RISK_MODEL_PATH) -> RiskModel:
+    if path not in _models:
+        _models[path] = RiskModel.load(path)
+    return _models[path]
+
+
+def train_risk_model(rows, labels, version: str, out_path: str, epochs: int = 500, lr: float = 0.1,
+                     l2: float = 1e-3, base_path: str = RISK_MODEL_PATH) -> dict:
+    """Fit a new model version from labelled feature dicts (1 = malicious).
+
+    Standardizes features, fits logistic regression by batch gradient descent,
+    then Platt-calibrates on the training logits. Thresholds carry over from
+    the base model file.
+    """
+    base = RiskModel.load(base_path)
+    X = np.array([[row.get(name, 0.0) for name in FEATURE_NAMES] for row in rows], dtype=np.float64)
+    y = np.asarray(labels, dtype=np.float64)
+    mean = X.mean(axis=0)
+    scale = X.std(axis=0)
+    scale[scale == 0] = 1.0
+    Xs = (X - mean) / scale
+
+    w = np.zeros(Xs.shape[1])
+    b = 0.0
+    for _ in range(epochs):
+        p = 1.0 / (1.0 + np.exp(-(Xs @ w + b)))
+        grad = p - y
+        w -= lr * (Xs.T @ grad / len(y) + l2 * w)
+        b -= lr * grad.mean()
+
+    z = Xs @ w + b
+    a, c = 1.0, 0.0
+    for _ in range(epochs):
+        p = 1.0 / (1.0 + np.exp(-(a * z + c)))
+        a -= lr * ((p - y) * z).mean()
+        c -= lr * (p - y).mean()
+
+    spec = {
+        **base.spec,
+        "version": version,
+        "description": f"Trained on {len(y)} labelled wallets",
+        "fitted": True,
+        "features": FEATURE_NAMES,
+        "mean": mean.round(6).tolist(),
+        "scale": scale.round(6).tolist(),
+        "coef": w.round(6).tolist(),
+        "intercept": round(float(b), 6),
+        "calibration": {"a": round(a, 6), "b": round(c, 6)},
+    }
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(spec, f, indent=2)
+    return spec
@@ -0,0 +1,273 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from modules.address_resolver import KNOWN_PROGRAMS
+
+# Counterparty / mint similarity index ("which wallets behave like this one?")
+#
+# Every analyzed wallet is reduced to two MinHash signatures of NUM_PERM
+# uint32 values, one over its counterparty set and one over the mints it
+# moved. Signatures are split into LSH_BANDS bands; wallets sharing any band
+# are candidates, and candidates are ranked by the fraction of matching
+# signature values (an estimate of Jaccard similarity). Everything lives in
+# one SQLite file (WAL, shared by all workers): a wallets table with the
+# 256-byte signatures and a WITHOUT ROWID (band key, wallet id) table, so
+# re-indexing a wallet only rewrites its own rows and a query is a few dozen
+# index probes plus one vectorized comparison.
+
+SIMILARITY_DB = os.getenv(
+    "SENTRYSOL_SIMILARITY_DB",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "similarity.sqlite3"),
+)
+NUM_PERM = 64
+LSH_BANDS = 16  # 4 rows per band: wallets above ~0.5 Jaccard almost always collide
+MAX_BUCKET_CANDIDATES = 2000  # larger buckets (exchanges, popular pools) are skipped
+MIN_SET_SIZE = 2
+# by="both": a few popular mints (USDC, wSOL) are shared by most wallets, so
+# mint similarity only counts for wallets holding at least MIN_MINT_SET mints
+# and weighs MINT_WEIGHT against counterparty similarity's 1
+MIN_MINT_SET = 4
+MINT_WEIGHT = 0.25
+
+FEATURE_SETS = ("counterparties", "mints")
+
+# Fixed seeds: signatures must stay comparable across processes and restarts
+_SEEDS = np.random.default_rng(0x5E1175).integers(0, 2 ** 63, NUM_PERM, dtype=np.uint64)
+_ROWS = NUM_PERM // LSH_BANDS
+
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer; uint64 arithmetic wraps
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def minhash(tokens):
+    """NUM_PERM uint32 MinHash signature of a set of strings (None if too small)."""
+    tokens = sorted(set(tokens))
+    if len(tokens) < MIN_SET_SIZE:
+        return None
+    hashes = np.frombuffer(
+        b"".join(hashlib.blake2b(t.encode(), digest_size=8).digest() for t in tokens), dtype="<u8"
+    )
+    mixed = _mix(hashes[:, None] ^ _SEEDS[None, :])
+    return (mixed.min(axis=0) >> np.uint64(32)).astype(np.uint32)
+
+
+def _band_keys(feature: int, signature: np.ndarray) -> list:
+    keys = []
+    for band in range(LSH_BANDS):
+        chunk = signature[band * _ROWS:(band + 1) * _ROWS].tobytes()
+        digest = hashlib.blake2b(bytes((feature, band)) + chunk, digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "little", signed=True))
+    return keys
+
+
+def wallet_feature_sets(address: str, transactions, graph: dict = None) -> tuple:
+    """(counterparties, mints) of a wallet from its normalized transactions and
+    transaction graph; programs are left out since nearly every wallet shares them."""
+    programs = set(KNOWN_PROGRAMS)
+    programs.update(n["id"] for n in (graph or {}).get("nodes") or [] if n.get("account_type") == "program")
+    counterparties = {n["id"] for n in (graph or {}).get("nodes") or []}
+    mints = set()
+    for tx in transactions:
+        for transfer in tx.token_transfers:
+            counterparties.update((transfer.from_address, transfer.to_address))
+            if transfer.mint:
+                mints.add(transfer.mint)
+    counterparties.discard(address)
+    counterparties.discard(None)
+    return counterparties - programs, mints
+
+
+class SimilarityIndex:
+    def __init__(self, path: str = SIMILARITY_DB):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS wallets ("
+            "id INTEGER PRIMARY KEY, address TEXT NOT NULL UNIQUE, "
+            "counterparties BLOB, mints BLOB, counterparty_count INTEGER, mint_count INTEGER, "
+            "updated_at REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS lsh (key INTEGER NOT NULL, id INTEGER NOT NULL, "
+            "PRIMARY KEY (key, id)) WITHOUT ROWID"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM wallets").fetchone()[0]
+
+    def add(self, address: str, counterparties, mints=()) -> bool:
+        return self.add_many([(address, counterparties, mints)]) == 1
+
+    def add_many(self, wallets) -> int:
+        """Index or re-index wallets given as (address, counterparties, mints);
+        returns how many had enough data to be indexed."""
+        prepared = []
+        for address, counterparties, mints in wallets:
+            counterparties, mints = set(counterparties), set(mints or ())
+            signatures = [minhash(counterparties), minhash(mints)]
+            if signatures[0] is None and signatures[1] is None:
+                continue
+            prepared.append((address, signatures, len(counterparties), len(mints)))
+        if not prepared:
+            return 0
+
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for address, signatures, cp_count, mint_count in prepared:
+                old = conn.execute(
+                    "SELECT id, counterparties, mints FROM wallets WHERE address = ?", (address,)
+                ).fetchone()
+                blobs = [s.tobytes() if s is not None else None for s in signatures]
+                if old:
+                    wallet_id = old[0]
+                    stale = self._keys_for(old[1:])
+                    conn.executemany("DELETE FROM lsh WHERE key = ? AND id = ?", [(k, wallet_id) for k in stale])
+                    conn.execute(
+                        "UPDATE wallets SET counterparties = ?, mints = ?, counterparty_count = ?, "
+                        "mint_count = ?, updated_at = ? WHERE id = ?",
+                        (blobs[0], blobs[1], cp_count, mint_count, now, wallet_id),
+                    )
+                else:
+                    wallet_id = conn.execute(
+                        "INSERT INTO wallets (address, counterparties, mints, counterparty_count, mint_count, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        (address, blobs[0], blobs[1], cp_count, mint_count, now),
+                    ).lastrowid
+                conn.executemany(
+                    "INSERT OR IGNORE INTO lsh (key, id) VALUES (?, ?)",
+                    [(k, wallet_id) for k in self._keys_for(blobs)],
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(prepared)
+
+    @staticmethod
+    def _keys_for(blobs) -> list:
+        keys = []
+        for feature, blob in enumerate(blobs):
+            if blob is not None:
+                keys.extend(_band_keys(feature, np.frombuffer(blob, dtype=np.uint32)))
+        return keys
+
+    def similar(self, address: str, limit: int = 20, by: str = "counterparties", min_similarity: float = 0.0):
+        """Nearest indexed wallets to `address`, or None if it is not indexed.
+
+        `by` is "counterparties", "mints" or "both" (counterparty similarity
+        blended with MINT_WEIGHT of mint similarity when both wallets hold at
+        least MIN_MINT_SET mints).
+        """
+        started = time.perf_counter()
+        features = FEATURE_SETS if by == "both" else (by,)
+        if any(f not in FEATURE_SETS for f in features):
+            raise ValueError(f"Unknown similarity feature: {by}")
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT id, counterparties, mints, mint_count FROM wallets WHERE address = ?", (address,)
+        ).fetchone()
+        if row is None:
+            return None
+        wallet_id = row[0]
+        query = {f: row[1 + FEATURE_SETS.index(f)] for f in features}
+        if by == "both" and (row[3] or 0) < MIN_MINT_SET:
+            query["mints"] = None
+
+        candidates = set()
+        skipped_buckets = 0
+        for feature, blob in query.items():
+            if blob is None:
+                continue
+            for key in _band_keys(FEATURE_SETS.index(feature), np.frombuffer(blob, dtype=np.uint32)):
+                # A bucket this full is a hub everyone shares, not a similarity
+                # signal; skipping it whole keeps results independent of row order
+                ids = [r[0] for r in conn.execute(
+                    "SELECT id FROM lsh WHERE key = ? ORDER BY id LIMIT ?", (key, MAX_BUCKET_CANDIDATES + 1)
+                )]
+                if len(ids) > MAX_BUCKET_CANDIDATES:
+                    skipped_buckets += 1
+                    continue
+                candidates.update(ids)
+        candidates.discard(wallet_id)
+
+        rows = []
+        ids = sorted(candidates)
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            rows.extend(conn.execute(
+                f"SELECT address, counterparties, mints, counterparty_count, mint_count FROM wallets "
+                f"WHERE id IN ({','.join('?' * len(chunk))})", chunk
+            ).fetchall())
+
+        scores = {}
+        for feature, blob in query.items():
+            column = 1 + FEATURE_SETS.index(feature)
+            present = [
+                i for i, r in enumerate(rows)
+                if r[column] is not None and not (by == "both" and feature == "mints" and (r[4] or 0) < MIN_MINT_SET)
+            ]
+            if blob is None or not present:
+                continue
+            matrix = np.frombuffer(b"".join(rows[i][column] for i in present), dtype=np.uint32).reshape(-1, NUM_PERM)
+            similarity = (matrix == np.frombuffer(blob, dtype=np.uint32)).mean(axis=1)
+            scores[feature] = dict(zip(present, similarity.tolist()))
+
+        neighbors = []
+        for i, r in enumerate(rows):
+            per_feature = {f: scores[f][i] for f in scores if i in scores[f]}
+            if not per_feature:
+                continue
+            weights = {f: MINT_WEIGHT if by == "both" and f == "mints" else 1.0 for f in per_feature}
+            similarity = sum(per_feature[f] * w for f, w in weights.items()) / sum(weights.values())
+            if similarity < min_similarity:
+                continue
+            neighbors.append({
+                "address": r[0],
+                "similarity": round(similarity, 4),
+                **{f"{f}_similarity": round(v, 4) for f, v in per_feature.items()},
+                "counterparty_count": r[3],
+                "mint_count": r[4],
+            })
+        neighbors.sort(key=lambda n: (-n["similarity"], n["address"]))
+        return {
+            "address": address,
+            "by": by,
+            "neighbors": neighbors[:limit],
+            "candidates": len(rows),
+            "skipped_buckets": skipped_buckets,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 2),
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_similarity_index() -> SimilarityIndex:
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = SimilarityIndex()
+        return _index
@@ -0,0 +1,393 @@
+# Multi-resolution temporal activity index per wallet
+#
+# Keeps, for every ingested wallet, in one SQLite file (WAL, shared by all
+# workers):
+#   - a txs table of (address, signature, timestamp, SOL volume touching the
+#     wallet), indexed by (address, timestamp);
+#   - a buckets table of minute / hour / day (count, volume) histograms.
+# Transactions are folded in incrementally inside one BEGIN IMMEDIATE
+# transaction: signatures already stored are skipped and only the buckets the
+# new rows fall into are upserted, so an update costs the size of the new
+# page, not of the wallet's history, and concurrent workers never lose each
+# other's rows. Range counts and histogram slices are indexed range queries;
+# burst and dormancy scans use the coarsest histogram that can bound the
+# answer and only read finer buckets and transactions inside candidate ranges.
+import os
+import sqlite3
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from itertools import accumulate
+
+from modules.transactions import parse_timestamp
+
+TEMPORAL_DB = os.getenv(
+    "SENTRYSOL_TEMPORAL_DB",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "temporal.sqlite3"),
+)
+RESOLUTIONS = {"minute": 60, "hour": 3600, "day": 86400}
+TEMPORAL_INDEX_TTL = float(os.getenv("TEMPORAL_INDEX_TTL", str(30 * 86400)))
+
+# Defaults for the summary attached to analyses
+BURST_WINDOW = 300          # seconds
+BURST_MIN_COUNT = 10        # transactions within BURST_WINDOW
+DORMANCY_GAP = 30 * 86400   # silence that counts as dormant
+DORMANCY_WINDOW = 86400     # activity measured this long after waking up
+MAX_REPORTED = 20
+
+
+def _iso(epoch: float):
+    return datetime.fromtimestamp(epoch, timezone.utc).isoformat() if epoch else None
+
+
+def parse_time_bound(value):
+    """Epoch seconds from a query parameter (unix seconds or ISO-8601); None passes through."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    timestamp = parse_timestamp(value)
+    if not timestamp:
+        raise ValueError(f"Invalid time: {value}")
+    return timestamp
+
+
+def auto_resolution(start: float, end: float) -> str:
+    """Finest resolution that keeps a [start, end] histogram to a few hundred buckets."""
+    span = end - start
+    return "minute" if span <= 6 * 3600 else "hour" if span <= 14 * 86400 else "day"
+
+
+def _volume(tx, address: str) -> float:
+    """SOL moved by a transaction into or out of `address`."""
+    return sum(
+        t.ui_amount for t in tx.native_transfers
+        if address in (t.from_address, t.to_address)
+    )
+
+
+def _coalesce(ranges) -> list:
+    """Sorted, merged copy of (start, end) ranges."""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+class TemporalStore:
+    def __init__(self, path: str = TEMPORAL_DB):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS wallets (address TEXT PRIMARY KEY, updated_at REAL NOT NULL) WITHOUT ROWID"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS txs (address TEXT NOT NULL, signature TEXT NOT NULL, "
+            "ts REAL NOT NULL, volume REAL NOT NULL, PRIMARY KEY (address, signature)) WITHOUT ROWID"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS txs_time ON txs (address, ts, volume)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (address TEXT NOT NULL, seconds INTEGER NOT NULL, "
+            "start INTEGER NOT NULL, count INTEGER NOT NULL, volume REAL NOT NULL, "
+            "PRIMARY KEY (address, seconds, start)) WITHOUT ROWID"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def is_indexed(self, address: str) -> bool:
+        row = self._conn().execute("SELECT updated_at FROM wallets WHERE address = ?", (address,)).fetchone()
+        return row is not None and time.time() - row[0] < TEMPORAL_INDEX_TTL
+
+    def add(self, address: str, rows) -> int:
+        """Store (timestamp, signature, volume) rows for a wallet; returns how many were new."""
+        rows = {signature: (timestamp, volume) for timestamp, signature, volume in rows}
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT updated_at FROM wallets WHERE address = ?", (address,)).fetchone()
+            if row is not None and time.time() - row[0] >= TEMPORAL_INDEX_TTL:
+                # Expired: rebuild from what is fetched now
+                conn.execute("DELETE FROM txs WHERE address = ?", (address,))
+                conn.execute("DELETE FROM buckets WHERE address = ?", (address,))
+            signatures = list(rows)
+            for i in range(0, len(signatures), 500):
+                chunk = signatures[i:i + 500]
+                for (seen,) in conn.execute(
+                    f"SELECT signature FROM txs WHERE address = ? AND signature IN ({','.join('?' * len(chunk))})",
+                    [address, *chunk],
+                ):
+                    rows.pop(seen, None)
+
+            deltas = {}
+            for timestamp, volume in rows.values():
+                for seconds in RESOLUTIONS.values():
+                    key = (seconds, int(timestamp // seconds * seconds))
+                    delta = deltas.setdefault(key, [0, 0.0])
+                    delta[0] += 1
+                    delta[1] += volume
+            conn.executemany(
+                "INSERT INTO txs (address, signature, ts, volume) VALUES (?, ?, ?, ?)",
+                [(address, signature, timestamp, volume) for signature, (timestamp, volume) in rows.items()],
+            )
+            conn.executemany(
+                "INSERT INTO buckets (address, seconds, start, count, volume) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (address, seconds, start) DO UPDATE SET "
+                "count = count + excluded.count, volume = volume + excluded.volume",
+                [(address, seconds, start, count, volume) for (seconds, start), (count, volume) in deltas.items()],
+            )
+            conn.execute(
+                "INSERT INTO wallets (address, updated_at) VALUES (?, ?) "
+                "ON CONFLICT (address) DO UPDATE SET updated_at = excluded.updated_at",
+                (address, time.time()),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+
+class TemporalIndex:
+    """Query view over one wallet's rows in a TemporalStore."""
+
+    def __init__(self, address: str, store: "TemporalStore" = None):
+        self.address = address
+        self.store = store or get_temporal_store()
+
+    def _query(self, sql: str, *params) -> list:
+        return self.store._conn().execute(sql, (self.address, *params)).fetchall()
+
+    def __len__(self):
+        return self._query("SELECT COUNT(*) FROM txs WHERE address = ?")[0][0]
+
+    def add_transactions(self, transactions) -> int:
+        """Fold normalized transactions in (any order); returns how many were new."""
+        return self.store.add(self.address, [
+            (tx.timestamp, tx.signature, _volume(tx, self.address))
+            for tx in transactions if tx.timestamp
+        ])
+
+    def bounds(self) -> tuple:
+        """(first, last) indexed timestamp, or (None, None) when empty."""
+        return tuple(self._query("SELECT MIN(ts), MAX(ts) FROM txs WHERE address = ?")[0])
+
+    @staticmethod
+    def _range(start=None, end=None) -> tuple:
+        return (float("-inf") if start is None else start, float("inf") if end is None else end)
+
+    def stats(self, start: float = None, end: float = None) -> dict:
+        """Transaction count and SOL volume within [start, end] (open ends allowed)."""
+        count, volume, first, last = self._query(
+            "SELECT COUNT(*), COALESCE(SUM(volume), 0.0), MIN(ts), MAX(ts) FROM txs "
+            "WHERE address = ? AND ts BETWEEN ? AND ?", *self._range(start, end)
+        )[0]
+        return {
+            "count": count,
+            "volume": volume,
+            "first_seen": _iso(first) if count else None,
+            "last_seen": _iso(last) if count else None,
+        }
+
+    def signatures_between(self, start: float = None, end: float = None) -> set:
+        return {r[0] for r in self._query(
+            "SELECT signature FROM txs WHERE address = ? AND ts BETWEEN ? AND ?", *self._range(start, end)
+        )}
+
+    def signature_after(self, timestamp: float):
+        """Oldest indexed signature newer than `timestamp` (a `before` cursor for
+        paging back from it), or None."""
+        row = self._query(
+            "SELECT signature FROM txs WHERE address = ? AND ts > ? ORDER BY ts LIMIT 1", timestamp
+        )
+        return row[0][0] if row else None
+
+    def _buckets(self, seconds: int, start: float, end: float) -> list:
+        """(start, count, volume) of the buckets starting within [start, end)."""
+        return self._query(
+            "SELECT start, count, volume FROM buckets WHERE address = ? AND seconds = ? "
+            "AND start >= ? AND start < ? ORDER BY start", seconds, start, end
+        )
+
+    def _txs(self, start: float, end: float) -> tuple:
+        """(timestamps, volumes) of the transactions within [start, end], by time."""
+        rows = self._query(
+            "SELECT ts, volume FROM txs WHERE address = ? AND ts BETWEEN ? AND ? ORDER BY ts", start, end
+        )
+        return [r[0] for r in rows], [r[1] for r in rows]
+
+    def histogram(self, resolution: str = "hour", start: float = None, end: float = None) -> dict:
+        """Non-empty buckets of one resolution within [start, end]."""
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution} (use {', '.join(RESOLUTIONS)})")
+        seconds = RESOLUTIONS[resolution]
+        buckets = self._buckets(
+            seconds,
+            float("-inf") if start is None else start // seconds * seconds,
+            float("inf") if end is None else end + 1e-9,
+        )
+        return {
+            "resolution": resolution,
+            "bucket_seconds": seconds,
+            "starts": [_iso(b[0]) for b in buckets],
+            "counts": [b[1] for b in buckets],
+            "volumes": [round(b[2], 9) for b in buckets],
+        }
+
+    def _burst_ranges(self, window: float, min_count: int) -> list:
+        """Time ranges that can hold a burst, narrowed from day to minute buckets.
+
+        A window starting in a bucket lies within that bucket and the ones
+        starting less than window + bucket later, so their summed count bounds
+        it; each level only reads the finer buckets inside (and just after)
+        ranges that passed the level above.
+        """
+        ranges = [(float("-inf"), float("inf"))]
+        for seconds in sorted(RESOLUTIONS.values(), reverse=True):
+            passed = []
+            for lo, hi in _coalesce((a, b + seconds + window) for a, b in ranges):
+                buckets = self._buckets(seconds, lo, hi)
+                starts = [b[0] for b in buckets]
+                cum = [0, *accumulate(b[1] for b in buckets)]
+                for i, bucket_start in enumerate(starts):
+                    j = bisect_left(starts, bucket_start + seconds + window)
+                    if cum[j] - cum[i] >= min_count:
+                        passed.append((bucket_start, bucket_start + seconds))
+            ranges = passed
+            if not ranges:
+                break
+        return ranges
+
+    def bursts(self, window: float = BURST_WINDOW, min_count: int = BURST_MIN_COUNT,
+               limit: int = MAX_REPORTED) -> list:
+        """Periods where at least `min_count` transactions fall within `window`
+        seconds, found by refining _burst_ranges down to single transactions.
+        Overlapping windows are merged into one burst.
+        """
+        ranges = self._burst_ranges(window, min_count)
+        result = []
+        # Windows starting in one coalesced segment end inside it, so each
+        # segment's transactions are read and scanned on their own
+        for lo, hi in _coalesce((a, b + window) for a, b in ranges):
+            ts, volumes = self._txs(lo, hi)
+            cum_volumes = [0.0, *accumulate(volumes)]
+            candidates = sorted({
+                a
+                for start, end in ranges if lo <= start < hi
+                for a in range(bisect_left(ts, start), bisect_left(ts, end))
+            })
+            bursts = []
+            for a in candidates:
+                b = bisect_right(ts, ts[a] + window)
+                if b - a < min_count:
+                    continue
+                if bursts and ts[a] <= bursts[-1]["_end"]:
+                    burst = bursts[-1]
+                    burst["_end"] = max(burst["_end"], ts[b - 1])
+                    burst["_hi"] = max(burst["_hi"], b)
+                    burst["peak_count"] = max(burst["peak_count"], b - a)
+                else:
+                    bursts.append({"_start": ts[a], "_end": ts[b - 1], "_lo": a, "_hi": b, "peak_count": b - a})
+            result.extend({
+                "start": _iso(burst["_start"]),
+                "end": _iso(burst["_end"]),
+                "count": burst["_hi"] - burst["_lo"],
+                "peak_count": burst["peak_count"],
+                "window_seconds": window,
+                "volume": cum_volumes[burst["_hi"]] - cum_volumes[burst["_lo"]],
+            } for burst in bursts)
+        result.sort(key=lambda b: b["peak_count"], reverse=True)
+        return result[:limit]
+
+    def dormancy(self, min_gap: float = DORMANCY_GAP, window: float = DORMANCY_WINDOW,
+                 min_count: int = 1, limit: int = MAX_REPORTED) -> list:
+        """Silences of at least `min_gap` seconds followed by `min_count`+
+        transactions within `window` seconds of waking up.
+
+        Gaps between consecutive non-empty buckets of the coarsest fitting
+        histogram bound the real gap to within one bucket, so only those
+        boundaries are resolved against individual transactions.
+        """
+        fitting = [seconds for seconds in RESOLUTIONS.values() if seconds <= min_gap]
+        if fitting:
+            seconds = max(fitting)
+            starts = [b[0] for b in self._buckets(seconds, float("-inf"), float("inf"))]
+            wakeups = [
+                starts[i] for i in range(1, len(starts))
+                if starts[i] - starts[i - 1] + seconds > min_gap
+            ]
+        else:
+            ts = self._txs(float("-inf"), float("inf"))[0]
+            wakeups = [ts[i] for i in range(1, len(ts)) if ts[i] - ts[i - 1] >= min_gap]
+
+        found = []
+        for wakeup in wakeups:
+            previous, resumed = self._query(
+                "SELECT (SELECT MAX(ts) FROM txs WHERE address = ?1 AND ts < ?2), "
+                "(SELECT MIN(ts) FROM txs WHERE address = ?1 AND ts >= ?2)", wakeup
+            )[0]
+            if previous is None or resumed is None or resumed - previous < min_gap:
+                continue
+            count, volume = self._query(
+                "SELECT COUNT(*), COALESCE(SUM(volume), 0.0) FROM txs WHERE address = ? AND ts BETWEEN ? AND ?",
+                resumed, resumed + window,
+            )[0]
+            if count < min_count:
+                continue
+            found.append({
+                "dormant_since": _iso(previous),
+                "resumed_at": _iso(resumed),
+                "gap_days": round((resumed - previous) / 86400, 2),
+                "activity_count": count,
+                "activity_volume": volume,
+                "window_seconds": window,
+            })
+        found.sort(key=lambda d: d["resumed_at"], reverse=True)
+        return found[:limit]
+
+    def summary(self) -> dict:
+        """Overall stats plus default burst and dormancy findings."""
+        return {
+            **self.stats(),
+            "bursts": self.bursts(),
+            "dormancy": self.dormancy(),
+        }
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_temporal_store() -> TemporalStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TemporalStore()
+        return _store
+
+
+def load_temporal_index(address: str):
+    """Stored index for a wallet, or None if it has never been ingested (or expired)."""
+    store = get_temporal_store()
+    return TemporalIndex(address, store) if store.is_indexed(address) else None
+
+
+def update_temporal_index(address: str, transactions) -> TemporalIndex:
+    """Fold newly fetched transactions into the wallet's stored index."""
+    index = TemporalIndex(address, get_temporal_store())
+    index.add_transactions(transactions)
+    return index
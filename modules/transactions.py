@@ -0,0 +1,208 @@
+# Compact, parse-once transaction model shared by every analysis stage
+#
+# Helius responses arrive in a few shapes (enhanced transactions, getTransaction
+# results, getSignaturesForAddress entries). normalize_transactions() turns any
+# of them into slotted records once per fetch so later stages never re-parse
+# timestamps or walk the raw JSON, and the raw dicts can be dropped.
+import sys
+from datetime import datetime, timezone
+
+LAMPORTS_PER_SOL = 1_000_000_000
+
+
+def parse_timestamp(value) -> float:
+    """Epoch seconds from a unix number or an ISO-8601 string (0.0 if unknown)."""
+    if value is None:
+        return 0.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return 0.0
+
+
+def _intern(address):
+    return sys.intern(address) if isinstance(address, str) and address else None
+
+
+class Transfer:
+    """One SOL or SPL transfer. Native amounts are lamports, token amounts UI units."""
+
+    __slots__ = ("from_address", "to_address", "amount", "mint", "native")
+
+    def __init__(self, from_address, to_address, amount, mint=None, native=True):
+        self.from_address = from_address
+        self.to_address = to_address
+        self.amount = amount
+        self.mint = mint
+        self.native = native
+
+    @property
+    def token(self) -> str:
+        return "SOL" if self.native else (self.mint or "UNKNOWN")
+
+    @property
+    def ui_amount(self) -> float:
+        return self.amount / LAMPORTS_PER_SOL if self.native else self.amount
+
+    def to_dict(self) -> dict:
+        return {
+            "fromUserAccount": self.from_address,
+            "toUserAccount": self.to_address,
+            "amount": self.amount,
+            "mint": self.mint,
+            "token": self.token,
+        }
+
+
+class Transaction:
+    __slots__ = (
+        "signature",
+        "timestamp",
+        "type",
+        "source",
+        "fee",
+        "fee_payer",
+        "failed",
+        "accounts",
+        "program_ids",
+        "native_transfers",
+        "token_transfers",
+        "description",
+    )
+
+    def __init__(self, signature, timestamp, type=None, source=None, fee=0, fee_payer=None,
+                 failed=False, accounts=(), program_ids=(), native_transfers=(),
+                 token_transfers=(), description=None):
+        self.signature = signature
+        self.timestamp = timestamp
+        self.type = type
+        self.source = source
+        self.fee = fee
+        self.fee_payer = fee_payer
+        self.failed = failed
+        self.accounts = accounts
+        self.program_ids = program_ids
+        self.native_transfers = native_transfers
+        self.token_transfers = token_transfers
+        self.description = description
+
+    @property
+    def transfers(self):
+        return self.native_transfers + self.token_transfers
+
+    @property
+    def iso_timestamp(self) -> str:
+        return datetime.fromtimestamp(self.timestamp, timezone.utc).isoformat()
+
+    def to_dict(self) -> dict:
+        return {
+            "signature": self.signature,
+            "timestamp": self.iso_timestamp,
+            "type": self.type,
+            "source": self.source,
+            "fee": self.fee,
+            "feePayer": self.fee_payer,
+            "failed": self.failed,
+            "description": self.description,
+            "accounts": list(self.accounts),
+            "programIds": list(self.program_ids),
+            "nativeTransfers": [t.to_dict() for t in self.native_transfers],
+            "tokenTransfers": [t.to_dict() for t in self.token_transfers],
+        }
+
+
+def _native_transfers(raw: dict) -> tuple:
+    transfers = raw.get("nativeTransfers") or raw.get("native_transfers") or []
+    return tuple(
+        Transfer(_intern(t.get("fromUserAccount")), _intern(t.get("toUserAccount")), t.get("amount", 0) or 0)
+        for t in transfers
+        if isinstance(t, dict)
+    )
+
+
+def _token_transfers(raw: dict) -> tuple:
+    out = []
+    for t in raw.get("tokenTransfers") or []:
+        if not isinstance(t, dict):
+            continue
+        amount = t.get("tokenAmount")
+        if isinstance(amount, dict):  # rawTokenAmount-style payloads
+            amount = amount.get("uiAmount") or 0
+        try:
+            amount = float(amount or 0)
+        except (TypeError, ValueError):
+            # One malformed amount must not fail the whole batch
+            continue
+        out.append(Transfer(
+            _intern(t.get("fromUserAccount") or t.get("fromTokenAccount")),
+            _intern(t.get("toUserAccount") or t.get("toTokenAccount")),
+            amount,
+            mint=_intern(t.get("mint")),
+            native=False,
+        ))
+    return tuple(out)
+
+
+def _account_keys(message: dict) -> list:
+    keys = []
+    for key in message.get("accountKeys") or []:
+        keys.append(key.get("pubkey") if isinstance(key, dict) else key)
+    return keys
+
+
+def normalize_transaction(raw: dict) -> Transaction:
+    if isinstance(raw.get("result"), dict):  # raw getTransaction response
+        raw = raw["result"]
+
+    tx_body = raw.get("transaction") if isinstance(raw.get("transaction"), dict) else {}
+    message = tx_body.get("message") or {}
+    meta = raw.get("meta") or {}
+
+    if raw.get("accounts") is not None:
+        accounts = raw["accounts"]
+    elif raw.get("accountData") is not None:
+        accounts = [a.get("account") for a in raw["accountData"] if isinstance(a, dict)]
+    else:
+        accounts = _account_keys(message)
+
+    program_ids = []
+    for ix in raw.get("instructions") or message.get("instructions") or []:
+        if not isinstance(ix, dict):
+            continue
+        program_id = ix.get("programId")
+        if program_id is None and isinstance(ix.get("programIdIndex"), int) and ix["programIdIndex"] < len(accounts):
+            program_id = accounts[ix["programIdIndex"]]
+        if program_id and program_id not in program_ids:
+            program_ids.append(program_id)
+
+    signature = raw.get("signature") or raw.get("txHash") or raw.get("id")
+    if signature is None and tx_body.get("signatures"):
+        signature = tx_body["signatures"][0]
+
+    return Transaction(
+        signature=signature,
+        timestamp=parse_timestamp(raw.get("timestamp") if raw.get("timestamp") is not None else raw.get("blockTime")),
+        type=raw.get("type"),
+        source=raw.get("source"),
+        fee=raw.get("fee", meta.get("fee", 0)) or 0,
+        fee_payer=_intern(raw.get("feePayer")),
+        failed=bool(raw.get("transactionError") or raw.get("err") or meta.get("err")),
+        accounts=tuple(_intern(a) for a in accounts if a),
+        program_ids=tuple(_intern(p) for p in program_ids),
+        native_transfers=_native_transfers(raw),
+        token_transfers=_token_transfers(raw),
+        description=raw.get("description") or None,
+    )
+
+
+def normalize_transactions(raw_transactions) -> list:
+    """Normalize a batch, skipping entries that aren't transaction objects."""
+    if isinstance(raw_transactions, dict):
+        raw_transactions = raw_transactions.get("result") or []
+    return [
+        tx if isinstance(tx, Transaction) else normalize_transaction(tx)
+        for tx in raw_transactions or []
+        if isinstance(tx, (dict, Transaction))
+    ]
@@ -0,0 +1,130 @@
+# Incremental transaction-flow graph with delta streaming
+#
+# GraphBuilder grows the same {"nodes", "edges", "transaction_flows",
+# "summary"} graph build_transaction_graph returns, one page of normalized
+# transactions at a time, and remembers which nodes/edges changed so the
+# /analyze stream can ship them as `graph_delta` SSE events while later
+# pages (and the AI stage) are still running.
+import base64
+import gzip
+import json
+
+
+class GraphBuilder:
+    def __init__(self, address: str):
+        self.address = address
+        self.nodes = {}
+        self.edges = {}
+        self.transaction_flows = []
+        self._dirty_nodes = set()
+        self._dirty_edges = set()
+        self._add_node(address, "main")
+
+    def _add_node(self, node_id: str, node_type: str = "external"):
+        if node_id not in self.nodes:
+            self.nodes[node_id] = {
+                "id": node_id,
+                "label": f"{node_id[:8]}...",
+                "type": node_type,
+                "isMain": node_id == self.address,
+            }
+            self._dirty_nodes.add(node_id)
+
+    def add_transactions(self, transactions) -> int:
+        """Fold a page of normalized transactions in; returns flows added."""
+        added = 0
+        for tx in transactions:
+            timestamp = None
+            for transfer in tx.native_transfers:
+                from_addr = transfer.from_address
+                to_addr = transfer.to_address
+                if not (from_addr and to_addr):
+                    continue
+                amount = transfer.ui_amount  # lamports -> SOL
+                if timestamp is None:
+                    timestamp = tx.iso_timestamp
+
+                self._add_node(from_addr)
+                self._add_node(to_addr)
+                key = (from_addr, to_addr)
+                edge = self.edges.get(key)
+                if edge is None:
+                    self.edges[key] = {"from": from_addr, "to": to_addr, "weight": amount, "count": 1, "type": "transfer"}
+                else:
+                    edge["weight"] += amount
+                    edge["count"] += 1
+                self._dirty_edges.add(key)
+
+                self.transaction_flows.append({
+                    "from_address": from_addr,
+                    "to_address": to_addr,
+                    "amount": amount,
+                    "token": "SOL",
+                    "signature": tx.signature,
+                    "timestamp": timestamp,
+                    "type": "outflow" if from_addr == self.address else "inflow"
+                })
+                added += 1
+        return added
+
+    @property
+    def pending(self) -> int:
+        return len(self._dirty_nodes) + len(self._dirty_edges)
+
+    def flush_delta(self) -> dict:
+        """Nodes added and edges added/updated since the last flush."""
+        delta = {
+            "nodes": [self.nodes[n] for n in self.nodes if n in self._dirty_nodes],
+            "edges": [dict(self.edges[k]) for k in self.edges if k in self._dirty_edges],
+            "summary": self.summary(),
+        }
+        self._dirty_nodes.clear()
+        self._dirty_edges.clear()
+        return delta
+
+    def summary(self) -> dict:
+        return {
+            "total_nodes": len(self.nodes),
+            "total_edges": len(self.edges),
+            "total_volume": sum(edge["weight"] for edge in self.edges.values()),
+        }
+
+    def to_graph(self) -> dict:
+        return {
+            "nodes": list(self.nodes.values()),
+            "edges": list(self.edges.values()),
+            "transaction_flows": self.transaction_flows,
+            "summary": self.summary(),
+        }
+
+
+GRAPH_FRAME_MODES = {"json", "batch", "gzip"}
+
+
+def parse_graph_frames(value: str) -> set:
+    """`?graph_frames=` value such as "json", "batch" or "batch,gzip"."""
+    modes = {m.strip().lower() for m in (value or "json").split(",") if m.strip()}
+    unknown = modes - GRAPH_FRAME_MODES
+    if unknown:
+        raise ValueError(f"Unknown graph_frames mode(s): {', '.join(sorted(unknown))}")
+    return modes or {"json"}
+
+
+def graph_delta_event(delta: dict, modes: set, seq: int) -> str:
+    """Format a delta as a named SSE event; empty string when nothing changed.
+
+    Named events are ignored by `onmessage` handlers, so clients that only
+    read the step frames are unaffected. With "gzip" the JSON body is
+    gzip-compressed and base64-encoded into {"encoding", "payload"}.
+    """
+    if not delta["nodes"] and not delta["edges"]:
+        return ""
+    body = {"seq": seq, **delta}
+    if "gzip" in modes:
+        raw = json.dumps(body, separators=(",", ":")).encode()
+        body = {
+            "seq": seq,
+            "encoding": "gzip+base64",
+            "payload": base64.b64encode(gzip.compress(raw, compresslevel=5)).decode(),
+        }
+    return f"event: graph_delta\ndata: {json.dumps(body, separators=(',', ':'))}\n\n"
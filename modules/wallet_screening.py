@@ -0,0 +1,127 @@
+# CPU side of wallet analysis, shared by the HTTP backend and bulk screening.
+#
+# Everything here is synchronous and works on plain data (raw Helius
+# enhanced-transaction JSON or normalized Transaction records), so it can run
+# in a worker process: screen_wallets takes a batch of fetched wallets and
+# returns one flat row per wallet, scoring the whole batch with the local
+# risk model in a single vectorized pass.
+import time
+
+from modules.transactions import LAMPORTS_PER_SOL, normalize_transactions
+from modules.tx_graph import GraphBuilder
+
+
+def threat_level(risk_score: int) -> str:
+    return "LOW" if risk_score < 30 else "MEDIUM" if risk_score < 70 else "HIGH"
+
+
+def analyze_transaction_patterns(transactions) -> dict:
+    """Analyze transaction patterns for suspicious activity"""
+    patterns = {
+        "total_transactions": len(transactions),
+        "unique_counterparts": set(),
+        "large_transactions": [],
+        "rapid_transactions": [],
+        "suspicious_timing": []
+    }
+
+    prev_time = None
+    for tx in transactions:
+        # Track unique counterparts
+        patterns["unique_counterparts"].update(tx.accounts)
+
+        # Check for large transactions (>1 SOL)
+        for transfer in tx.native_transfers:
+            if transfer.amount > LAMPORTS_PER_SOL:
+                patterns["large_transactions"].append(transfer.to_dict())
+
+        # Check for rapid transactions
+        if prev_time is not None and abs(prev_time - tx.timestamp) < 60:
+            patterns["rapid_transactions"].append(tx.signature)
+        prev_time = tx.timestamp
+
+    patterns["unique_counterparts"] = len(patterns["unique_counterparts"])
+    if not transactions:
+        return {"risk_score": 0, "patterns": patterns, "suspicious_activities": []}
+
+    # Calculate risk score
+    risk_score = min(100, (
+        len(patterns["large_transactions"]) * 10 +
+        len(patterns["rapid_transactions"]) * 5 +
+        (50 if patterns["unique_counterparts"] > 100 else 0)
+    ))
+
+    return {
+        "risk_score": risk_score,
+        "patterns": patterns,
+        "suspicious_activities": []
+    }
+
+
+def screen_wallets(batch, feature_sets: bool = False) -> list:
+    """Screen a batch of `(address, raw_transactions, counterparty_risk)` tuples.
+
+    Returns one flat row per wallet (see SCREEN_COLUMNS). Wallets that fail
+    are returned with `error` set instead of raising, so one bad history does
+    not lose the rest of the batch. With `feature_sets`, successful rows also
+    carry `feature_sets`: the (counterparties, mints) for the similarity index.
+    """
+    from modules.laundering_detectors import detect_laundering_patterns
+    from modules.risk_model import extract_features, get_model
+    from modules.similarity_index import wallet_feature_sets
+
+    rows = []
+    features = []
+    for address, raw_transactions, counterparty_risk in batch:
+        try:
+            transactions = normalize_transactions(raw_transactions)
+            pattern_analysis = analyze_transaction_patterns(transactions)
+            builder = GraphBuilder(address)
+            builder.add_transactions(transactions)
+            graph = builder.to_graph()
+            laundering = detect_laundering_patterns(graph, address)
+        except Exception as e:
+            rows.append({"address": address, "error": str(e)})
+            features.append(None)
+            continue
+
+        patterns = pattern_analysis["patterns"]
+        risk_score = min(100, pattern_analysis["risk_score"] + laundering["risk_score"])
+        timestamps = [tx.timestamp for tx in transactions if tx.timestamp]
+        rows.append({
+            "address": address,
+            "tx_count": len(transactions),
+            "risk_score": risk_score,
+            "threat_level": threat_level(risk_score),
+            "pattern_risk_score": pattern_analysis["risk_score"],
+            "laundering_score": laundering["risk_score"],
+            "large_transactions": len(patterns["large_transactions"]),
+            "rapid_transactions": len(patterns["rapid_transactions"]),
+            "unique_counterparts": patterns["unique_counterparts"],
+            "laundering_findings": len(laundering["findings"]),
+            "finding_patterns": sorted({f["pattern"] for f in laundering["findings"]}),
+            "graph_nodes": graph["summary"]["total_nodes"],
+            "graph_edges": graph["summary"]["total_edges"],
+            "total_volume": graph["summary"]["total_volume"],
+            "first_seen": min(timestamps, default=None),
+            "last_seen": max(timestamps, default=None),
+            "error": None,
+        })
+        if feature_sets:
+            rows[-1]["feature_sets"] = wallet_feature_sets(address, transactions, graph)
+        features.append(extract_features(pattern_analysis, graph, laundering, counterparty_risk))
+
+    scored = [i for i, f in enumerate(features) if f is not None]
+    assessments = get_model().assess_batch([features[i] for i in scored])
+    for i, local_risk in zip(scored, assessments):
+        rows[i].update({
+            "local_risk_probability": local_risk["risk_probability"],
+            "local_risk_level": local_risk["risk_level"],
+            "local_confidence": local_risk["confidence"],
+            "use_llm": local_risk["use_llm"],
+            "model_version": local_risk["model_version"],
+        })
+    screened_at = int(time.time())
+    for row in rows:
+        row["screened_at"] = screened_at
+    return rows
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+SentrySol startup benchmark
+
+Measures how long each Python backend takes to become usable:
+  import   - import the module and build the app (repeated in fresh processes)
+  health   - start uvicorn and poll /health until it answers
+
+Usage:
+    python scripts/bench_startup.py                 # both apps, import mode
+    python scripts/bench_startup.py --mode health   # time-to-healthy via uvicorn
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+APPS = {
+    "server": {"cwd": ROOT, "target": "server:app"},
+    "backend": {"cwd": os.path.join(ROOT, "backend"), "target": "main:app"},
+}
+
+IMPORT_SNIPPET = """
+import time
+t0 = time.perf_counter()
+import importlib
+module = importlib.import_module({module!r})
+app = getattr(module, "app")
+print(time.perf_counter() - t0)
+"""
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def time_import(name: str, runs: int) -> list:
+    spec = APPS[name]
+    module = spec["target"].split(":")[0]
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET.format(module=module)],
+            cwd=spec["cwd"], capture_output=True, text=True, check=True,
+        )
+        samples.append(float(out.stdout.strip().splitlines()[-1]))
+    return samples
+
+
+def time_health(name: str, runs: int, timeout: float = 60.0) -> list:
+    spec = APPS[name]
+    samples = []
+    for _ in range(runs):
+        port = free_port()
+        started = time.perf_counter()
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", spec["target"], "--port", str(port), "--log-level", "warning"],
+            cwd=spec["cwd"],
+        )
+        try:
+            while time.perf_counter() - started < timeout:
+                try:
+                    with urllib.request.urlopen(f"http://127.0.0.1:{port}/health", timeout=1) as resp:
+                        if resp.status == 200:
+                            samples.append(time.perf_counter() - started)
+                            break
+                except OSError:
+                    time.sleep(0.02)
+            else:
+                raise RuntimeError(f"{name} did not become healthy within {timeout}s")
+        finally:
+            proc.terminate()
+            proc.wait()
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SentrySol backend cold start")
+    parser.add_argument("--app", choices=sorted(APPS), action="append", help="app to benchmark (default: all)")
+    parser.add_argument("--mode", choices=["import", "health"], default="import")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    measure = time_import if args.mode == "import" else time_health
+    for name in args.app or sorted(APPS):
+        samples = measure(name, args.runs)
+        print(
+            f"{name:8s} {args.mode:6s} median={statistics.median(samples) * 1000:8.1f} ms "
+            f"min={min(samples) * 1000:8.1f} ms max={max(samples) * 1000:8.1f} ms (n={len(samples)})"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Build the local IOC (known-bad address) index
+
+Imports scam/drainer/sanctions address lists and publishes them as a new
+index generation; running servers pick it up within IOC_RELOAD_INTERVAL
+seconds without a restart.
+
+Sources are text files (one address per line), CSV files (address[,label])
+or JSON lists (addresses or {"address", "label"} objects). Each source is
+labelled with its file name unless given as PATH:LABEL or the row carries
+its own label. An address listed in several sources keeps the first label.
+
+Usage:
+    python scripts/build_ioc_index.py drainers.txt scams.csv:scam
+    python scripts/build_ioc_index.py lists/*.txt --index-dir /var/lib/sentrysol/ioc --keep 3
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from modules.ioc_index import IOC_DIR, IOC_FP_RATE, build_ioc_index, prune_generations
+
+
+def parse_source(value: str) -> tuple:
+    path, sep, label = value.rpartition(":")
+    if not sep or not os.path.exists(path):
+        path, label = value, ""
+    return path, label or os.path.splitext(os.path.basename(path))[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the SentrySol IOC address index")
+    parser.add_argument("sources", nargs="+", help="list files, optionally PATH:LABEL")
+    parser.add_argument("--index-dir", default=IOC_DIR)
+    parser.add_argument("--fp-rate", type=float, default=IOC_FP_RATE, help="Bloom filter false-positive rate")
+    parser.add_argument("--keep", type=int, default=2, help="index generations to keep on disk")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    manifest = build_ioc_index([parse_source(s) for s in args.sources], args.index_dir, args.fp_rate)
+    prune_generations(args.index_dir, keep=max(1, args.keep))
+    print(
+        f"[ioc] published {manifest['generation']}: {manifest['count']} addresses "
+        f"({', '.join(f'{k}={v}' for k, v in manifest['label_counts'].items())}), "
+        f"{manifest['invalid_entries']} invalid, bloom {manifest['bloom_bits'] // 8 // 1024} KiB "
+        f"k={manifest['bloom_hashes']}, {time.perf_counter() - started:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
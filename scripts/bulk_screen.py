@@ -0,0 +1,355 @@
+#!/usr/bin/env python3
+"""
+SentrySol bulk wallet screening
+
+Rescores a large list of addresses without going through the HTTP servers:
+  - histories are fetched from the Helius enhanced-transactions API with
+    asyncio under one global rate limit (--rate requests/s, --concurrency
+    wallets in flight)
+  - pattern analysis, graph building, laundering detectors and the local risk
+    model run in a process pool, --batch-size wallets per task, overlapping
+    with the next chunk's fetches
+  - every --checkpoint-every wallets the results are written as a Parquet part
+    under <output>.parts/; an interrupted run picks up where it stopped
+    (failed wallets are retried)
+  - when all addresses are done the parts are merged into one zstd Parquet
+    file, one row per address
+  - with --similarity, each screened wallet is also added to the
+    counterparty/mint similarity index served by GET /similar/{address}
+
+Requires pyarrow (pip install -r backend/requirements.txt).
+
+Usage:
+    python scripts/bulk_screen.py watched.txt -o screen.parquet
+    python scripts/bulk_screen.py a.txt b.csv -o screen.parquet --rate 40 --workers 8
+    cat watched.txt | python scripts/bulk_screen.py - -o screen.parquet --blocksec
+    python scripts/bulk_screen.py watched.txt -o screen.parquet --similarity
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from multiprocessing import get_context
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import httpx
+from dotenv import load_dotenv
+
+from modules.pubkey import is_valid_pubkey
+from modules.similarity_index import get_similarity_index
+from modules.wallet_screening import screen_wallets
+
+load_dotenv()
+
+HELIUS_API_KEY = os.getenv("HELIUS_API_KEY")
+HELIUS_URL = "https://api.helius.xyz/v0"
+PAGE_SIZE = 100
+
+
+def read_addresses(paths) -> list:
+    """Addresses from text/CSV files (first column) or stdin ("-"), deduplicated in order."""
+    seen = {}
+    invalid = 0
+    for path in paths:
+        f = sys.stdin if path == "-" else open(path, "r", encoding="utf-8")
+        try:
+            for line in f:
+                value = line.split(",", 1)[0].strip().strip('"')
+                if not value or value.startswith("#") or value.lower() == "address":
+                    continue
+                if not is_valid_pubkey(value):
+                    invalid += 1
+                    continue
+                seen.setdefault(value, None)
+        finally:
+            if f is not sys.stdin:
+                f.close()
+    if invalid:
+        print(f"[bulk] skipped {invalid} invalid addresses")
+    return list(seen)
+
+
+def screen_schema():
+    import pyarrow as pa
+
+    level = pa.dictionary(pa.int8(), pa.string())
+    return pa.schema([
+        ("address", pa.string()),
+        ("screened_at", pa.timestamp("s")),
+        ("tx_count", pa.int32()),
+        ("risk_score", pa.int16()),
+        ("threat_level", level),
+        ("pattern_risk_score", pa.int16()),
+        ("laundering_score", pa.int16()),
+        ("local_risk_probability", pa.float32()),
+        ("local_risk_level", level),
+        ("local_confidence", pa.float32()),
+        ("use_llm", pa.bool_()),
+        ("model_version", level),
+        ("large_transactions", pa.int32()),
+        ("rapid_transactions", pa.int32()),
+        ("unique_counterparts", pa.int32()),
+        ("laundering_findings", pa.int16()),
+        ("finding_patterns", pa.list_(pa.string())),
+        ("graph_nodes", pa.int32()),
+        ("graph_edges", pa.int32()),
+        ("total_volume", pa.float64()),
+        ("first_seen", pa.timestamp("s")),
+        ("last_seen", pa.timestamp("s")),
+        ("blocksec_risk", pa.float32()),
+        ("error", pa.string()),
+    ])
+
+
+class PartStore:
+    """Checkpoint parts for one run: <output>.parts/part-*.parquet"""
+
+    def __init__(self, output: str):
+        self.output = output
+        self.parts_dir = output + ".parts"
+        os.makedirs(self.parts_dir, exist_ok=True)
+        self.schema = screen_schema()
+        self._seq = 0
+
+    def _part_files(self) -> list:
+        return sorted(
+            os.path.join(self.parts_dir, name) for name in os.listdir(self.parts_dir)
+            if name.startswith("part-") and name.endswith(".parquet")
+        )
+
+    def _read(self, columns=None):
+        import pyarrow.parquet as pq
+
+        files = self._part_files()
+        if not files:
+            return None
+        return pq.ParquetDataset(files, schema=self.schema).read(columns=columns)
+
+    def done(self) -> set:
+        """Addresses already screened without error."""
+        table = self._read(columns=["address", "error"])
+        if table is None:
+            return set()
+        return {a for a, e in zip(table["address"].to_pylist(), table["error"].to_pylist()) if e is None}
+
+    def write(self, rows: list):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self._seq += 1
+        name = f"part-{int(time.time() * 1000)}-{os.getpid()}-{self._seq:05d}.parquet"
+        tmp = os.path.join(self.parts_dir, "." + name + ".tmp")
+        pq.write_table(pa.Table.from_pylist(rows, schema=self.schema), tmp, compression="zstd")
+        os.replace(tmp, os.path.join(self.parts_dir, name))
+
+    def merge(self, keep_parts: bool = False) -> int:
+        """Write the final file: one row per address (latest successful result
+        wins over errors), sorted by address."""
+        import numpy as np
+        import pyarrow as pa
+        import pyarrow.compute as pc
+        import pyarrow.parquet as pq
+
+        table = self._read()
+        if table is None:
+            return 0
+        table = table.append_column("_ok", pc.is_null(table["error"]))
+        table = table.append_column("_row", pa.array(np.arange(len(table))))
+        table = table.sort_by([("address", "ascending"), ("_ok", "ascending"), ("_row", "ascending")])
+        addresses = table["address"].to_numpy(zero_copy_only=False)
+        keep = np.append(addresses[1:] != addresses[:-1], True)
+        table = table.filter(pa.array(keep)).drop_columns(["_ok", "_row"])
+        tmp = self.output + ".tmp"
+        pq.write_table(table, tmp, compression="zstd", row_group_size=100_000)
+        os.replace(tmp, self.output)
+        if not keep_parts:
+            for path in self._part_files():
+                os.remove(path)
+            os.rmdir(self.parts_dir)
+        return len(table)
+
+
+class RateLimiter:
+    """Token bucket shared by every Helius request in the run."""
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+async def get_page(client: httpx.AsyncClient, limiter: RateLimiter, url: str, params: dict, retries: int):
+    for attempt in range(retries + 1):
+        await limiter.acquire()
+        try:
+            response = await client.get(url, params=params)
+        except httpx.HTTPError as e:
+            error = str(e) or type(e).__name__
+            delay = 2 ** attempt
+        else:
+            if response.status_code == 200:
+                return response.json()
+            if response.status_code != 429 and response.status_code < 500:
+                raise RuntimeError(f"Helius API error: {response.status_code}")
+            error = f"Helius API error: {response.status_code}"
+            delay = float(response.headers.get("Retry-After") or 2 ** attempt)
+        if attempt < retries:
+            await asyncio.sleep(delay)
+    raise RuntimeError(error)
+
+
+async def fetch_history(client, limiter, address: str, max_txs: int, retries: int) -> list:
+    """Newest-first raw enhanced transactions, paged with the before-cursor."""
+    url = f"{HELIUS_URL}/addresses/{address}/transactions"
+    transactions = []
+    before = None
+    while len(transactions) < max_txs:
+        params = {"api-key": HELIUS_API_KEY, "limit": min(PAGE_SIZE, max_txs - len(transactions))}
+        if before:
+            params["before"] = before
+        page = await get_page(client, limiter, url, params, retries)
+        if not page:
+            break
+        transactions.extend(page)
+        before = page[-1].get("signature")
+        if len(page) < params["limit"] or not before:
+            break
+    return transactions
+
+
+async def fetch_chunk(client, limiter, addresses, args) -> tuple:
+    """Fetch a chunk of wallets; returns (batch for screen_wallets, error rows)."""
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def fetch_one(address):
+        async with semaphore:
+            try:
+                return address, await fetch_history(client, limiter, address, args.max_txs, args.retries), None
+            except Exception as e:
+                return address, None, str(e)
+
+    results = await asyncio.gather(*(fetch_one(a) for a in addresses))
+    fetched = [(a, txs) for a, txs, error in results if error is None]
+    failed = [{"address": a, "error": error, "screened_at": int(time.time())}
+              for a, _, error in results if error is not None]
+
+    scores = {}
+    if args.blocksec and fetched:
+        from modules.metasleuth_api import score_addresses
+
+        scored = await score_addresses([a for a, _ in fetched], deadline=args.blocksec_deadline, client=client)
+        scores = scored["scores"]
+    batch = [(a, txs, {"target": scores.get(a), "counterparties": {}}) for a, txs in fetched]
+    return batch, failed
+
+
+async def screen_chunk(pool, store: PartStore, batch, failed, args) -> tuple:
+    """Score a fetched chunk in the process pool and checkpoint it."""
+    from modules.risk_model import blocksec_risk
+
+    loop = asyncio.get_running_loop()
+    batches = [batch[i:i + args.batch_size] for i in range(0, len(batch), args.batch_size)]
+    screen = partial(screen_wallets, feature_sets=args.similarity)
+    results = await asyncio.gather(*(loop.run_in_executor(pool, screen, b) for b in batches))
+    rows = [row for result in results for row in result]
+    if args.similarity:
+        wallets = [(row["address"], *row.pop("feature_sets")) for row in rows if "feature_sets" in row]
+        await asyncio.to_thread(get_similarity_index().add_many, wallets)
+    targets = {a: cp["target"] for a, _, cp in batch}
+    for row in rows:
+        risk = blocksec_risk(targets.get(row["address"]))
+        row["blocksec_risk"] = None if risk != risk else risk
+    rows.extend(failed)
+    await asyncio.to_thread(store.write, rows)
+    return len(rows), sum(1 for row in rows if row.get("error"))
+
+
+async def run(addresses, store: PartStore, pool, args):
+    limiter = RateLimiter(args.rate)
+    started = time.monotonic()
+    processed = errors = 0
+    pending = None
+
+    async def finish(task):
+        nonlocal processed, errors
+        n, n_errors = await task
+        processed += n
+        errors += n_errors
+        rate = processed / max(1e-9, time.monotonic() - started)
+        print(f"[bulk] {processed}/{len(addresses)} screened, {errors} errors, {rate:.1f} wallets/s")
+
+    async with httpx.AsyncClient(timeout=args.timeout) as client:
+        for i in range(0, len(addresses), args.checkpoint_every):
+            chunk = addresses[i:i + args.checkpoint_every]
+            # Fetch this chunk while the previous one is still being scored
+            batch, failed = await fetch_chunk(client, limiter, chunk, args)
+            if pending is not None:
+                await finish(pending)
+            pending = asyncio.ensure_future(screen_chunk(pool, store, batch, failed, args))
+        if pending is not None:
+            await finish(pending)
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Screen a list of Solana wallets in bulk")
+    parser.add_argument("inputs", nargs="+", help="address list files (text or CSV, first column); - for stdin")
+    parser.add_argument("-o", "--output", required=True, help="output Parquet file")
+    parser.add_argument("--rate", type=float, default=20.0, help="global Helius requests per second")
+    parser.add_argument("--concurrency", type=int, default=32, help="wallets fetched concurrently")
+    parser.add_argument("--max-txs", type=int, default=100, help="transactions fetched per wallet")
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--timeout", type=float, default=15.0, help="per-request timeout in seconds")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="analysis processes")
+    parser.add_argument("--batch-size", type=int, default=32, help="wallets per process-pool task")
+    parser.add_argument("--checkpoint-every", type=int, default=500, help="wallets per checkpoint part")
+    parser.add_argument("--blocksec", action="store_true", help="also score each wallet with Blocksec")
+    parser.add_argument("--blocksec-deadline", type=float, default=30.0)
+    parser.add_argument("--similarity", action="store_true", help="also add screened wallets to the similarity index")
+    parser.add_argument("--keep-parts", action="store_true", help="keep checkpoint parts after merging")
+    args = parser.parse_args()
+
+    if not HELIUS_API_KEY:
+        sys.exit("HELIUS_API_KEY not found in .env")
+
+    addresses = read_addresses(args.inputs)
+    store = PartStore(args.output)
+    done = store.done()
+    todo = [a for a in addresses if a not in done]
+    print(f"[bulk] {len(addresses)} addresses, {len(addresses) - len(todo)} already screened, {len(todo)} to go")
+
+    errors = 0
+    if todo:
+        # spawn: workers must not inherit the event loop or client threads
+        with ProcessPoolExecutor(max_workers=args.workers, mp_context=get_context("spawn")) as pool:
+            errors = asyncio.run(run(todo, store, pool, args))
+
+    # Failed wallets are written with `error` set; keeping the parts lets a
+    # rerun of the same command retry just those and merge again
+    rows = store.merge(keep_parts=args.keep_parts or errors > 0)
+    print(f"[bulk] wrote {rows} rows to {args.output}")
+    if errors:
+        print(f"[bulk] {errors} wallets failed; rerun the same command to retry them")
+
+
+if __name__ == "__main__":
+    main()
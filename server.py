@@ -1,45 +1,44 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import APIRouter, FastAPI, HTTPException, Request
 from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 import json
 import asyncio
 import os
+import threading
+import httpx
 from dotenv import load_dotenv
 from modules.helius_api import (
     fetch_transaction,
     fetch_address_history,
     fetch_token_metadata,
-    fetch_nft_metadata,
+    fetch_wallet_holdings,
     fetch_balance_changes,
-    resolve_address_name,
     fetch_webhook_events,
     get_signatures_for_address,
+    is_stale,
+    REQUEST_TIMEOUT as HELIUS_TIMEOUT,
 )
-from modules.metasleuth_api import fetch_wallet_score
-from modules.preprocess import aggregate_context
-from modules.analysis_chain import run_analysis
+from modules.address_resolver import resolve_accounts
+from modules.cache import cached_call, get_cache
+from modules.deadline import Deadline, DeadlineExceeded, stream_until_disconnected
+from modules.ioc_index import match_addresses
+from modules.metasleuth_api import REQUEST_TIMEOUT, SCORE_DEADLINE, score_addresses
+from modules.transactions import normalize_transactions
+from modules.analysis_chain import merge_ioc_matches, parse_analysis_json, run_chunked_analysis
 
 # Load environment variables
 load_dotenv()
 
-# Initialize FastAPI app
-app = FastAPI(title="SentrySol Backend API", version="1.0.0")
-
-# Configure CORS
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+router = APIRouter()
 
 # Environment variables
 HELIUS_API_KEY = os.getenv("HELIUS_API_KEY")
 METASLEUTH_API_KEY = os.getenv("METASLEUTH_API_KEY")
 MISTRAL_API_KEY = os.getenv("MISTRAL_API_KEY")
 LLM_MODEL = os.getenv("LLM_MODEL")
+MINT_CACHE_TTL = int(os.getenv("MINT_CACHE_TTL", str(24 * 3600)))
 
 # Pydantic models
 class ChatMessage(BaseModel):
@@ -47,7 +46,7 @@ class ChatMessage(BaseModel):
     address: str = None
 
 # Health check endpoint
-@app.get("/health")
+@router.get("/health")
 async def health_check():
     return {
         "status": "healthy",
@@ -60,149 +59,192 @@ async def health_check():
     }
 
 # Streaming analysis endpoint
-@app.get("/analyze/{address}")
-async def analyze_wallet_stream(address: str):
-    """Stream wallet analysis results using Server-Sent Events"""
+@router.get("/analyze/{address}")
+async def analyze_wallet_stream(address: str, request: Request):
+    """Stream wallet analysis results using Server-Sent Events.
+
+    Blocking Helius calls run in worker threads so a client disconnect or the
+    request deadline can cancel the stream between and during stages; each
+    call's timeout is capped by what is left of the deadline, and loops
+    running in a thread stop once `cancelled` is set.
+    """
     
     # Validate address format
     if len(address) < 32 or len(address) > 44:
         raise HTTPException(status_code=400, detail="Invalid Solana address format")
     
+    deadline = Deadline()
+    # Set when the stream ends for any reason (done, disconnect, deadline),
+    # so worker threads stop issuing calls nobody will read
+    cancelled = threading.Event()
+
+    def collect_metadata(history_txs):
+        """Metadata of the mints seen in the history, plus every asset and token
+        account the wallet holds (all DAS pages, bounded by the deadline)."""
+        token_meta = []
+        for tx in history_txs:
+            for token in tx.token_transfers:
+                mint = token.mint
+                if not mint:
+                    continue
+                if cancelled.is_set() or deadline.expired:
+                    break
+                try:
+                    token_metadata = cached_call(
+                        get_cache("mint_metadata", maxsize=50000),
+                        f"mint:{mint}",
+                        lambda: fetch_token_metadata(mint, timeout=deadline.timeout(HELIUS_TIMEOUT)),
+                        MINT_CACHE_TTL,
+                    )
+                    token_meta.append(token_metadata)
+                except Exception as e:
+                    print(f"Error fetching metadata for {mint}: {e}")
+        if cancelled.is_set() or deadline.expired:
+            return token_meta, {"assets": [], "token_accounts": [], "complete": False}
+        return token_meta, fetch_wallet_holdings(address, deadline=deadline, cancelled=cancelled)
+
     async def generate_analysis():
         try:
             # Step 1: Fetch address history
             yield f"data: {json.dumps({'step': 1, 'status': 'Fetching address history...', 'progress': 10})}\n\n"
-            await asyncio.sleep(0.1)
 
-            address_history = fetch_address_history(address, limit=20, enriched=True)
-            transaction_count = len(address_history.get('result', []))
+            # Parsed once here; every later stage reads the normalized records
+            history = await asyncio.to_thread(
+                fetch_address_history, address, limit=20, enriched=True,
+                timeout=deadline.timeout(HELIUS_TIMEOUT),
+            )
+            history_txs = normalize_transactions(history)
+            transaction_count = len(history_txs)
             yield f"data: {json.dumps({'step': 1, 'status': 'Address history fetched', 'progress': 15, 'data': {'transactions_count': transaction_count}})}\n\n"
 
             # Step 2: Get signatures
             yield f"data: {json.dumps({'step': 2, 'status': 'Getting transaction signatures...', 'progress': 25})}\n\n"
-            await asyncio.sleep(0.1)
 
-            signatures = get_signatures_for_address(address, limit=10)
+            deadline.check("signature lookup")
+            signatures = await asyncio.to_thread(
+                get_signatures_for_address, address, limit=10, timeout=deadline.timeout(HELIUS_TIMEOUT)
+            )
             signatures_count = len(signatures.get('result', []))
             yield f"data: {json.dumps({'step': 2, 'status': 'Signatures retrieved', 'progress': 35, 'data': {'signatures_count': signatures_count}})}\n\n"
 
             # Step 3: Fetch token and NFT metadata
             yield f"data: {json.dumps({'step': 3, 'status': 'Analyzing token transfers...', 'progress': 45})}\n\n"
-            await asyncio.sleep(0.1)
-
-            token_meta = []
-            nft_meta = []
 
             # Process token transfers from address history
-            if address_history.get("result") and isinstance(address_history["result"], list):
-                for tx in address_history["result"]:
-                    if isinstance(tx, dict) and tx.get("tokenTransfers"):
-                        for token in tx.get("tokenTransfers", []):
-                            mint = token.get("mint")
-                            if mint:
-                                try:
-                                    token_metadata = fetch_token_metadata(mint)
-                                    token_meta.append(token_metadata)
-
-                                    # Check if it's an NFT (decimals = 0)
-                                    if token_metadata and token_metadata.get("decimals") == 0:
-                                        nft_metadata = fetch_nft_metadata(mint)
-                                        if nft_metadata:
-                                            nft_meta.append(nft_metadata)
-                                except Exception as e:
-                                    print(f"Error fetching metadata for {mint}: {e}")
+            token_meta, holdings = await asyncio.to_thread(collect_metadata, history_txs)
+            nft_meta = holdings["assets"]
 
             yield f"data: {json.dumps({'step': 3, 'status': 'Token and NFT metadata collected', 'progress': 55, 'data': {'tokens_analyzed': len(token_meta), 'nfts_found': len(nft_meta)}})}\n\n"
 
             # Step 4: Get wallet risk score
             yield f"data: {json.dumps({'step': 4, 'status': 'Calculating wallet risk score...', 'progress': 65})}\n\n"
-            await asyncio.sleep(0.1)
 
-            try:
-                wallet_score = fetch_wallet_score(address)
-            except Exception as e:
-                print(f"Error fetching wallet score: {e}")
-                wallet_score = {"risk_score": 0, "error": str(e)}
+            score_result = await score_addresses(
+                [address], client=request.app.state.http_client,
+                deadline=min(SCORE_DEADLINE, deadline.remaining()),
+            )
+            wallet_score = score_result["scores"].get(address)
+            if wallet_score is None:
+                error = score_result["errors"].get(address) or "Blocksec score timed out"
+                print(f"Error fetching wallet score: {error}")
+                wallet_score = {"risk_score": 0, "error": error}
 
             yield f"data: {json.dumps({'step': 4, 'status': 'Wallet score calculated', 'progress': 75, 'data': {'wallet_score': wallet_score}})}\n\n"
 
             # Step 5: Gather additional data
             yield f"data: {json.dumps({'step': 5, 'status': 'Gathering additional data...', 'progress': 80})}\n\n"
-            await asyncio.sleep(0.1)
 
             # Get additional data
             tx_details = {}
             if signatures.get("result") and len(signatures["result"]) > 0:
                 try:
-                    tx_details = fetch_transaction(signatures["result"][0]["signature"])
+                    tx_details = await asyncio.to_thread(
+                        fetch_transaction, signatures["result"][0]["signature"],
+                        timeout=deadline.timeout(HELIUS_TIMEOUT),
+                    )
                 except Exception as e:
                     print(f"Error fetching transaction details: {e}")
 
             try:
-                balance_changes = fetch_balance_changes(address)
+                balance_changes = await asyncio.to_thread(
+                    fetch_balance_changes, address, timeout=deadline.timeout(HELIUS_TIMEOUT)
+                )
             except Exception as e:
                 print(f"Error fetching balance changes: {e}")
                 balance_changes = {}
 
+            address_info = {}
             try:
-                address_name = resolve_address_name(address)
+                address_info = (await deadline.run(
+                    asyncio.to_thread(resolve_accounts, [address], deadline=deadline)
+                )).get(address, {})
+            except DeadlineExceeded:
+                print(f"Address name lookup for {address} cut off at the request deadline")
             except Exception as e:
                 print(f"Error resolving address name: {e}")
-                address_name = "Unknown"
+            address_name = address_info.get("name", "Unknown")
 
             try:
-                webhook_events = fetch_webhook_events([address], limit=5)
+                webhook_events = await asyncio.to_thread(
+                    fetch_webhook_events, [address], limit=5, timeout=deadline.timeout(HELIUS_TIMEOUT)
+                )
             except Exception as e:
                 print(f"Error fetching webhook events: {e}")
                 webhook_events = {}
 
-            yield f"data: {json.dumps({'step': 5, 'status': 'Additional data gathered', 'progress': 85, 'data': {'address_name': 'Unknown', 'balance_changes_count': 1}})}\n\n"
+            yield f"data: {json.dumps({'step': 5, 'status': 'Additional data gathered', 'progress': 85, 'data': {'address_name': address_name, 'balance_changes_count': 1}})}\n\n"
 
             # Step 6: Aggregate context
             yield f"data: {json.dumps({'step': 6, 'status': 'Aggregating context for analysis...', 'progress': 90})}\n\n"
-            await asyncio.sleep(0.1)
 
             # Prepare transaction data
-            tx_list = []
-            if tx_details:
-                tx_list.append(tx_details)
-            if address_history.get("result") and isinstance(address_history["result"], list):
-                tx_list.extend(address_history["result"])
-
-            context = aggregate_context(
-                helius_txs=tx_list,
-                metasleuth_score=wallet_score,
-                target_address=address,
-                extra_notes="Real-time streaming analysis with Python backend",
-            )
+            tx_list = normalize_transactions([tx_details]) if tx_details else []
+            tx_list.extend(history_txs)
 
-            # Step 7: Run AI analysis
+            # Every counterparty against the local known-bad (IOC) index
+            counterparties = {a for tx in tx_list for a in tx.accounts}
+            counterparties.update(a for tx in tx_list for t in tx.transfers for a in (t.from_address, t.to_address))
+            try:
+                ioc_matches = await asyncio.to_thread(match_addresses, [address, *counterparties], address)
+            except (OSError, ValueError) as e:
+                # An unreadable index file degrades to "no matches"; a missing
+                # index already returns that without raising
+                print(f"Warning: IOC index unavailable, skipping IOC matching: {e}")
+                ioc_matches = {"target_address": address, "target": None, "hits": [], "risk_score": 0}
+            notes = "Real-time streaming analysis with Python backend"
+            if ioc_matches["target"] or ioc_matches["hits"]:
+                notes += f". Local IOC index matches: target={ioc_matches['target'] or 'not listed'}, counterparties={json.dumps(ioc_matches['hits'])}"
+
+            # Step 7: Run AI analysis (map-reduce over shards when the history is long)
             yield f"data: {json.dumps({'step': 7, 'status': 'Running AI analysis...', 'progress': 95})}\n\n"
-            await asyncio.sleep(0.1)
 
             # Run Mistral AI analysis
             try:
-                analysis_result = run_analysis(context)
+                analysis_result = await run_chunked_analysis(
+                    tx_list,
+                    metasleuth_score=wallet_score,
+                    target_address=address,
+                    extra_notes=notes,
+                    deadline=deadline,
+                )
             except Exception as e:
                 print(f"Error running AI analysis: {e}")
                 analysis_result = f"Error with AI analysis: {str(e)}"
 
-            # Parse result if it's a JSON string
-            parsed_result = analysis_result
-            if isinstance(analysis_result, str):
-                try:
-                    if analysis_result.strip().startswith("{") or "```json" in analysis_result:
-                        # Remove markdown formatting if present
-                        clean_result = analysis_result
-                        if "```json\n" in analysis_result:
-                            clean_result = analysis_result.split("```json\n")[1].split("\n```")[0]
-                        elif "```\n" in analysis_result:
-                            clean_result = analysis_result.split("```\n")[1].split("\n```")[0]
-                        
-                        parsed_result = json.loads(clean_result)
-                except (json.JSONDecodeError, IndexError) as e:
-                    print(f"Could not parse AI result as JSON: {e}")
-                    # Keep original result as string
+            # Parse result if it's a JSON string; keep the original string otherwise
+            parsed_result = parse_analysis_json(analysis_result)
+            if parsed_result is None:
+                print("Could not parse AI result as JSON")
+                parsed_result = analysis_result
+            merge_ioc_matches(parsed_result, ioc_matches)
+
+            # Helius responses served from the stale fallback rather than live
+            stale_sources = [
+                name for name, response in (
+                    ("address_history", history), ("signatures", signatures), ("transaction", tx_details),
+                    ("balance_changes", balance_changes), ("webhook_events", webhook_events),
+                ) if is_stale(response)
+            ]
 
             # Final result
             final_data = {
@@ -213,8 +255,10 @@ async def analyze_wallet_stream(address: str):
                 "detailed_data": {
                     "wallet_info": {
                         "address": address,
-                        "address_name": "Unknown",
+                        "address_name": address_name,
+                        "account_type": address_info.get("account_type"),
                         "risk_score": wallet_score,
+                        "ioc_matches": ioc_matches,
                     },
                     "transaction_summary": {
                         "total_transactions": transaction_count,
@@ -226,9 +270,13 @@ async def analyze_wallet_stream(address: str):
                         "token_metadata": token_meta[:5] if token_meta else [],
                         "nfts_found": len(nft_meta),
                         "nft_metadata": nft_meta[:3] if nft_meta else [],
+                        "token_accounts_found": len(holdings["token_accounts"]),
+                        "holdings_complete": holdings["complete"],
                     },
                     "webhook_events": webhook_events,
                 },
+                "stale": bool(stale_sources),
+                "stale_sources": stale_sources,
             }
 
             yield f"data: {json.dumps(final_data, ensure_ascii=False)}\n\n"
@@ -242,9 +290,12 @@ async def analyze_wallet_stream(address: str):
                 "error": str(e)
             }
             yield f"data: {json.dumps(error_data)}\n\n"
+        finally:
+            cancelled.set()
 
+    timeout_frame = f"data: {json.dumps({'step': -1, 'status': 'Analysis failed: deadline exceeded', 'progress': 0, 'error': 'deadline exceeded'})}\n\n"
     return StreamingResponse(
-        generate_analysis(),
+        stream_until_disconnected(request, generate_analysis(), deadline, timeout_frame),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache",
@@ -255,7 +306,7 @@ async def analyze_wallet_stream(address: str):
     )
 
 # Chat endpoint
-@app.post("/chat")
+@router.post("/chat")
 async def chat_analysis(message: ChatMessage):
     """Handle chat-based wallet analysis requests"""
     try:
@@ -283,7 +334,7 @@ async def chat_analysis(message: ChatMessage):
         raise HTTPException(status_code=500, detail=f"Chat analysis failed: {str(e)}")
 
 # Root endpoint
-@app.get("/")
+@router.get("/")
 async def root():
     return {
         "message": "SentrySol Backend API is running",
@@ -295,6 +346,35 @@ async def root():
         }
     }
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open shared HTTP clients on startup and close them on shutdown"""
+    app.state.http_client = httpx.AsyncClient(timeout=REQUEST_TIMEOUT)
+    try:
+        yield
+    finally:
+        await app.state.http_client.aclose()
+
+
+def create_app() -> FastAPI:
+    app = FastAPI(title="SentrySol Backend API", version="1.0.0", lifespan=lifespan)
+
+    # Configure CORS
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+    app.include_router(router)
+    return app
+
+
+app = create_app()
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000, reload=True)
+    # With WEB_CONCURRENCY > 1 set SENTRYSOL_CACHE_BACKEND=disk so workers share caches
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    uvicorn.run("server:app", host="0.0.0.0", port=8000, workers=workers, reload=workers == 1)